@@ -0,0 +1,371 @@
+# === benchmark.py - Reproducible performance benchmarks ===
+
+# Runs offline against synthetic data and prints one JSON document (or
+# writes it with --json) so runs can be compared over time:
+#
+#   python benchmark.py                                  # every suite, default sizes
+#   python benchmark.py --suite crypto --sizes 1K,1M,1G,4G --tmp /big/disk
+#   python benchmark.py --suite listing,search --vault-sizes 1000,200000
+#   python benchmark.py --json before.json
+#
+# Suites:
+#   crypto   encrypt_file / decrypt_file throughput and peak RSS per file size.
+#            Every measurement runs in a fresh child process so the RSS peak
+#            belongs to that operation alone.
+#   listing  view_files (index read + records + background search index + table fill)
+#            and every sort order, against synthetic vaults of N files.
+#   search   Per-keystroke latency while a query is typed, with the search index
+#            built ("keystroke") and while it is still building ("keystroke_indexing").
+#   auth     register_user / validate_user operations per second on a
+#            throwaway users.db.
+#   startup  Time for a fresh interpreter to import login_window (everything
+#            needed before the login form is drawn) and dashboard, plus a
+#            cold build of the icon atlas.
+# listing and search drive the real VirtualTable on a withdrawn Tk root; when
+# no display is available a stand-in table with the same set_items() call is
+# used instead and "tk": false is recorded.
+
+import argparse  # Command-line options
+import contextlib  # Keeps db.py's diagnostics off stdout
+import json  # Machine-readable results
+import os  # Temp files and sizes
+import platform  # Machine description in the results
+import random  # Synthetic names (fixed seed, so runs are comparable)
+import sqlite3  # Bulk-loads synthetic vault indexes
+import statistics  # Medians
+import subprocess  # Child processes for the crypto suite
+import sys  # Interpreter path and stderr
+import tempfile  # Scratch folders
+import time  # Timers
+
+try:
+    import resource  # Peak RSS (not available on Windows)
+except ImportError:
+    resource = None
+
+SEED = 1234
+SIZE_UNITS = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+DEFAULT_SIZES = "1K,1M,64M"
+DEFAULT_VAULT_SIZES = "1000,10000,50000"
+DEFAULT_AUTH_USERS = 8
+SEARCH_QUERY = "report_2023"  # Typed one character at a time
+WRITE_BLOCK = 1024 * 1024
+
+NAME_WORDS = ["report", "invoice", "photo", "backup", "notes", "scan", "budget", "draft", "video", "song"]
+NAME_TYPES = ["pdf", "docx", "jpg", "png", "txt", "mp4", "mp3", "xlsx", "zip"]
+
+
+def parse_size(text):
+    # "64M" -> 67108864
+    text = text.strip().upper()
+    if text[-1] in SIZE_UNITS:
+        return int(float(text[:-1]) * SIZE_UNITS[text[-1]])
+    return int(text)
+
+
+def timed(fn, repeat=1):
+    # Runs fn() `repeat` times; returns (best seconds, median seconds, last result)
+    times, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return min(times), statistics.median(times), result
+
+
+def peak_rss():
+    # Peak resident set size of this process in bytes (None where unsupported)
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024  # Linux reports KiB
+
+
+def log(message):
+    print(message, file=sys.stderr)
+
+
+# ================= Crypto =================
+def write_sample(path, size, kind):
+    # Writes `size` bytes of random (incompressible) or text-like data
+    rng = random.Random(SEED)
+    line = b"2023-01-01 12:00:00 INFO request handled in 12 ms user=alice path=/api/items\n"
+    with open(path, "wb") as f:
+        left = size
+        while left:
+            n = min(left, WRITE_BLOCK)
+            if kind == "text":
+                block = (line * (n // len(line) + 1))[:n]
+            else:
+                block = rng.randbytes(n)
+            f.write(block)
+            left -= n
+
+
+def crypto_child(op, src, dst, workers):
+    # Runs in a child process: one encrypt or decrypt, reports time and RSS
+    from crypto_util import encrypt_file, decrypt_file
+    baseline = peak_rss()
+    fn = encrypt_file if op == "encrypt" else decrypt_file
+    start = time.perf_counter()
+    fn(src, dst, workers=workers)
+    elapsed = time.perf_counter() - start
+    print(json.dumps({"seconds": elapsed, "peak_rss": peak_rss(), "baseline_rss": baseline}))
+
+
+def run_child(op, src, dst, workers):
+    out = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", op, src, dst, str(workers)],
+                         check=True, capture_output=True, text=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def bench_crypto(args, scratch):
+    results = []
+    for size_text in args.sizes.split(","):
+        size = parse_size(size_text)
+        src = os.path.join(scratch, f"plain_{size}")
+        enc, dec = src + ".enc", src + ".dec"
+        write_sample(src, size, args.data)
+        for op, a, b in (("encrypt", src, enc), ("decrypt", enc, dec)):
+            runs = [run_child(op, a, b, args.workers) for _ in range(args.repeat)]
+            best = min(runs, key=lambda r: r["seconds"])
+            result = {"suite": "crypto", "case": op, "size": size, "data": args.data, "workers": args.workers,
+                      "seconds": best["seconds"], "mb_per_s": size / best["seconds"] / 1e6 if best["seconds"] else None,
+                      "peak_rss": max(r["peak_rss"] or 0 for r in runs) or None,
+                      "baseline_rss": best["baseline_rss"], "stored_size": os.path.getsize(enc)}
+            log(f"crypto {op:8} {size_text:>6}: {result['mb_per_s'] or 0:8.1f} MB/s, "
+                f"peak RSS {(result['peak_rss'] or 0) / 1e6:.0f} MB")
+            results.append(result)
+        for path in (src, enc, dec):
+            os.remove(path)
+    return results
+
+
+# ================= Listing And Search =================
+class FakeTable:
+    # Stand-in for VirtualTable when there is no display
+    def __init__(self):
+        self.items = []
+
+    def set_items(self, items):
+        self.items = items
+
+
+def make_table():
+    # A VirtualTable on a withdrawn root, or FakeTable when Tk can't start
+    try:
+        import tkinter as tk
+        from virtual_table import VirtualTable
+        root = tk.Tk()
+        root.withdraw()
+    except Exception:
+        return None, FakeTable()
+    table = VirtualTable(root, ("Type", "Modified", "Size"), lambda name: (name, ("", "", ""), None))
+    table.pack()
+    return root, table
+
+
+def synthetic_vault(folder, count):
+    # Fills a vault index with `count` synthetic rows (no files on disk)
+    from file_index import FileIndex, INDEX_NAME
+    FileIndex(folder).close()  # Creates the schema
+    rng = random.Random(SEED)
+    rows = []
+    for i in range(count):
+        original = f"{rng.choice(NAME_WORDS)}_{rng.randint(2015, 2024)}_{i}.{rng.choice(NAME_TYPES)}"
+        name = original + ".enc"
+        size = rng.randint(1_000, 500_000_000)
+        rows.append((name, original, size, size + 40, 1.6e9 + rng.random() * 1e8, "enc", None))
+    with sqlite3.connect(os.path.join(folder, INDEX_NAME)) as conn:
+        conn.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+
+def bench_listing(args, scratch, suites):
+    from file_index import FileIndex
+    from file_records import RecordStore, SORT_CRITERIA
+    from search_index import SearchIndex
+    root, table = make_table()
+    results = []
+    try:
+        for count in (int(n) for n in args.vault_sizes.split(",")):
+            folder = os.path.join(scratch, f"vault_{count}")
+            os.makedirs(folder)
+            synthetic_vault(folder, count)
+            index = FileIndex(folder)
+            store, search_index = RecordStore(), SearchIndex()
+            common = {"files": count, "tk": root is not None}
+
+            def view_files():
+                # Same steps as dashboard.view_files()
+                store.load(index.entries())
+                search_index.rebuild(((name, name) for name in store.records), background=True)
+                store.order("name")
+                table.set_items(store.arrange("name"))
+
+            if "listing" in suites:
+                best, median, _ = timed(view_files, args.repeat)
+                search_index.wait()  # Sorting is timed without the index build running alongside
+                results.append({"suite": "listing", "case": "view_files", **common,
+                                "best_ms": best * 1000, "median_ms": median * 1000})
+                log(f"listing view_files {count:>7} files: {median * 1000:8.1f} ms")
+                entries = index.entries()
+                worst = 0.0
+                for label, (column, descending) in SORT_CRITERIA.items():
+                    store.load(entries)  # First sort after a reload builds the column order
+                    cold, _, _ = timed(lambda: table.set_items(store.arrange(column, descending)))
+                    warm, _, _ = timed(lambda: table.set_items(store.arrange(column, descending)), args.repeat)
+                    results.append({"suite": "listing", "case": "sort_files", "criteria": label, **common,
+                                    "cold_ms": cold * 1000, "warm_ms": warm * 1000})
+                    worst = max(worst, cold)
+                log(f"listing sort_files {count:>7} files: worst cold {worst * 1000:8.1f} ms")
+            else:
+                view_files()
+                search_index.wait()
+
+            def type_query(latencies):
+                # Same steps as dashboard.apply_search() for each prefix of the query
+                for i in range(1, len(SEARCH_QUERY) + 1):
+                    start = time.perf_counter()
+                    with search_index.foreground():
+                        matches = search_index.search(SEARCH_QUERY[:i])
+                        table.set_items(store.arrange("name", False, matches))
+                    latencies.append(time.perf_counter() - start)
+
+            if "search" in suites:
+                for case in ("keystroke", "keystroke_indexing"):
+                    latencies = []
+                    for _ in range(args.repeat):
+                        # Fresh narrowing state; "keystroke_indexing" types while the postings are built
+                        search_index.rebuild(((name, name) for name in store.records),
+                                             background=case == "keystroke_indexing")
+                        type_query(latencies)
+                        search_index.wait()
+                    results.append({"suite": "search", "case": case, "query": SEARCH_QUERY, **common,
+                                    "median_ms": statistics.median(latencies) * 1000,
+                                    "max_ms": max(latencies) * 1000})
+                    log(f"search {case:<18} {count:>7} files: median {statistics.median(latencies) * 1000:.2f} ms, "
+                        f"max {max(latencies) * 1000:.2f} ms")
+            index.close()
+    finally:
+        if root is not None:
+            root.destroy()
+    return results
+
+
+# ================= Auth =================
+def bench_auth(args, scratch):
+    import db
+    db.DB_PATH = os.path.join(scratch, "users.db")  # Never touch the real users.db
+    with contextlib.redirect_stdout(sys.stderr):
+        db.init_db()
+    start = time.perf_counter()
+    params = db.kdf_params()  # First call calibrates scrypt for this machine
+    calibration = time.perf_counter() - start
+
+    users = [(f"bench_user_{i}", f"password-{i}") for i in range(args.auth_users)]
+    reg, _, _ = timed(lambda: [db.register_user(u, p) for u, p in users])
+    val, _, _ = timed(lambda: [db.validate_user(u, p) for u, p in users], args.repeat)
+    bad, _, _ = timed(lambda: [db.validate_user(u, "wrong") for u, _ in users])
+    bulk_users = [(f"bulk_user_{i}", f"password-{i}") for i in range(args.auth_users)]
+    bulk, _, _ = timed(lambda: db.register_users(bulk_users))
+    db.close_all()
+
+    n = len(users)
+    kdf_info = {k: params[k] for k in ("n", "r", "p")}
+    results = [
+        {"suite": "auth", "case": "register_user", "users": n, "ops_per_s": n / reg, **kdf_info,
+         "calibration_s": calibration},
+        {"suite": "auth", "case": "register_users_bulk", "users": n, "ops_per_s": n / bulk, **kdf_info},
+        {"suite": "auth", "case": "validate_user", "users": n, "ops_per_s": n / val, **kdf_info},
+        {"suite": "auth", "case": "validate_user_wrong_password", "users": n, "ops_per_s": n / bad, **kdf_info},
+    ]
+    for r in results:
+        log(f"auth {r['case']:30}: {r['ops_per_s']:8.1f} ops/s")
+    return results
+
+
+# ================= Startup =================
+STARTUP_MODULES = ("login_window", "dashboard")
+
+
+def bench_startup(args, scratch):
+    here = os.path.dirname(os.path.abspath(__file__))
+    results = []
+    for module in STARTUP_MODULES:
+        runs = []
+        for _ in range(max(args.repeat, 3)):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, "-c", f"import {module}"], cwd=here, check=True)
+            runs.append(time.perf_counter() - start)
+        results.append({"suite": "startup", "case": f"import_{module}", "best_s": min(runs),
+                        "median_s": statistics.median(runs)})
+        log(f"startup import {module:20}: {min(runs) * 1000:8.1f} ms")
+
+    import icon_atlas
+    path = os.path.join(scratch, "icons.png")
+    best, median, _ = timed(lambda: icon_atlas.build_atlas(path), args.repeat)
+    results.append({"suite": "startup", "case": "build_icon_atlas", "best_s": best, "median_s": median,
+                    "icons": len(icon_atlas.ICON_FILES)})
+    log(f"startup {'build_icon_atlas':27}: {best * 1000:8.1f} ms")
+    return results
+
+
+# ================= Runner =================
+def machine_info():
+    info = {"python": platform.python_version(), "platform": platform.platform(),
+            "machine": platform.machine(), "cpu_count": os.cpu_count(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z")}
+    try:
+        info["commit"] = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                        cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        info["commit"] = None
+    return info
+
+
+def main(argv=None):
+    from crypto_util import DEFAULT_WORKERS
+    parser = argparse.ArgumentParser(description="Secure Desktop Vault benchmarks")
+    parser.add_argument("--suite", default="crypto,listing,search,auth,startup",
+                        help="comma-separated suites: crypto, listing, search, auth, startup")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="crypto file sizes, e.g. 1K,1M,1G")
+    parser.add_argument("--data", choices=("random", "text"), default="random", help="crypto sample content")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="crypto chunk workers")
+    parser.add_argument("--vault-sizes", default=DEFAULT_VAULT_SIZES, help="files per synthetic vault")
+    parser.add_argument("--auth-users", type=int, default=DEFAULT_AUTH_USERS, help="accounts per auth case")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per measurement (best/median kept)")
+    parser.add_argument("--tmp", help="scratch folder (needs room for the largest size twice)")
+    parser.add_argument("--json", metavar="FILE", help="write results here instead of stdout")
+    args = parser.parse_args(argv)
+
+    suites = {s.strip() for s in args.suite.split(",") if s.strip()}
+    unknown = suites - {"crypto", "listing", "search", "auth", "startup"}
+    if unknown:
+        parser.error(f"unknown suite(s): {', '.join(sorted(unknown))}")
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="vault-bench-", dir=args.tmp) as scratch:
+        if "crypto" in suites:
+            results += bench_crypto(args, scratch)
+        if suites & {"listing", "search"}:
+            results += bench_listing(args, scratch, suites)
+        if "auth" in suites:
+            results += bench_auth(args, scratch)
+        if "startup" in suites:
+            results += bench_startup(args, scratch)
+
+    report = {"machine": machine_info(), "settings": vars(args), "results": results}
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    return 0
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 6 and sys.argv[1] == "--child":
+        crypto_child(sys.argv[2], sys.argv[3], sys.argv[4], int(sys.argv[5]))
+    else:
+        sys.exit(main())
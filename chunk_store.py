@@ -0,0 +1,530 @@
+# === chunk_store.py - Deduplicating, content-addressed chunk storage ===
+#
+# Optional storage mode for a vault folder. Plaintext is cut into
+# content-defined chunks; each unique chunk is encrypted once into
+# <vault>/.chunks/<id[:2]>/<id>, where the id is a keyed hash (HMAC-SHA256)
+# of the chunk. The vault file itself (still named *.enc) becomes a small
+# encrypted manifest listing its chunk ids. Re-uploading the same or mostly
+# unchanged data only encrypts and writes the chunks that are new.
+#
+# A reference count per chunk (one per occurrence in a manifest) lives in
+# .chunks/refs.db. Chunks are deleted when their count drops to zero, and
+# collect_garbage() rebuilds the counts from the manifests after a crash;
+# it leaves alone chunks written or reused within GC_GRACE_S, since they may
+# belong to an upload still running in another process (the dashboard while
+# `python -m vault gc` runs, say). Temp files of crashed uploads are removed
+# once they are that old too.
+#
+# Chunk ids and blobs are keyed with the key ring's key that was current when
+# the file was stored, and the manifest records which one. Ids keyed with the
+# built-in key 0 can be computed by anyone with the source, so a key rotation
+# re-stores every deduplicated file (rekey_manifest) under the new key and
+# its old chunks are released. Deduplication therefore restarts after a
+# rotation: new uploads only share chunks stored under the same key.
+
+import hashlib  # Whole-file checksum
+import hmac  # Keyed chunk ids
+import io  # In-memory manifest body
+import json  # Manifest body format
+import os  # Paths and atomic renames
+import sqlite3  # Reference counts
+import struct  # Chunk blob header
+import tempfile  # Temp files for atomic chunk writes
+import threading  # Guards reference counts and chunk deletion
+import time  # Garbage collection grace period
+import zlib  # crc32 for content-defined cut points
+from bisect import bisect_right  # Chunk lookup by plaintext offset
+from collections import deque  # Bounded queue of in-flight chunk writes
+from contextlib import contextmanager  # One store at a time per manifest
+
+from cryptography.exceptions import InvalidTag  # Raised when a chunk fails authentication
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM  # Chunk encryption
+
+import metrics  # Optional timing of store/restore calls
+
+from crypto_util import (FILE_HEADER, MANIFEST_VERSION, CODEC_ZLIB, DEFAULT_CACHE_CHUNKS,
+                         ChunkReader, StreamStats,
+                         atomic_output, choose_codec, current_key_id, decrypt_stream, derive_key,
+                         encrypt_stream, pack_chunk, unpack_chunk)
+
+CHUNK_DIR = ".chunks"  # Hidden, so the file index never lists it
+REFS_DB = "refs.db"
+
+# Content-defined chunking: a cut is allowed after any ANCHOR byte whose
+# preceding WINDOW bytes hash (crc32) to 0 under ANCHOR_MASK. Cut points depend
+# only on nearby content, so inserting data early in a file only changes the
+# chunks around the edit. bytes.find() locates anchors at C speed, keeping the
+# Python loop to roughly one iteration per anchor byte.
+MIN_CHUNK = 256 * 1024
+MAX_CHUNK = 4 * 1024 * 1024
+ANCHOR = b"\n"
+WINDOW = 32
+ANCHOR_MASK = 0xFFF  # About one in 4096 anchors becomes a cut point
+
+_BLOB_HEADER = struct.Struct(">8sB")  # magic, codec (older blobs, always key 0)
+_BLOB_MAGIC = b"SVCHUNK1"
+_KEYED_BLOB_HEADER = struct.Struct(">8sBB")  # magic, codec, key id (older blobs)
+_KEYED_BLOB_MAGIC = b"SVCHUNK2"
+_NONCE_BLOB_HEADER = struct.Struct(">8sBB12s")  # magic, codec, key id, random nonce
+_NONCE_BLOB_MAGIC = b"SVCHUNK3"
+_MANIFEST_PREFIX = FILE_HEADER + bytes([MANIFEST_VERSION])
+DEFAULT_DEPTH = 8  # New chunks being encrypted at once
+GC_GRACE_S = 24 * 3600  # Unreferenced chunks younger than this survive garbage collection
+
+
+# ================= Chunking =================
+def _find_cut(buf, start, limit):
+    # First content-defined cut point for a chunk starting at buf[start],
+    # searching up to `limit`; `limit` if there is none
+    with memoryview(buf) as view:  # Released before the caller resizes `buf`
+        pos = buf.find(ANCHOR, start + MIN_CHUNK, limit)
+        while pos >= 0:
+            if not zlib.crc32(view[pos - WINDOW:pos]) & ANCHOR_MASK:
+                return pos + 1
+            pos = buf.find(ANCHOR, pos + 1, limit)
+    return limit
+
+
+def _copy(buf, start, end):
+    with memoryview(buf) as view:
+        return bytes(view[start:end])
+
+
+def iter_cdc_chunks(src):
+    # Yields content-defined chunks (MIN_CHUNK..MAX_CHUNK bytes) read from `src`.
+    # Chunks are cut from `buf` by moving `start`; the consumed front is only
+    # dropped once per read, so small chunks don't re-copy the buffer each time.
+    buf = bytearray()
+    start = 0
+    eof = False
+    while True:
+        while not eof and len(buf) - start < MAX_CHUNK:
+            data = src.read(MAX_CHUNK)
+            if not data:
+                eof = True
+                break
+            del buf[:start]
+            start = 0
+            buf += data
+        if start == len(buf):
+            return
+        if eof and len(buf) - start <= MIN_CHUNK:
+            yield _copy(buf, start, len(buf))
+            return
+        cut = _find_cut(buf, start, min(len(buf), start + MAX_CHUNK))
+        yield _copy(buf, start, cut)
+        start = cut
+
+
+# ================= Chunk Blobs =================
+def chunk_id(chunk, key_id):
+    # Keyed hash of a plaintext chunk; equal chunks under one key get the same id
+    return hmac.new(derive_key(b"securevault dedup ids", key_id), chunk, hashlib.sha256).hexdigest()
+
+
+def _seal_payload(cid, payload, codec, key_id):
+    # Every blob gets a random nonce. The older id-derived nonce repeated
+    # whenever a chunk was sealed again (a concurrent upload, a re-upload after
+    # GC), and what is sealed depends on the file's codec and the compressor,
+    # so the same key and nonce could cover different bytes. The header is
+    # bound in as associated data.
+    nonce = os.urandom(12)
+    header = _NONCE_BLOB_HEADER.pack(_NONCE_BLOB_MAGIC, codec, key_id, nonce)
+    sealed = AESGCM(derive_key(b"securevault dedup chunks", key_id)).encrypt(nonce, payload, header + cid.encode())
+    return header + sealed
+
+
+def _seal_blob(cid, chunk, codec, key_id):
+    return _seal_payload(cid, pack_chunk(codec, chunk), codec, key_id)
+
+
+def _blob_header(cid, blob):
+    # (header size, codec, key id, nonce, associated data) of a chunk blob,
+    # or None if the header is damaged
+    if blob.startswith(_NONCE_BLOB_MAGIC) and len(blob) >= _NONCE_BLOB_HEADER.size:
+        _magic, codec, key_id, nonce = _NONCE_BLOB_HEADER.unpack_from(blob)
+        return _NONCE_BLOB_HEADER.size, codec, key_id, nonce, blob[:_NONCE_BLOB_HEADER.size] + cid.encode()
+    if blob.startswith(_KEYED_BLOB_MAGIC) and len(blob) >= _KEYED_BLOB_HEADER.size:
+        _magic, codec, key_id = _KEYED_BLOB_HEADER.unpack_from(blob)
+        return _KEYED_BLOB_HEADER.size, codec, key_id, bytes.fromhex(cid)[:12], cid.encode()
+    if blob.startswith(_BLOB_MAGIC) and len(blob) >= _BLOB_HEADER.size:
+        return _BLOB_HEADER.size, blob[len(_BLOB_MAGIC)], 0, bytes.fromhex(cid)[:12], cid.encode()
+    return None
+
+
+def _open_payload(cid, blob):
+    # Authenticates a chunk blob; returns (codec, still compressed payload)
+    header = _blob_header(cid, blob)
+    if header is None:
+        raise ValueError(f"Chunk {cid[:12]} is corrupted")
+    size, codec, key_id, nonce, aad = header
+    try:
+        payload = AESGCM(derive_key(b"securevault dedup chunks", key_id)).decrypt(nonce, blob[size:], aad)
+    except InvalidTag:
+        raise ValueError(f"Chunk {cid[:12]} is corrupted or has been tampered with") from None
+    return codec, payload
+
+
+def _open_blob(cid, blob, size, key_id):
+    # Decrypts a chunk blob and checks it is the chunk the manifest expects
+    # (`key_id` is the manifest's id key)
+    codec, payload = _open_payload(cid, blob)
+    chunk = unpack_chunk(codec, payload, size)
+    if len(chunk) != size or not hmac.compare_digest(chunk_id(chunk, key_id), cid):
+        raise ValueError(f"Chunk {cid[:12]} does not match its id")
+    return chunk
+
+
+def chunk_path(root, cid):
+    return os.path.join(root, cid[:2], cid)
+
+
+# ================= Manifests =================
+def is_manifest(path):
+    # True if `path` is a deduplicated file's manifest
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(_MANIFEST_PREFIX)) == _MANIFEST_PREFIX
+    except OSError:
+        return False
+
+
+def read_manifest(path):
+    # Decrypts a manifest: {"name", "size", "sha256", "key_id", "chunks": [[id, size], ...]}.
+    # Manifests from before key rotation have no "key_id"; their ids use key 0.
+    with open(path, "rb") as f:
+        if f.read(len(_MANIFEST_PREFIX)) != _MANIFEST_PREFIX:
+            raise ValueError("Not a deduplicated vault file")
+        body = io.BytesIO()
+        decrypt_stream(f, body)
+    manifest = json.loads(body.getvalue())
+    manifest.setdefault("key_id", 0)
+    return manifest
+
+
+def _write_manifest(path, manifest):
+    # Manifests are an ordinary encrypted stream behind the manifest marker,
+    # under the same key as their chunks
+    with atomic_output(path) as out:
+        out.write(_MANIFEST_PREFIX)
+        encrypt_stream(io.BytesIO(json.dumps(manifest).encode()), out, codec=CODEC_ZLIB,
+                       key_id=manifest["key_id"])
+
+
+@metrics.timed("dedup.restore", size=lambda stats: stats.plain_size)
+def restore_stream(manifest_path, dst, progress=None):
+    # Writes a deduplicated file's plaintext to `dst`; returns StreamStats
+    manifest = read_manifest(manifest_path)
+    root = os.path.join(os.path.dirname(os.path.abspath(manifest_path)), CHUNK_DIR)
+    hasher = hashlib.sha256()
+    stored = os.path.getsize(manifest_path)
+    for cid, size in manifest["chunks"]:
+        with open(chunk_path(root, cid), "rb") as f:
+            blob = f.read()
+        chunk = _open_blob(cid, blob, size, manifest["key_id"])
+        dst.write(chunk)
+        hasher.update(chunk)
+        stored += len(blob)
+        if progress:
+            progress(len(chunk))
+    if hasher.hexdigest() != manifest["sha256"]:
+        raise ValueError("Restored file does not match its checksum")
+    return StreamStats(manifest["size"], stored, manifest["sha256"])
+
+
+class ManifestReader(ChunkReader):
+    # Random access into a deduplicated file (see crypto_util.open_encrypted)
+
+    def __init__(self, manifest_path, cache_chunks=DEFAULT_CACHE_CHUNKS):
+        super().__init__(cache_chunks)
+        manifest = read_manifest(manifest_path)
+        self.size = manifest["size"]
+        self._root = os.path.join(os.path.dirname(os.path.abspath(manifest_path)), CHUNK_DIR)
+        self._chunks = manifest["chunks"]
+        self._key_id = manifest["key_id"]
+        self._starts = []  # Plaintext offset where each chunk begins
+        offset = 0
+        for _cid, size in self._chunks:
+            self._starts.append(offset)
+            offset += size
+
+    def _locate(self, pos):
+        if pos >= self.size:
+            return None
+        index = bisect_right(self._starts, pos) - 1
+        return index, self._starts[index]
+
+    @metrics.timed("dedup.read_chunk", size=len)
+    def _decrypt(self, index):
+        cid, size = self._chunks[index]
+        with open(chunk_path(self._root, cid), "rb") as f:
+            return _open_blob(cid, f.read(), size, self._key_id)
+
+
+# ================= The Store =================
+class ChunkStore:
+    # Chunk storage and reference counts for one vault folder
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.root = os.path.join(folder, CHUNK_DIR)
+        os.makedirs(self.root, exist_ok=True)
+        self._lock = threading.Lock()  # Held whenever a count changes or a chunk is deleted
+        self._active = 0  # Uploads in progress (their chunks have no manifest yet)
+        self._writing = set()  # Manifests being written; one store at a time per file
+        self._written = threading.Condition(self._lock)  # Signalled when one of them is done
+        self._conn = sqlite3.connect(os.path.join(self.root, REFS_DB), check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS chunks (id TEXT PRIMARY KEY, refs INTEGER NOT NULL)")
+        self._conn.commit()
+
+    # ===== Reference Counting =====
+    # Every change to a count, and the blob change that goes with it, happens
+    # inside one BEGIN IMMEDIATE transaction on refs.db. That write lock is
+    # shared with other processes using the vault, so collect_garbage() in
+    # one of them can't delete a chunk between its check and our use of it.
+    def _pin(self, cid):
+        # Adds a reference if the chunk is already stored; False means it must be written.
+        # The blob's mtime is refreshed so collect_garbage() in another process spares it.
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            if self._conn.execute("UPDATE chunks SET refs = refs + 1 WHERE id=? AND refs > 0",
+                                  (cid,)).rowcount != 1:
+                return False
+            try:
+                os.utime(chunk_path(self.root, cid))
+            except FileNotFoundError:
+                self._conn.execute("UPDATE chunks SET refs = refs - 1 WHERE id=?", (cid,))
+                return False
+            return True
+
+    def _commit_chunk(self, cid, tmp_path):
+        # Moves a freshly written chunk into place and counts the reference.
+        # Both happen under the lock so a concurrent release can't delete it in between.
+        path = chunk_path(self.root, cid)
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+            self._conn.execute("INSERT INTO chunks (id, refs) VALUES (?, 1) "
+                               "ON CONFLICT(id) DO UPDATE SET refs = refs + 1", (cid,))
+
+    def _release_ids(self, ids):
+        # Drops one reference per id and deletes chunks nobody references any more
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.executemany("UPDATE chunks SET refs = refs - 1 WHERE id=?", [(c,) for c in ids])
+            dead = [cid for cid in set(ids)  # Only these can have dropped to zero
+                    if self._conn.execute("SELECT 1 FROM chunks WHERE id=? AND refs <= 0", (cid,)).fetchone()]
+            self._conn.executemany("DELETE FROM chunks WHERE id=?", [(c,) for c in dead])
+            for cid in dead:
+                try:
+                    os.remove(chunk_path(self.root, cid))
+                except FileNotFoundError:
+                    pass
+
+    # ===== Storing =====
+    @contextmanager
+    def _claim(self, dest):
+        # Only one store at a time per manifest: two would both release its old chunks
+        target = os.path.abspath(dest)
+        with self._lock:
+            while target in self._writing:
+                self._written.wait()
+            self._writing.add(target)
+            self._active += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._active -= 1
+                self._writing.discard(target)
+                self._written.notify_all()
+
+    def _write_temp(self, cid, chunk, codec, key_id):
+        # Worker: encrypt one new chunk into a temp file in the store
+        fd, tmp_path = tempfile.mkstemp(prefix=".chunk.", suffix=".tmp", dir=self.root)
+        with os.fdopen(fd, "wb") as f:
+            f.write(_seal_blob(cid, chunk, codec, key_id))
+        return tmp_path
+
+    @metrics.timed("dedup.store", size=lambda stats: stats.plain_size)
+    def store_stream(self, src, dest, name=None, progress=None, pool=None, depth=DEFAULT_DEPTH):
+        # Stores everything from `src` and writes the manifest to `dest`.
+        # Returns StreamStats; cipher_size counts only the bytes newly written.
+        with self._claim(dest):
+            return self._store(src, dest, name, progress, pool, depth, current_key_id())
+
+    def _store(self, src, dest, name, progress, pool, depth, key_id):
+        # store_stream() for a claimed `dest`, with ids and blobs under `key_id`
+        hasher = hashlib.sha256()
+        chunks, acquired = [], []  # Manifest entries; ids we hold a reference for
+        pending = deque()  # (id, future or tmp path) of chunks being written
+        codec = None
+        size = written = 0
+
+        def finish_oldest():
+            nonlocal written
+            cid, job = pending.popleft()
+            tmp_path = job.result() if pool else job
+            written += os.path.getsize(tmp_path)
+            self._commit_chunk(cid, tmp_path)
+            acquired.append(cid)
+
+        try:
+            old_ids = [c for c, _ in read_manifest(dest)["chunks"]] if is_manifest(dest) else []
+            for chunk in iter_cdc_chunks(src):
+                if codec is None:
+                    codec = choose_codec(name, chunk)
+                cid = chunk_id(chunk, key_id)
+                hasher.update(chunk)
+                chunks.append([cid, len(chunk)])
+                size += len(chunk)
+                if self._pin(cid):
+                    acquired.append(cid)  # Already stored: nothing to encrypt or write
+                else:
+                    job = pool.submit(self._write_temp, cid, chunk, codec, key_id) if pool else \
+                        self._write_temp(cid, chunk, codec, key_id)
+                    pending.append((cid, job))
+                    if len(pending) >= depth:
+                        finish_oldest()
+                if progress:
+                    progress(len(chunk))
+            while pending:
+                finish_oldest()
+            manifest = {"name": name, "size": size, "sha256": hasher.hexdigest(), "key_id": key_id, "chunks": chunks}
+            _write_manifest(dest, manifest)
+        except BaseException:
+            for cid, job in pending:  # Throw away chunks that were never committed
+                try:
+                    os.remove(job.result() if pool else job)
+                except Exception:
+                    pass
+            self._release_ids(acquired)
+            raise
+        self._release_ids(old_ids)  # The manifest we replaced no longer holds its chunks
+        return StreamStats(size, written + os.path.getsize(dest), manifest["sha256"])
+
+    def store_file(self, path, dest, progress=None, pool=None):
+        with open(path, "rb") as src:
+            return self.store_stream(src, dest, os.path.basename(path), progress, pool)
+
+    @contextmanager
+    def replacing(self, dest):
+        # Wraps writing an ordinary (not deduplicated) file to `dest`: if that
+        # replaces a manifest, its chunks are released once the block succeeds
+        with self._claim(dest):
+            old_ids = [cid for cid, _ in read_manifest(dest)["chunks"]] if is_manifest(dest) else []
+            yield
+            self._release_ids(old_ids)  # After the new file is in: a crash only leaks counts
+
+    # ===== Deleting =====
+    def delete(self, path):
+        # Deletes a vault file; for manifests, their chunks are released too
+        if not is_manifest(path):
+            os.remove(path)
+            return
+        ids = [cid for cid, _ in read_manifest(path)["chunks"]]
+        os.remove(path)  # Manifest first: a crash now only leaks counts, never data
+        self._release_ids(ids)
+
+    # ===== Key Rotation =====
+    @metrics.timed("dedup.rekey")
+    def rekey_manifest(self, path, key_id=None, pool=None, progress=None):
+        # Moves a deduplicated file to `key_id` (default: the current key) by
+        # storing it again from its own chunks: it gets new chunk ids and blobs
+        # under that key, and its old chunks are released. Returns False if it
+        # already used the key. Raises ValueError if one of its chunks is damaged.
+        key_id = current_key_id() if key_id is None else key_id
+        with self._claim(path):
+            manifest = read_manifest(path)
+            if manifest["key_id"] == key_id:
+                return False
+            with ManifestReader(path) as src:
+                self._store(src, path, manifest["name"], progress, pool, DEFAULT_DEPTH, key_id)
+        return True
+
+    # ===== Garbage Collection =====
+    def _blob_paths(self):
+        # Every chunk blob in the store
+        with os.scandir(self.root) as subs:
+            folders = [sub.path for sub in subs if sub.is_dir()]
+        for folder in folders:
+            with os.scandir(folder) as it:
+                for entry in it:
+                    yield entry.path
+
+    def _remove_stale_temps(self, cutoff):
+        # Deletes .chunk.*.tmp files left by crashed uploads; returns bytes freed
+        freed = 0
+        with os.scandir(self.root) as it:
+            for entry in it:
+                if not (entry.name.startswith(".chunk.") and entry.name.endswith(".tmp")):
+                    continue
+                try:
+                    st = entry.stat()
+                    if st.st_mtime < cutoff:
+                        os.remove(entry.path)
+                        freed += st.st_size
+                except FileNotFoundError:
+                    pass
+        return freed
+
+    @metrics.timed("dedup.collect_garbage")
+    def collect_garbage(self, grace=GC_GRACE_S):
+        # Recounts references from every manifest in the vault and deletes
+        # chunks nothing points to. Chunks written or reused within `grace`
+        # seconds are kept, with at least their current count, because an
+        # upload in another process may not have written its manifest yet;
+        # so are temp files of uploads that may still be running.
+        # Returns (chunks removed, bytes freed).
+        with self._lock:
+            if self._active:
+                raise RuntimeError("Uploads are still running; try again when they finish")
+            cutoff = time.time() - grace
+            counts = {}
+            with os.scandir(self.folder) as it:
+                for entry in it:
+                    if entry.is_file() and is_manifest(entry.path):
+                        for cid, _ in read_manifest(entry.path)["chunks"]:
+                            counts[cid] = counts.get(cid, 0) + 1
+            removed, freed = 0, self._remove_stale_temps(cutoff)
+            recent = set()  # Possibly in use by another process: keep their counts
+            unused = []  # Old and in no manifest: deleted below, once re-checked under the lock
+            for path in self._blob_paths():
+                cid = os.path.basename(path)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                if st.st_mtime >= cutoff:
+                    recent.add(cid)
+                elif cid not in counts:
+                    unused.append(cid)
+            with self._conn:
+                self._conn.execute("BEGIN IMMEDIATE")  # Other processes can't pin, add or change counts until done
+                for cid in unused:
+                    path = chunk_path(self.root, cid)
+                    try:
+                        st = os.stat(path)  # Again: a pin or re-upload since the scan refreshed it
+                    except FileNotFoundError:
+                        continue
+                    if st.st_mtime >= cutoff:
+                        recent.add(cid)
+                        continue
+                    os.remove(path)
+                    removed += 1
+                    freed += st.st_size
+                refs = dict(self._conn.execute("SELECT id, refs FROM chunks"))
+                for cid in recent:
+                    counts[cid] = max(counts.get(cid, 0), refs.get(cid, 0))
+                for cid in [c for c in counts if c not in refs]:  # Row gone: was the chunk deleted meanwhile?
+                    if not os.path.exists(chunk_path(self.root, cid)):
+                        del counts[cid]
+                self._conn.execute("DELETE FROM chunks")
+                self._conn.executemany("INSERT INTO chunks (id, refs) VALUES (?, ?)",
+                                       [(cid, n) for cid, n in counts.items() if n > 0])
+        return removed, freed
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -1,8 +1,27 @@
 # === crypto_util.py ===
 
-from cryptography.fernet import Fernet  # Fernet is used for encrypting and decrypting files securely
+from cryptography.fernet import Fernet, MultiFernet  # Fernet is used for encrypting and decrypting files securely
+from cryptography.exceptions import InvalidTag  # Raised when a chunk fails authentication
+from cryptography.hazmat.primitives import hashes  # Hash algorithm used by HKDF
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF  # Derives a fresh key for every encrypted file
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM  # Authenticated encryption for each chunk
 import base64  # Used to convert binary key into readable format (needed by Fernet)
 import hashlib  # Used to generate a strong key from a password or secret string
+import io  # Base class for the seekable reader
+import json  # Key ring file
+import lzma  # Optional high-ratio compression codec
+import math  # Entropy estimate for the compression decision
+import os  # Used for random salts, temp files and atomic renames
+import struct  # Used to pack the binary header and chunk lengths
+import tempfile  # Used to create the temporary output file next to the destination
+import zlib  # Default compression codec
+from collections import Counter, OrderedDict, deque  # Entropy histogram; reader LRU cache; parallel reorder buffer
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor  # Worker pools for chunks
+from collections import namedtuple  # Lightweight result record for the stream functions
+from contextlib import contextmanager  # Used to build the atomic-write helper
+from functools import lru_cache  # Caches derived keys for the session
+
+import metrics  # Optional timing of encrypt/decrypt calls
 
 # This is a secret string used to generate a consistent encryption key
 # In real applications, this should be kept hidden or in a secure place
@@ -12,36 +31,739 @@ SECRET = "this_is_a_strong_secret_key_used_for_encryption"
 # Helps us identify whether a file is encrypted by this app
 FILE_HEADER = b'SECUREVAULT'
 
+# ================= Streaming Format (v2) =================
+# Files written by this version look like:
+#
+#   FILE_HEADER | version | codec | key id | reserved | chunk size | salt
+#   then one record per chunk: 4-byte length + AES-GCM ciphertext (incl. 16-byte tag)
+#
+# Every file gets its own key (HKDF of the master key with a random salt), each
+# chunk's nonce is its index, and the header plus a "last chunk" flag are bound
+# in as associated data. Chunks therefore can't be reordered, swapped between
+# files or cut off without decryption failing.
+# The codec byte says whether chunks were compressed before encryption (see
+# "Compression" below); the key id says which master key of the key ring the
+# file key was derived from (see "Key Ring" below).
+#
+# Legacy files (FILE_HEADER + one Fernet token) are still decrypted.
+FORMAT_VERSION = 2
+DEFAULT_CHUNK_SIZE = 1024 * 1024  # 1 MiB of plaintext per chunk
+_HEADER_FIELDS = struct.Struct(">BBBxI16s")  # version, codec, key id, pad, chunk size, salt
+_RECORD_LEN = struct.Struct(">I")  # Length prefix in front of every encrypted chunk
+_TAG_SIZE = 16  # AES-GCM authentication tag size
+HEADER_SIZE = len(FILE_HEADER) + _HEADER_FIELDS.size
+
 # This function creates a Fernet-compatible key using SHA-256 and base64 encoding
 def generate_key(secret: str) -> bytes:
     key = hashlib.sha256(secret.encode()).digest()  # Hash the secret to get a 32-byte key
     return base64.urlsafe_b64encode(key)  # Convert the key to base64 format (required by Fernet)
 
-# Create a global Fernet object using the generated key so we can use it for encryption/decryption
-fernet = Fernet(generate_key(SECRET))
+# Raw 32-byte master key (same secret as the Fernet key) used to derive per-file keys.
+# This is key id 0 of the key ring.
+_MASTER_KEY = base64.urlsafe_b64decode(generate_key(SECRET))
 
-# Function to encrypt a file in-place (overwrite original file with encrypted content)
-def encrypt_file(path: str):
-    with open(path, "rb") as f:  # Open the file in binary read mode
-        data = f.read()  # Read the full content of the file
-    
-    encrypted = fernet.encrypt(data)  # Encrypt the content using Fernet
+# Version byte after FILE_HEADER that marks a deduplicated file's manifest
+# (see chunk_store.py) instead of a chunk stream
+MANIFEST_VERSION = 0x10
 
-    with open(path, "wb") as f:  # Open the same file in binary write mode
-        f.write(FILE_HEADER + encrypted)  # Write our custom header + encrypted content
+# ================= Format Helpers =================
+@lru_cache(maxsize=16)
+def derive_key(purpose: bytes, key_id: int = 0) -> bytes:
+    # A 32-byte key for one subsystem (e.g. the chunk store), derived from a master key
+    return HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=purpose).derive(_master(key_id))
 
-# Function to decrypt a file (reads from one path and saves decrypted output to another)
-def decrypt_file(enc_path: str, dec_path: str):
-    with open(enc_path, "rb") as f:  # Open the encrypted file in binary read mode
-        content = f.read()  # Read the entire encrypted content
-    
-    # Check if the file starts with our special header
-    if not content.startswith(FILE_HEADER):
-        raise ValueError("This file is not encrypted")  # Raise error if it's not a valid encrypted file
+@lru_cache(maxsize=256)
+def _file_key(salt: bytes, key_id: int = 0) -> bytes:
+    # Derive the AES-256 key for one file from a master key and the file's salt.
+    # Cached so repeated reads of the same file (previews, verification) skip HKDF.
+    return HKDF(algorithm=hashes.SHA256(), length=32, salt=salt,
+                info=b"securevault chunk key").derive(_master(key_id))
+
+def _header_key(header: bytes) -> bytes:
+    # File key for an already validated v2 header
+    _version, _codec, key_id, _chunk_size, salt = _HEADER_FIELDS.unpack(header[len(FILE_HEADER):])
+    return _file_key(salt, key_id)
+
+def _nonce(index: int) -> bytes:
+    # 96-bit GCM nonce built from the chunk index (unique because every file has its own key)
+    return index.to_bytes(12, "big")
+
+def _aad(header: bytes, last: bool) -> bytes:
+    # Associated data: the whole file header plus a flag marking the final chunk
+    return header + (b"\x01" if last else b"\x00")
+
+def _read_exact(f, size: int) -> bytes:
+    # Read exactly `size` bytes or fail loudly on a truncated file
+    data = f.read(size)
+    if len(data) != size:
+        raise ValueError("Encrypted file is truncated")
+    return data
+
+@contextmanager
+def atomic_output(dest: str):
+    # Yields a temp file next to `dest`; it replaces `dest` only if the block succeeds
+    folder = os.path.dirname(os.path.abspath(dest))
+    fd, tmp_path = tempfile.mkstemp(prefix="." + os.path.basename(dest) + ".", suffix=".tmp", dir=folder)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            yield f
+        os.replace(tmp_path, dest)  # Atomic on the same filesystem
+    except BaseException:
+        try:
+            os.remove(tmp_path)  # Never leave half-written files behind
+        except OSError:
+            pass
+        raise
+
+# ================= Key Ring =================
+# Key id 0 is the built-in key above. Newer master keys are kept in
+# KEYRING_PATH as {"current": id, "keys": {id: urlsafe base64}}. New files are
+# written with the current key, and since every file names its key id in the
+# header, files written with any key of the ring stay readable while a
+# rotation (Vault.rotate_keys) moves them over. Legacy Fernet files are read
+# with a MultiFernet of all keys. Keys must stay in the ring as long as any
+# file still uses them.
+KEYRING_PATH = os.environ.get("SECUREVAULT_KEYRING", "vault_keys.json")
+MAX_KEY_ID = 255  # The header has one byte for it
+_keys = {0: _MASTER_KEY}  # key id -> raw master key
+_current_key = 0
+fernet = None  # MultiFernet over the ring, newest key first (set by load_keyring)
+
+def load_keyring(path: str = KEYRING_PATH):
+    # (Re)reads the key ring file; without one only the built-in key exists
+    global _keys, _current_key, fernet
+    keys, current = {0: _MASTER_KEY}, 0
+    try:
+        with open(path) as f:
+            ring = json.load(f)
+    except FileNotFoundError:
+        ring = None
+    if ring:
+        keys.update({int(key_id): base64.urlsafe_b64decode(key) for key_id, key in ring["keys"].items()})
+        current = int(ring["current"])
+        if current not in keys:
+            raise ValueError(f"Key ring {path} names missing key {current} as current")
+    _keys = keys  # Swapped in one assignment: readers on other threads never see a half-filled ring
+    _current_key = current
+    fernet = MultiFernet([Fernet(base64.urlsafe_b64encode(keys[key_id])) for key_id in sorted(keys, reverse=True)])
+    derive_key.cache_clear()
+    _file_key.cache_clear()
+
+def current_key_id() -> int:
+    return _current_key
+
+def new_master_key(path: str = KEYRING_PATH) -> int:
+    # Adds a random master key to the ring and makes it current; returns its id.
+    # Files already written keep their key until they are rotated.
+    load_keyring(path)  # Don't drop keys another process added since startup
+    key_id = max(_keys) + 1
+    if key_id > MAX_KEY_ID:
+        raise ValueError("The key ring is full")
+    ring = {"current": key_id,
+            "keys": {str(i): base64.urlsafe_b64encode(key).decode() for i, key in _keys.items() if i}}
+    ring["keys"][str(key_id)] = base64.urlsafe_b64encode(os.urandom(32)).decode()
+    with atomic_output(path) as f:  # mkstemp: readable by the owner only
+        f.write(json.dumps(ring, indent=2).encode())
+    load_keyring(path)
+    return key_id
+
+def _master(key_id: int) -> bytes:
+    try:
+        return _keys[key_id]
+    except KeyError:
+        raise ValueError(f"Encrypted with key {key_id}, which is not in the key ring") from None
+
+load_keyring()
+
+def _read_header(f):
+    # Reads and checks the v2 header; returns (header bytes, codec, chunk size, salt)
+    header = f.read(HEADER_SIZE)
+    if len(header) < HEADER_SIZE or not header.startswith(FILE_HEADER):
+        raise ValueError("This file is not encrypted")
+    version, codec, key_id, chunk_size, salt = _HEADER_FIELDS.unpack(header[len(FILE_HEADER):])
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported vault format version {version}")
+    if codec not in CODEC_NAMES:
+        raise ValueError("Unsupported codec in encrypted file")
+    _master(key_id)  # Fails early if the key ring lacks this file's key
+    return header, codec, chunk_size, salt
+
+def _header_codec(header: bytes) -> int:
+    # Codec byte of an already validated header
+    return header[len(FILE_HEADER) + 1]
+
+def _max_record(codec: int, chunk_size: int) -> int:
+    # Largest valid ciphertext record (compressed chunks carry a 1-byte flag)
+    return chunk_size + _TAG_SIZE + (1 if codec != CODEC_NONE else 0)
+
+# ================= Compression =================
+# With a codec, every chunk is compressed on its own before encryption, so
+# chunks stay independent for the parallel engine and for random access.
+# The encrypted payload starts with a flag byte: 1 = compressed, 0 = stored
+# as-is because compressing it did not help.
+CODEC_NONE, CODEC_ZLIB, CODEC_LZMA = 0, 1, 2
+CODEC_NAMES = {CODEC_NONE: "none", CODEC_ZLIB: "zlib", CODEC_LZMA: "lzma"}
+ZLIB_LEVEL = 3  # Good ratio on text/logs while staying well above disk speed
+LZMA_PRESET = 1
+
+# Formats that are already compressed (the media/archive/office types the
+# dashboard has icons for, plus common relatives); never worth recompressing
+INCOMPRESSIBLE_EXTENSIONS = {
+    "mp4", "mp3", "zip", "docx", "xlsx", "pptx", "mkv", "mov", "avi", "webm",
+    "aac", "ogg", "flac", "m4a", "jpg", "jpeg", "png", "gif", "webp",
+    "gz", "bz2", "xz", "7z", "rar", "zst", "enc",
+}
+ENTROPY_SAMPLE = 64 * 1024  # Bytes of the first chunk inspected
+ENTROPY_LIMIT = 7.5  # Bits per byte above which data is treated as incompressible
+
+def entropy(sample: bytes) -> float:
+    # Shannon entropy of `sample` in bits per byte (8.0 = random data)
+    if not sample:
+        return 0.0
+    total = len(sample)
+    return -sum(c / total * math.log2(c / total) for c in Counter(sample).values())
+
+def choose_codec(name: str = None, sample: bytes = b"") -> int:
+    # Picks the codec for a new file from its extension and first bytes
+    ext = os.path.splitext(name or "")[1][1:].lower()
+    if ext in INCOMPRESSIBLE_EXTENSIONS:
+        return CODEC_NONE
+    if entropy(sample[:ENTROPY_SAMPLE]) > ENTROPY_LIMIT:
+        return CODEC_NONE
+    return CODEC_ZLIB
+
+def pack_chunk(codec: int, chunk: bytes) -> bytes:
+    # Compresses one plaintext chunk (if it helps) and adds the flag byte
+    if codec == CODEC_NONE:
+        return chunk
+    if codec == CODEC_ZLIB:
+        packed = zlib.compress(chunk, ZLIB_LEVEL)
+    else:
+        packed = lzma.compress(chunk, preset=LZMA_PRESET, check=lzma.CHECK_NONE)
+    if len(packed) < len(chunk):
+        return b"\x01" + packed
+    return b"\x00" + chunk
+
+def unpack_chunk(codec: int, data: bytes, chunk_size: int) -> bytes:
+    # Reverses pack_chunk, refusing to inflate beyond one chunk
+    if codec == CODEC_NONE:
+        return data
+    flag, payload = data[:1], data[1:]
+    if flag == b"\x00":
+        return payload
+    if flag != b"\x01":
+        raise ValueError("Encrypted file is corrupted")
+    if codec == CODEC_ZLIB:
+        inflater = zlib.decompressobj()
+        plain = inflater.decompress(payload, chunk_size)
+        complete = inflater.eof and not inflater.unconsumed_tail
+    else:
+        inflater = lzma.LZMADecompressor()
+        plain = inflater.decompress(payload, chunk_size)
+        complete = inflater.eof
+    if not complete:
+        raise ValueError("Encrypted file is corrupted")
+    return plain
+
+# ================= Chunk Readers =================
+def _iter_chunks(src, chunk_size: int, first: bytes = None):
+    # Yields (index, plaintext chunk, is_last) read from `src`; `first` is a
+    # chunk the caller already read (e.g. to choose a codec)
+    index = 0
+    chunk = src.read(chunk_size) if first is None else first
+    while True:
+        following = src.read(chunk_size)  # Look one chunk ahead to know which chunk is last
+        last = not following
+        yield index, chunk, last
+        if last:
+            return
+        chunk = following
+        index += 1
+
+def _parse_length(prefix: bytes, max_record: int) -> int:
+    # Validates a chunk length prefix before trusting it for a read
+    if len(prefix) != _RECORD_LEN.size:
+        raise ValueError("Encrypted file is truncated")
+    (length,) = _RECORD_LEN.unpack(prefix)
+    if length < _TAG_SIZE or length > max_record:
+        raise ValueError("Encrypted file is corrupted")
+    return length
+
+def _iter_records(src, max_record: int):
+    # Yields (index, sealed chunk, is_last) from the records after a v2 header
+    index = 0
+    prefix = src.read(_RECORD_LEN.size)
+    while True:
+        sealed = _read_exact(src, _parse_length(prefix, max_record))
+        prefix = src.read(_RECORD_LEN.size)  # Look ahead: no next record means this chunk is last
+        last = not prefix
+        yield index, sealed, last
+        if last:
+            return
+        index += 1
+
+# ================= Chunk Workers =================
+# Module level so they can be shipped to a process pool.
+def _seal_chunk(key: bytes, header: bytes, index: int, chunk: bytes, last: bool):
+    # Compresses (per the header's codec) and encrypts one chunk.
+    # Returns (ready-to-write record, plaintext bytes consumed).
+    payload = pack_chunk(_header_codec(header), chunk)
+    sealed = AESGCM(key).encrypt(_nonce(index), payload, _aad(header, last))
+    return _RECORD_LEN.pack(len(sealed)) + sealed, len(chunk)
+
+def _open_chunk(key: bytes, header: bytes, index: int, sealed: bytes, last: bool):
+    # Authenticates, decrypts and decompresses one chunk.
+    # Returns (plaintext, encrypted bytes consumed including the length prefix).
+    try:
+        payload = AESGCM(key).decrypt(_nonce(index), sealed, _aad(header, last))
+    except InvalidTag:
+        raise ValueError("Encrypted file is corrupted or has been tampered with") from None
+    chunk_size = _HEADER_FIELDS.unpack(header[len(FILE_HEADER):])[3]
+    return unpack_chunk(_header_codec(header), payload, chunk_size), len(sealed) + _RECORD_LEN.size
+
+def _check_chunk(key: bytes, header: bytes, index: int, sealed: bytes, last: bool):
+    # Authenticates one chunk only: nothing is decompressed or kept.
+    # Returns the encrypted bytes consumed including the length prefix.
+    try:
+        AESGCM(key).decrypt(_nonce(index), sealed, _aad(header, last))
+    except InvalidTag:
+        raise ValueError(f"Chunk {index} is corrupted or has been tampered with") from None
+    return len(sealed) + _RECORD_LEN.size
+
+def _reseal_chunk(keys, headers, index: int, sealed: bytes, last: bool):
+    # Moves one chunk from the old file key to the new one (see rekey_stream).
+    # `keys` and `headers` are (old, new) pairs; the payload stays compressed.
+    old_key, new_key = keys
+    old_header, new_header = headers
+    try:
+        payload = AESGCM(old_key).decrypt(_nonce(index), sealed, _aad(old_header, last))
+    except InvalidTag:
+        raise ValueError(f"Chunk {index} is corrupted or has been tampered with") from None
+    resealed = AESGCM(new_key).encrypt(_nonce(index), payload, _aad(new_header, last))
+    return _RECORD_LEN.pack(len(resealed)) + resealed
+
+# ================= Parallel Engine =================
+# Chunks are handed to a thread or process pool and written back strictly in
+# order. At most `depth` chunks are in flight (queued, running or finished but
+# waiting for an earlier one), so memory stays at roughly depth * chunk size no
+# matter how large the file is.
+DEFAULT_WORKERS = os.cpu_count() or 1
+
+def make_pool(workers: int = DEFAULT_WORKERS, kind: str = "thread"):
+    # Creates an executor that can be shared across many files ("thread" or "process")
+    if kind == "process":
+        return ProcessPoolExecutor(max_workers=workers)
+    if kind == "thread":
+        return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="vault-crypto")
+    raise ValueError(f"Unknown pool kind: {kind}")
+
+def _run_ordered(fn, key: bytes, header: bytes, items, workers: int, depth: int, pool):
+    # Applies `fn` to every (index, data, last) item, yielding results in input order
+    if pool is None and workers <= 1:
+        for index, data, last in items:
+            yield fn(key, header, index, data, last)
+        return
 
-    encrypted_data = content[len(FILE_HEADER):]  # Remove the header to get only the encrypted data
+    own_pool = pool is None
+    if own_pool:
+        pool = make_pool(workers)
+    depth = depth or 2 * (workers if own_pool else DEFAULT_WORKERS)
+    pending = deque()  # Reorder buffer: futures in submission order
+    try:
+        for index, data, last in items:
+            pending.append(pool.submit(fn, key, header, index, data, last))
+            if len(pending) >= depth:
+                yield pending.popleft().result()  # Block on the oldest chunk only
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()  # Stop queued work if the consumer failed
+        if own_pool:
+            pool.shutdown(wait=True)
+
+# ================= Streaming Encryption =================
+# Both stream functions return these numbers so callers (e.g. the file index)
+# never have to re-read a file: plaintext bytes, encrypted bytes and the
+# SHA-256 hex digest of the plaintext.
+StreamStats = namedtuple("StreamStats", "plain_size cipher_size checksum")
+
+def _hashing(items, hasher):
+    # Passes (index, plaintext, last) items through while feeding them to `hasher`
+    for index, data, last in items:
+        hasher.update(data)
+        yield index, data, last
+
+@metrics.timed("crypto.encrypt", size=lambda stats: stats.plain_size)
+def encrypt_stream(src, dst, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                   workers: int = 1, depth: int = None, pool=None, progress=None,
+                   codec: int = None, name: str = None, key_id: int = None):
+    # Encrypts everything readable from `src` into `dst` using constant memory.
+    # workers > 1 (or a shared `pool`) encrypts chunks in parallel; `depth` caps
+    # how many chunks may be in flight at once. `progress(nbytes)` is called
+    # after every chunk with the number of source bytes it consumed.
+    # `codec` forces a compression codec; by default choose_codec() decides
+    # from `name` (original file name) and the first chunk. `key_id` defaults
+    # to the key ring's current key.
+    first = src.read(chunk_size)
+    if codec is None:
+        codec = choose_codec(name, first)
+    if key_id is None:
+        key_id = _current_key
+    salt = os.urandom(16)
+    header = FILE_HEADER + _HEADER_FIELDS.pack(FORMAT_VERSION, codec, key_id, chunk_size, salt)
+    dst.write(header)
+    hasher = hashlib.sha256()
+    plain_size, cipher_size = 0, len(header)
+    chunks = _hashing(_iter_chunks(src, chunk_size, first), hasher)
+    for record, consumed in _run_ordered(_seal_chunk, _file_key(salt, key_id), header, chunks, workers, depth, pool):
+        dst.write(record)
+        plain_size += consumed
+        cipher_size += len(record)
+        if progress:
+            progress(consumed)
+    return StreamStats(plain_size, cipher_size, hasher.hexdigest())
+
+@metrics.timed("crypto.decrypt", size=lambda stats: stats.plain_size)
+def decrypt_stream(src, dst, workers: int = 1, depth: int = None, pool=None, progress=None):
+    # Decrypts a v2 stream from `src` into `dst`, one chunk at a time (or in
+    # parallel), decompressing chunks transparently. `progress(nbytes)` is
+    # called after every chunk with the plaintext bytes written, so job
+    # totals are plaintext sizes whether or not the file was compressed.
+    header, codec, chunk_size, salt = _read_header(src)
+    hasher = hashlib.sha256()
+    plain_size, cipher_size = 0, len(header)
+    records = _iter_records(src, _max_record(codec, chunk_size))
+    for plain, consumed in _run_ordered(_open_chunk, _header_key(header), header, records, workers, depth, pool):
+        dst.write(plain)
+        hasher.update(plain)
+        plain_size += len(plain)
+        cipher_size += consumed
+        if progress:
+            progress(len(plain))
+    return StreamStats(plain_size, cipher_size, hasher.hexdigest())
+
+# ================= File Level API =================
+# Function to encrypt a file. With no `dest` the original file is replaced by its
+# encrypted version; otherwise the encrypted copy is written straight to `dest`.
+# Output is always written to a temp file first and renamed into place.
+# The remaining arguments are passed to encrypt_stream.
+def encrypt_file(path: str, dest: str = None, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 workers: int = 1, depth: int = None, pool=None, progress=None, codec: int = None):
+    with open(path, "rb") as src, atomic_output(dest or path) as dst:
+        return encrypt_stream(src, dst, chunk_size, workers, depth, pool, progress,
+                              codec, os.path.basename(path))
+
+# Legacy format: everything after FILE_HEADER in `src` is a single Fernet token
+@metrics.timed("crypto.decrypt", size=lambda stats: stats.plain_size)
+def _decrypt_legacy(src, dst, progress=None):
+    encrypted_data = src.read()[len(FILE_HEADER):]
     decrypted = fernet.decrypt(encrypted_data)  # Decrypt the encrypted part using Fernet
+    dst.write(decrypted)
+    if progress:
+        progress(len(decrypted))
+    return StreamStats(len(decrypted), len(FILE_HEADER) + len(encrypted_data),
+                       hashlib.sha256(decrypted).hexdigest())
+
+# Decrypts a vault file of any format (v2 stream, deduplicated manifest or
+# legacy Fernet) into the open binary stream `dst`. Returns StreamStats;
+# `progress` counts plaintext bytes written, as in decrypt_stream. Each
+# format records its own timing ("crypto.decrypt" or "dedup.restore").
+def decrypt_to(enc_path: str, dst, workers: int = 1, depth: int = None, pool=None, progress=None):
+    with open(enc_path, "rb") as f:  # Open the encrypted file in binary read mode
+        start = f.read(len(FILE_HEADER) + 1)
+
+        # Check if the file starts with our special header
+        if not start.startswith(FILE_HEADER) or len(start) <= len(FILE_HEADER):
+            raise ValueError("This file is not encrypted")  # Raise error if it's not a valid encrypted file
+
+        f.seek(0)
+        if start[-1] == FORMAT_VERSION:
+            return decrypt_stream(f, dst, workers, depth, pool, progress)  # Chunked format: constant memory
+        if start[-1] == MANIFEST_VERSION:
+            import chunk_store  # Imported here because chunk_store builds on this module
+            return chunk_store.restore_stream(enc_path, dst, progress)
+        return _decrypt_legacy(f, dst, progress)
+
+# Function to decrypt a file (reads from one path and saves decrypted output to another).
+# Returns the same StreamStats as encrypt_file.
+def decrypt_file(enc_path: str, dec_path: str, workers: int = 1, depth: int = None,
+                 pool=None, progress=None):
+    with atomic_output(dec_path) as out:  # Nothing appears at dec_path unless decryption succeeds
+        return decrypt_to(enc_path, out, workers, depth, pool, progress)
+
+# Works out the plaintext size of an encrypted file by walking its chunk
+# lengths. Every chunk but the last holds exactly chunk_size bytes, so only
+# the last chunk is decrypted. That also authenticates it as the final
+# chunk: a file cut off at a record boundary fails instead of reporting a
+# short size. Returns None for legacy or non-vault files.
+@metrics.timed("crypto.plaintext_size")
+def plaintext_size(enc_path: str):
+    with open(enc_path, "rb") as f:
+        if f.read(len(FILE_HEADER) + 1) == FILE_HEADER + bytes([MANIFEST_VERSION]):
+            import chunk_store
+            return chunk_store.read_manifest(enc_path)["size"]
+        f.seek(0)
+        try:
+            header, codec, chunk_size, salt = _read_header(f)
+        except ValueError:
+            return None
+        max_record = _max_record(codec, chunk_size)
+        count, last_offset, last_length = 0, None, 0
+        while True:
+            prefix = f.read(_RECORD_LEN.size)
+            if not prefix:
+                break
+            last_length = _parse_length(prefix, max_record)
+            last_offset = f.tell()
+            count += 1
+            f.seek(last_length, os.SEEK_CUR)  # Skip the ciphertext itself
+        if count == 0:
+            raise ValueError("Encrypted file is truncated")
+        f.seek(last_offset)
+        sealed = _read_exact(f, last_length)
+        plain, _consumed = _open_chunk(_header_key(header), header, count - 1, sealed, True)
+        return (count - 1) * chunk_size + len(plain)
+
+# Checks every authentication tag of a chunked (v2) vault file without
+# decompressing, hashing or writing any plaintext; a truncated or reordered
+# file fails too, because the last-chunk flag and the chunk index are
+# authenticated. Raises ValueError on damage and returns the encrypted bytes
+# checked, or None for deduplicated and legacy files (which have no cheaper
+# check than a full decrypt).
+@metrics.timed("crypto.verify", size=lambda checked: checked)
+def verify_file(enc_path: str, workers: int = 1, depth: int = None, pool=None, progress=None):
+    with open(enc_path, "rb") as f:
+        if f.read(len(FILE_HEADER) + 1) != FILE_HEADER + bytes([FORMAT_VERSION]):
+            return None
+        f.seek(0)
+        header, codec, chunk_size, salt = _read_header(f)
+        checked = len(header)
+        if progress:
+            progress(checked)  # Totals are file sizes, header included
+        records = _iter_records(f, _max_record(codec, chunk_size))
+        for consumed in _run_ordered(_check_chunk, _header_key(header), header, records, workers, depth, pool):
+            checked += consumed
+            if progress:
+                progress(consumed)
+    return checked
+
+# ================= Key Rotation =================
+# A file moves to another key by re-sealing its chunks: each is authenticated
+# and decrypted with the old file key and encrypted again under a new salt and
+# key id, without being decompressed. Manifests of deduplicated files are
+# ordinary streams behind their marker; legacy Fernet files are upgraded to
+# the chunked format on the way.
+def _header_key_id(header: bytes) -> int:
+    return header[len(FILE_HEADER) + 2]
+
+def file_key_id(enc_path: str):
+    # Key id of a vault file (of the manifest itself for deduplicated files),
+    # or None for legacy Fernet files
+    with open(enc_path, "rb") as f:
+        start = f.read(len(FILE_HEADER) + 1)
+        if not start.startswith(FILE_HEADER) or len(start) <= len(FILE_HEADER):
+            raise ValueError("This file is not encrypted")
+        if start[-1] == MANIFEST_VERSION:
+            start = f.read(len(FILE_HEADER) + 1)
+        elif start[-1] != FORMAT_VERSION:
+            return None
+        f.seek(-len(start), os.SEEK_CUR)
+        return _header_key_id(_read_header(f)[0])
+
+def rekey_stream(src, dst, key_id: int = None, workers: int = 1, depth: int = None, pool=None, progress=None):
+    # Copies a v2 stream from `src` to `dst` under `key_id` (default: the
+    # current key); returns the encrypted bytes written
+    header, codec, chunk_size, _salt = _read_header(src)
+    if key_id is None:
+        key_id = _current_key
+    salt = os.urandom(16)
+    new_header = FILE_HEADER + _HEADER_FIELDS.pack(FORMAT_VERSION, codec, key_id, chunk_size, salt)
+    dst.write(new_header)
+    written = len(new_header)
+    keys = (_header_key(header), _file_key(salt, key_id))
+    records = _iter_records(src, _max_record(codec, chunk_size))
+    for record in _run_ordered(_reseal_chunk, keys, (header, new_header), records, workers, depth, pool):
+        dst.write(record)
+        written += len(record)
+        if progress:
+            progress(len(record))
+    return written
+
+@metrics.timed("crypto.rekey")
+def rekey_file(enc_path: str, key_id: int = None, workers: int = 1, depth: int = None, pool=None, progress=None):
+    # Rewrites a vault file in place (atomically) under `key_id`, default the
+    # current key. Returns False if it already used that key. Raises
+    # ValueError if the file is damaged or was modified while being rewritten.
+    if key_id is None:
+        key_id = _current_key
+    if file_key_id(enc_path) == key_id:
+        return False
+    before = os.stat(enc_path).st_mtime_ns
+    with open(enc_path, "rb") as src, atomic_output(enc_path) as dst:
+        start = src.read(len(FILE_HEADER) + 1)
+        if start[-1] == MANIFEST_VERSION:
+            dst.write(start)
+            rekey_stream(src, dst, key_id, workers, depth, pool, progress)
+        elif start[-1] == FORMAT_VERSION:
+            src.seek(0)
+            rekey_stream(src, dst, key_id, workers, depth, pool, progress)
+        else:
+            plain = fernet.decrypt(start[len(FILE_HEADER):] + src.read())
+            encrypt_stream(io.BytesIO(plain), dst, workers=workers, depth=depth, pool=pool,
+                           progress=progress, key_id=key_id)
+        if os.stat(enc_path).st_mtime_ns != before:
+            raise ValueError("File changed during key rotation")  # Keep the newer contents
+    return True
+
+# ================= Random Access =================
+# open_encrypted() returns a read-only, seekable file object over a vault file.
+# Only the chunks covering the bytes actually read are decrypted, and the most
+# recently used ones are kept, so previewing the head of a huge file or
+# seeking around in it never decrypts the whole thing.
+DEFAULT_CACHE_CHUNKS = 8  # Decrypted chunks kept per open reader
+
+class ChunkReader(io.RawIOBase):
+    # Seekable reader over a sequence of decrypted chunks. Subclasses provide
+    # `size`, _locate(pos) -> (chunk index, plaintext offset of that chunk) or
+    # None past the end, and _decrypt(index) -> plaintext of that chunk.
+
+    def __init__(self, cache_chunks: int = DEFAULT_CACHE_CHUNKS):
+        super().__init__()
+        self._cache = OrderedDict()  # index -> plaintext, least recently used first
+        self._cache_chunks = max(1, cache_chunks)
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += self.size
+        elif whence != io.SEEK_SET:
+            raise ValueError(f"Invalid whence: {whence}")
+        if offset < 0:
+            raise ValueError("Negative seek position")
+        self._pos = offset
+        return offset
+
+    def readinto(self, buffer):
+        # Fills `buffer` across as many chunks as needed; short only at end of file
+        view = memoryview(buffer).cast("B")
+        filled = 0
+        while filled < len(view):
+            found = self._locate(self._pos)
+            if found is None:
+                break
+            index, start = found
+            piece = memoryview(self._chunk(index))[self._pos - start:][:len(view) - filled]
+            if not piece:
+                break
+            view[filled:filled + len(piece)] = piece
+            filled += len(piece)
+            self._pos += len(piece)
+        return filled
+
+    def _chunk(self, index: int) -> bytes:
+        chunk = self._cache.get(index)
+        if chunk is None:
+            chunk = self._decrypt(index)
+            self._cache[index] = chunk
+            if len(self._cache) > self._cache_chunks:
+                self._cache.popitem(last=False)
+        else:
+            self._cache.move_to_end(index)
+        return chunk
+
+class VaultReader(ChunkReader):
+    # Random access into a v2 chunk stream. Record offsets are found by
+    # following length prefixes only as far as a read needs (uncompressed
+    # files compute them directly), so opening is O(1).
+
+    def __init__(self, enc_path: str, cache_chunks: int = DEFAULT_CACHE_CHUNKS):
+        super().__init__(cache_chunks)
+        self._file = open(enc_path, "rb")
+        try:
+            self._header, self._codec, self._chunk_size, _salt = _read_header(self._file)
+            self._file_size = os.fstat(self._file.fileno()).st_size
+            if self._file_size <= HEADER_SIZE:
+                raise ValueError("Encrypted file is truncated")
+        except BaseException:
+            self._file.close()
+            raise
+        self._key = _header_key(self._header)
+        self._max_record = _max_record(self._codec, self._chunk_size)
+        self._offsets = [HEADER_SIZE]  # Start of each record found so far
+        self._size = None
+
+    def close(self):
+        if not self.closed:
+            self._file.close()
+        super().close()
+
+    def _record_start(self, index: int):
+        # File offset of record `index`, or None if the file has fewer records
+        if self._codec == CODEC_NONE:
+            offset = HEADER_SIZE + index * (_RECORD_LEN.size + self._max_record)
+            return offset if offset < self._file_size else None
+        while len(self._offsets) <= index:
+            offset = self._offsets[-1]
+            if offset >= self._file_size:
+                return None
+            self._file.seek(offset)
+            length = _parse_length(self._file.read(_RECORD_LEN.size), self._max_record)
+            self._offsets.append(offset + _RECORD_LEN.size + length)
+        offset = self._offsets[index]
+        return offset if offset < self._file_size else None
+
+    def _locate(self, pos: int):
+        index = pos // self._chunk_size
+        if self._record_start(index) is None:
+            return None
+        return index, index * self._chunk_size
+
+    @metrics.timed("crypto.read_chunk", size=len)
+    def _decrypt(self, index: int) -> bytes:
+        self._file.seek(self._record_start(index))
+        length = _parse_length(self._file.read(_RECORD_LEN.size), self._max_record)
+        sealed = _read_exact(self._file, length)
+        last = self._file.tell() == self._file_size
+        chunk, _consumed = _open_chunk(self._key, self._header, index, sealed, last)
+        if not last and len(chunk) != self._chunk_size:
+            raise ValueError("Encrypted file is corrupted")
+        return chunk
 
-    with open(dec_path, "wb") as f:  # Open the output file in binary write mode
-        f.write(decrypted)  # Write the decrypted content to the new file
+    @property
+    def size(self) -> int:
+        # Plaintext size; for compressed files this walks to and decrypts the last chunk
+        if self._size is None:
+            if self._codec == CODEC_NONE:
+                last = (self._file_size - HEADER_SIZE - 1) // (_RECORD_LEN.size + self._max_record)
+            else:
+                self._record_start(self._file_size)  # More records than the file could hold: walks to the end
+                last = len(self._offsets) - 2
+            self._size = last * self._chunk_size + len(self._chunk(last))
+        return self._size
 
+def open_encrypted(enc_path: str, cache_chunks: int = DEFAULT_CACHE_CHUNKS):
+    # Seekable, read-only plaintext view of a vault file (any format).
+    # Legacy single-token files have no chunks and are decrypted in memory.
+    with open(enc_path, "rb") as f:
+        start = f.read(len(FILE_HEADER) + 1)
+        if not start.startswith(FILE_HEADER) or len(start) <= len(FILE_HEADER):
+            raise ValueError("This file is not encrypted")
+        if start[-1] == FORMAT_VERSION:
+            return VaultReader(enc_path, cache_chunks)
+        if start[-1] == MANIFEST_VERSION:
+            import chunk_store
+            return chunk_store.ManifestReader(enc_path, cache_chunks)
+        f.seek(len(FILE_HEADER))
+        return io.BytesIO(fernet.decrypt(f.read()))
@@ -3,11 +3,21 @@
 # ================= Imports =================
 import tkinter as tk  # GUI components
 from tkinter import ttk, filedialog, messagebox  # GUI widgets, file chooser, popup alerts
-import os, sys, shutil, sqlite3, subprocess  # OS handling, file ops, DB, open files
+import os, sys, sqlite3, subprocess, time  # OS handling, DB, open files, logout timing
 from datetime import datetime  # For file timestamps
 import humanize  # To display file sizes in readable format
-from PIL import Image, ImageTk  # For displaying file icons
-from crypto_util import encrypt_file, decrypt_file  # Encryption functions
+from vault import Vault, user_folder, tree_files, vault_name  # Headless vault engine
+from crypto_util import new_master_key  # Key rotation
+from export import export_archive, export_folder  # Decrypted export without copies in the vault
+from preview import (preview_kind, read_text_head, load_image, serve_to_viewer, open_temp_copy,
+                     remove_temp_copies, PREVIEW_BYTES)  # Open without decrypting into the vault
+from jobs import JobScheduler, DONE, FAILED  # Background job queue
+from search_index import SearchIndex  # Trigram index behind the search box
+from file_records import RecordStore, SORT_CRITERIA, record_from_entry  # Typed rows + presorted columns
+from folder_watch import FolderWatcher  # Change feed for the vault folder
+from virtual_table import VirtualTable  # Treeview that only renders visible rows
+import metrics  # Timing and counters shown in the Diagnostics window
+from icon_atlas import IconAtlas  # Pre-resized file icons, cached on disk
 
 # ========== Helper Functions ==========
 def resource_path(relative_path):
@@ -19,65 +29,81 @@ def resource_path(relative_path):
     return os.path.join(base_path, relative_path)
 
 # ========== File Icon Handling ==========
-ICON_SIZE = (18, 18)  # Icon size for files
-icon_cache = {}  # Store loaded icons to avoid reloading
+icon_atlas = None  # IconAtlas of the current Tk root; images can't be shared between roots
 
 def get_file_icon(extension):
     # Returns appropriate icon based on file extension
-    if extension in icon_cache:
-        return icon_cache[extension]
-
-    icon_path = {
-        "pdf": "icons/pdf.png",
-        "doc": "icons/doc.png",
-        "docx": "icons/doc.png",
-        "xlsx": "icons/excel.png",
-        "mp4": "icons/video.png",
-        "mp3": "icons/audio.png",
-        "zip": "icons/zip.png",
-        "enc": "icons/lock.png",
-    }.get(extension, "icons/file.png")
+    return icon_atlas.get(extension) if icon_atlas else None
 
-    try:
-        image = Image.open(resource_path(icon_path))
-        image = image.resize(ICON_SIZE, Image.Resampling.LANCZOS)
-        icon = ImageTk.PhotoImage(image)
-        icon_cache[extension] = icon
-        return icon
-    except Exception as e:
-        print(f"[Icon Load Error] {extension}: {e}")
-        return None
+def open_with_system(path):
+    # Opens a file (or a local URL from preview.py) in the default application
+    if os.name == 'nt':
+        os.startfile(path)  # Windows open
+    else:
+        subprocess.Popen(('xdg-open', path))  # Linux/macOS
+
+JOB_POLL_MS = 200  # How often finished jobs and progress are pulled into the GUI
+SEARCH_DEBOUNCE_MS = 150  # Wait this long after the last keystroke before searching
+WATCH_POLL_MS = 250  # How often the folder watcher's batched changes are applied
+DIAGNOSTICS_REFRESH_MS = 1000  # Refresh rate of the open Diagnostics window
 
 # ========== Main Dashboard Window ==========
-def open_dashboard_window(username):
-    global dashboard, VAULT_FOLDER, file_table, search_var, top_toolbar, bottom_toolbar, search_frame
+def open_dashboard_window(username, root=None, on_logout=None):
+    # Builds the dashboard inside `root` (the login window's Tk root), or in a
+    # new window when started on its own. On logout the dashboard's widgets
+    # are destroyed and on_logout(started) puts the login form back in the same
+    # root, so no new interpreter has to start.
+    global dashboard, VAULT_FOLDER, file_table, search_var, top_toolbar, bottom_toolbar, search_frame, job_table, icon_atlas
 
     current_user = username
-    VAULT_FOLDER = os.path.join("vault", current_user)  # User's personal folder
+    VAULT_FOLDER = user_folder(current_user)  # User's personal folder
     os.makedirs(VAULT_FOLDER, exist_ok=True)  # Create if doesn't exist
 
-    dashboard = tk.Tk()
-    dashboard.title("\U0001F510 Secure Desktop Vault")
-    dashboard.geometry("950x600")
+    own_root = root is None
+    if own_root:
+        root = tk.Tk()
+    root.title("\U0001F510 Secure Desktop Vault")
+    root.geometry("950x600")
 
     try:
-        dashboard.iconbitmap(resource_path("icons/vault.ico"))  # Set app icon
+        root.iconbitmap(resource_path("icons/vault.ico"))  # Set app icon
     except Exception as e:
         print("[Window Icon Error]:", e)
 
+    if icon_atlas is None or icon_atlas.master is not root:
+        icon_atlas = IconAtlas(root)  # Loaded once per root, on the first row drawn
+
+    dashboard = tk.Frame(root)  # Everything below lives here, so logout is one destroy()
+    dashboard.pack(fill=tk.BOTH, expand=True)
+    closed = False  # Stops the polling loops once the dashboard is gone
+    timers = {}  # Pending dashboard.after() callbacks by name, cancelled by close_window()
+
+    def later(key, ms, fn):
+        # dashboard.after() that close_window() cancels: a callback still pending
+        # when the dashboard is destroyed would raise "invalid command name"
+        def run():
+            timers.pop(key, None)
+            fn()
+        if key in timers:
+            dashboard.after_cancel(timers[key])
+        timers[key] = dashboard.after(ms, run)
+
     # ===== Top Toolbar =====
     top_toolbar = tk.Frame(dashboard)
     top_toolbar.pack(pady=5)
 
     tk.Button(top_toolbar, text="\U0001F510 Upload & Encrypt", command=lambda: upload_file()).pack(side=tk.LEFT, padx=5)
+    tk.Button(top_toolbar, text="\U0001F4C1 Upload Folder", command=lambda: upload_folder()).pack(side=tk.LEFT, padx=5)
     tk.Button(top_toolbar, text="\U0001F513 Decrypt", command=lambda: decrypt_selected()).pack(side=tk.LEFT, padx=5)
     tk.Button(top_toolbar, text="\U0001F4C2 Open", command=lambda: open_selected()).pack(side=tk.LEFT, padx=5)
     tk.Button(top_toolbar, text="\U0001F5D1\uFE0F Delete", command=lambda: delete_selected()).pack(side=tk.LEFT, padx=5)
-    tk.Button(top_toolbar, text="\u2B07\uFE0F Download", command=lambda: download_selected()).pack(side=tk.LEFT, padx=5)
+    tk.Button(top_toolbar, text="\u2B07\uFE0F Export", command=lambda: export_selected()).pack(side=tk.LEFT, padx=5)
+    dedup_var = tk.BooleanVar(value=False)  # Store new uploads as shared, deduplicated chunks
+    tk.Checkbutton(top_toolbar, text="Deduplicate", variable=dedup_var).pack(side=tk.LEFT, padx=5)
 
     # ===== Search Bar =====
     search_var = tk.StringVar()
-    search_var.trace("w", lambda *args: view_files())  # Auto update when text typed
+    search_var.trace("w", lambda *args: schedule_search())  # Debounced update when text typed
 
     search_frame = tk.Frame(dashboard)
     search_frame.pack(pady=2)
@@ -88,12 +114,7 @@ def open_dashboard_window(username):
     bottom_toolbar = tk.Frame(dashboard)
     bottom_toolbar.pack(pady=2)
 
-    sort_options = [
-        "Name (A-Z)", "Name (Z-A)",
-        "Date Modified (Newest)", "Date Modified (Oldest)",
-        "Size (Largest)", "Size (Smallest)",
-        "Type (A-Z)", "Type (Z-A)"
-    ]
+    sort_options = list(SORT_CRITERIA)  # "Name (A-Z)", "Size (Largest)", ...
     sort_by_var = tk.StringVar()
     sort_by_var.set("\u2B07\uFE0F Sort By")
     sort_menu = ttk.Combobox(bottom_toolbar, textvariable=sort_by_var, values=sort_options, state="readonly", width=20)
@@ -101,7 +122,7 @@ def open_dashboard_window(username):
     sort_menu.bind("<<ComboboxSelected>>", lambda event: sort_files(sort_by_var.get()))
 
     # ===== File Display Table =====
-    file_table = ttk.Treeview(dashboard, columns=("Type", "Modified", "Size"))
+    file_table = VirtualTable(dashboard, ("Type", "Modified", "Size"), lambda name: render_row(name))
     file_table.heading("#0", text="Name", anchor="w")
     file_table.heading("Type", text="Type")
     file_table.heading("Modified", text="Date Modified")
@@ -113,31 +134,83 @@ def open_dashboard_window(username):
     file_table.column("Size", anchor="center", width=100)
     file_table.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
 
+    # ===== Background Jobs Table =====
+    job_table = ttk.Treeview(dashboard, columns=("Status", "Progress", "Speed"), height=4)
+    job_table.heading("#0", text="Job", anchor="w")
+    job_table.heading("Status", text="Status")
+    job_table.heading("Progress", text="Progress")
+    job_table.heading("Speed", text="Speed")
+    job_table.column("#0", anchor="w", width=320)
+    job_table.column("Status", anchor="w", width=220)
+    job_table.column("Progress", anchor="center", width=80)
+    job_table.column("Speed", anchor="center", width=100)
+    job_table.pack(fill=tk.X, padx=10, pady=(0, 5))
+
+    status_var = tk.StringVar()
+    tk.Label(dashboard, textvariable=status_var, anchor="w").pack(fill=tk.X, padx=10, pady=(0, 5))
+
+    scheduler = JobScheduler()
+    engine = Vault(VAULT_FOLDER, pool=scheduler.crypto_pool)  # All file operations; shares the job pool
+    index = engine.index  # Listing metadata; reconciled with the disk below
+    watcher = FolderWatcher(VAULT_FOLDER)  # Notices files changed outside the app
+
     # ===== Bottom Buttons =====
     tk.Button(bottom_toolbar, text="\U0001F3A8 Theme", command=lambda: toggle_theme()).pack(side=tk.LEFT, padx=5)
-    tk.Button(bottom_toolbar, text="\U0001F501 Refresh", command=lambda: view_files()).pack(side=tk.LEFT, padx=5)
+    tk.Button(bottom_toolbar, text="\U0001F501 Refresh", command=lambda: refresh_files()).pack(side=tk.LEFT, padx=5)
+    tk.Button(bottom_toolbar, text="\u23F9\uFE0F Cancel Job", command=lambda: cancel_jobs()).pack(side=tk.LEFT, padx=5)
+    tk.Button(bottom_toolbar, text="\U0001F9F9 Clear Jobs", command=lambda: clear_jobs()).pack(side=tk.LEFT, padx=5)
+    tk.Button(bottom_toolbar, text="\u267B\uFE0F Reclaim Space", command=lambda: reclaim_space()).pack(side=tk.LEFT, padx=5)
+    tk.Button(bottom_toolbar, text="\U0001F6E1\uFE0F Check Integrity", command=lambda: check_integrity()).pack(side=tk.LEFT, padx=5)
+    tk.Button(bottom_toolbar, text="\U0001F511 Rotate Key", command=lambda: rotate_key()).pack(side=tk.LEFT, padx=5)
     tk.Button(bottom_toolbar, text="\U0001F512 Logout", command=lambda: logout()).pack(side=tk.RIGHT, padx=5)
+    tk.Button(bottom_toolbar, text="\U0001F4CA Diagnostics", command=lambda: show_diagnostics()).pack(side=tk.RIGHT, padx=5)
 
     # ===== Functional Logic =====
 
+    # Every slow action runs as a background job; results come back through poll_jobs().
+    # A job that writes into the vault returns the file name so its row can be updated.
+    def report_job(job):
+        if job.status == FAILED:
+            status_var.set(f"Failed: {job.label} ({job.error})")
+        else:
+            status_var.set(f"{job.status}: {job.label}")
+
+    def file_size(path):
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return 0
+
+    def queue_encrypt(filepath, enc_filename):
+        dedup = dedup_var.get()
+
+        def encrypt(job):
+            return engine.encrypt(filepath, enc_filename, dedup, job.progress)[0]
+
+        scheduler.submit(f"Encrypt {enc_filename}", encrypt, total=file_size(filepath), on_done=report_job)
+
     def upload_file():
-        filepath = filedialog.askopenfilename()  # Let user pick file
-        if filepath:
-            filename = os.path.basename(filepath)
-            enc_filename = filename.replace(" ", "_") + ".enc"
-            destination = os.path.join(VAULT_FOLDER, enc_filename)
-            try:
-                shutil.copy(filepath, destination)  # Copy file to vault
-                encrypt_file(destination)  # Encrypt it
-                messagebox.showinfo("Success", f"Encrypted: {enc_filename}")
-                view_files()
-            except Exception as e:
-                messagebox.showerror("Error", str(e))
+        filepaths = filedialog.askopenfilenames()  # Let user pick one or more files
+        for filepath in filepaths:
+            queue_encrypt(filepath, vault_name(os.path.basename(filepath)))
+
+    def upload_folder():
+        folder = filedialog.askdirectory()  # Encrypt every file below this folder
+        if folder:
+            renamed = []  # Paths whose flattened name clashed with another file of the folder
+            for filepath, enc_filename, taken in tree_files(folder):
+                queue_encrypt(filepath, enc_filename)
+                if taken:
+                    renamed.append(f"{os.path.relpath(filepath, folder)} → {enc_filename}")
+            if renamed:
+                shown = "\n".join(renamed[:10]) + (f"\n... and {len(renamed) - 10} more" if len(renamed) > 10 else "")
+                messagebox.showinfo("Renamed", "These files would have had the same name as another file "
+                                    f"in the folder and were stored as:\n\n{shown}")
 
     def decrypt_selected():
-        selected = file_table.selection()
+        selected = file_table.selected_keys()
         if selected:
-            enc_file = file_table.item(selected[0])['text']
+            enc_file = selected[0]
             if not enc_file.endswith(".enc"):
                 messagebox.showwarning("Warning", "Not an encrypted file.")
                 return
@@ -147,56 +220,357 @@ def open_dashboard_window(username):
             if os.path.exists(decrypted_path):
                 messagebox.showwarning("Exists", f"{decrypted_name} already exists.")
                 return
-            try:
-                decrypt_file(enc_path, decrypted_path)
-                messagebox.showinfo("Decrypted", f"Saved as: {decrypted_name}")
-                view_files()
-            except Exception as e:
-                messagebox.showerror("Error", str(e))
+
+            def decrypt(job):
+                engine.decrypt(enc_file, decrypted_path, job.progress)  # Also indexes the result
+                return decrypted_name
+
+            entry = index.get(enc_file)  # Deduplicated files are far smaller on disk than their contents
+            total = (entry and entry.plain_size) or file_size(enc_path)
+            scheduler.submit(f"Decrypt {enc_file}", decrypt, total=total, on_done=report_job)
 
     def delete_selected():
-        selected = file_table.selection()
-        for item in selected:
-            file = file_table.item(item)['text']
+        selected = file_table.selected_keys()
+        for file in selected:
             try:
-                os.remove(os.path.join(VAULT_FOLDER, file))
+                engine.delete(file)  # Also releases shared chunks
             except Exception as e:
                 messagebox.showerror("Error", str(e))
-        view_files()
+        show_names(selected)
+
+    def reclaim_space():
+        # Recounts chunk references and deletes chunks no file uses any more
+        def collect(job):
+            removed, freed = engine.collect_garbage()
+            job.label = f"Reclaim space ({removed} chunks, {humanize.naturalsize(freed)})"
+
+        scheduler.submit("Reclaim space", collect, on_done=report_job)
+
+    def check_integrity():
+        # Scrubs the files that changed or are due for a re-check; results are
+        # kept in the index, so the next run skips everything checked here
+        due = engine.due_checks()
+        if not due:
+            status_var.set("Integrity check: every file was checked recently")
+            return
+
+        def scrub(job):
+            damaged = 0
+            for checked, (_name, error) in enumerate(engine.scrub(due, progress=job.progress), 1):
+                damaged += error is not None
+                job.label = f"Check integrity ({checked}/{len(due)} files, {damaged} damaged)"
+
+        scheduler.submit(f"Check integrity ({len(due)} files)", scrub,
+                         total=sum(entry.stored_size for entry in due),
+                         on_done=lambda job: (report_job(job), show_damaged(announce=True)))
+
+    def rotate_key():
+        # Re-encrypts the vault under a new key in the background; an
+        # interrupted rotation is resumed instead of starting another one
+        if engine.rotation_checkpoint():
+            if not messagebox.askyesno("Rotate Key", "A key rotation did not finish. Resume it now?"):
+                return
+        elif messagebox.askyesno("Rotate Key", "Create a new encryption key and re-encrypt every file with it?\n"
+                                              "Files stay readable while this runs."):
+            new_master_key()
+        else:
+            return
+
+        def rotate(job):
+            moved = failed = 0
+            for _name, rewritten, error in engine.rotate_keys(progress=job.progress):
+                moved += rewritten
+                failed += error is not None
+                job.label = f"Rotate key ({moved} files re-encrypted, {failed} failed)"
+            if failed:
+                raise ValueError(f"{failed} file(s) could not be re-encrypted; run Rotate Key again to retry")
+
+        scheduler.submit("Rotate key", rotate, total=engine.rotation_size(), on_done=report_job)
+
+    def show_damaged(announce=False):
+        # Marks files whose last integrity check failed; optionally lists them
+        corrupt.clear()
+        corrupt.update((state.name, state.error) for state in engine.failed_checks())
+        file_table.refresh()
+        if corrupt:
+            status_var.set(f"{len(corrupt)} damaged file(s) found by the integrity check")
+            if announce:
+                listing = "\n".join(f"{name}: {error}" for name, error in list(corrupt.items())[:20])
+                more = f"\n... and {len(corrupt) - 20} more" if len(corrupt) > 20 else ""
+                messagebox.showwarning("Damaged Files", listing + more)
 
     def open_selected():
-        selected = file_table.selection()
+        # Encrypted text and images are previewed and media is streamed to a
+        # viewer straight from the vault (only the chunks read get decrypted);
+        # other files open from a private temp copy outside the vault. All of
+        # it runs as jobs, so a large file never blocks the window.
+        selected = file_table.selected_keys()
         if selected:
-            filepath = os.path.join(VAULT_FOLDER, file_table.item(selected[0])['text'])
+            name = selected[0]
+            filepath = os.path.join(VAULT_FOLDER, name)
             try:
-                if os.name == 'nt':
-                    os.startfile(filepath)  # Windows open
+                if not name.endswith(".enc"):
+                    open_with_system(filepath)
+                    return
+                entry = index.get(name)
+                original = (entry and entry.original_name) or name[:-4]
+                kind = preview_kind(original, entry and entry.plain_size)
+                if kind == "text":
+                    scheduler.submit(f"Preview {name}", lambda job: read_text_head(filepath),
+                                     on_done=lambda job: show_preview(job, show_text_preview, original))
+                elif kind == "image":
+                    scheduler.submit(f"Preview {name}", lambda job: (load_image(filepath),),
+                                     on_done=lambda job: show_preview(job, show_image_preview, original))
+                elif kind == "media":
+                    scheduler.submit(f"Stream {name}",
+                                     lambda job: serve_to_viewer(filepath, original, open_with_system, job.progress),
+                                     total=(entry and entry.plain_size) or 0, on_done=report_job)
                 else:
-                    subprocess.call(('xdg-open', filepath))  # Linux/macOS
+                    scheduler.submit(f"Open {name}",
+                                     lambda job: open_temp_copy(filepath, original, open_with_system, job.progress),
+                                     total=(entry and entry.plain_size) or 0, on_done=report_job)
             except Exception as e:
                 messagebox.showerror("Error", str(e))
 
-    def download_selected():
-        selected = file_table.selection()
-        for item in selected:
-            file = file_table.item(item)['text']
-            dest = filedialog.asksaveasfilename(initialfile=file)
-            if dest:
-                shutil.copy(os.path.join(VAULT_FOLDER, file), dest)
-                messagebox.showinfo("Downloaded", f"Saved to: {dest}")
+    def show_preview(job, show, title):
+        # on_done of a preview job; its result is the tuple of arguments after the title
+        if job.status != DONE:
+            report_job(job)
+            return
+        show(title, *job.result)
+
+    def show_text_preview(title, text, truncated):
+        window = tk.Toplevel(dashboard)
+        window.title(f"Preview - {title}")
+        window.geometry("700x500")
+        if truncated:
+            tk.Label(window, text=f"Showing the first {humanize.naturalsize(PREVIEW_BYTES)}", anchor="w").pack(fill=tk.X, padx=5)
+        scrollbar = ttk.Scrollbar(window, orient=tk.VERTICAL)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        text_box = tk.Text(window, wrap="none", yscrollcommand=scrollbar.set)
+        text_box.insert("1.0", text)
+        text_box.configure(state="disabled")
+        text_box.pack(fill=tk.BOTH, expand=True)
+        scrollbar.configure(command=text_box.yview)
+
+    def show_image_preview(title, image):
+        from PIL import ImageTk  # Only needed once an image is previewed
+        window = tk.Toplevel(dashboard)
+        window.title(f"Preview - {title}")
+        photo = ImageTk.PhotoImage(image)
+        label = tk.Label(window, image=photo)
+        label.image = photo  # Keep a reference so Tk does not drop the image
+        label.pack(padx=5, pady=5)
+
+    def export_selected():
+        # Decrypts the selected files straight into one archive or a folder
+        # (one dialog for any number of files); nothing lands in VAULT_FOLDER
+        selected = file_table.selected_keys()
+        if not selected:
+            return
+        as_archive = messagebox.askyesnocancel("Export", f"Export {len(selected)} file(s) as a single archive?\n"
+                                                         "Yes: .zip / .tar / .tar.gz    No: into a folder")
+        if as_archive is None:
+            return
+        if as_archive:
+            dest = filedialog.asksaveasfilename(defaultextension=".zip", initialfile="vault-export.zip",
+                                                filetypes=[("Zip archive", "*.zip"), ("Tar archive", "*.tar"),
+                                                           ("Compressed tar archive", "*.tar.gz")])
+        else:
+            dest = filedialog.askdirectory()
+        if not dest:
+            return
+        entries = [index.get(name) for name in selected]
+        total = sum((e.plain_size or e.stored_size) if e else 0 for e in entries)
+
+        def export(job):
+            done = failed = 0
+            if as_archive:
+                for _name, _member in export_archive(engine, selected, dest, job.progress):
+                    done += 1
+                    job.label = f"Export to {os.path.basename(dest)} ({done}/{len(selected)} files)"
+                return
+            for _name, _dest, error in export_folder(engine, selected, dest, progress=job.progress):
+                done += 1
+                failed += error is not None
+                job.label = f"Export to {os.path.basename(dest)} ({done}/{len(selected)} files, {failed} failed)"
+            if failed:
+                raise ValueError(f"{failed} file(s) could not be decrypted")
+
+        scheduler.submit(f"Export {len(selected)} file(s)", export, total=total, on_done=report_job)
+
+    # ===== Job Progress =====
+    def refresh_job_table():
+        for job in scheduler.jobs:
+            iid = str(job.id)
+            status = f"{job.status}: {job.error}" if job.status == FAILED else job.status
+            speed = humanize.naturalsize(job.throughput) + "/s" if job.started else ""
+            values = (status, f"{job.fraction:.0%}", speed)
+            if job_table.exists(iid):
+                job_table.item(iid, text=job.label, values=values)  # Some jobs update their label as they go
+            else:
+                job_table.insert("", "end", iid=iid, text=job.label, values=values)
+
+    def poll_jobs():
+        if closed:
+            return
+        finished = scheduler.poll()
+        written = [job.result for job in finished if job.status == DONE and job.result]
+        if written:
+            show_names(written)  # One update per batch of finished jobs
+        if finished or scheduler.active():
+            refresh_job_table()
+        later("jobs", JOB_POLL_MS, poll_jobs)
+
+    def cancel_jobs():
+        # Cancel the selected jobs, or everything still pending if none is selected
+        selected = {int(iid) for iid in job_table.selection()}
+        for job in scheduler.active():
+            if not selected or job.id in selected:
+                job.cancel()
+
+    def clear_jobs():
+        scheduler.clear_finished()
+        active = {str(job.id) for job in scheduler.jobs}
+        job_table.delete(*[iid for iid in job_table.get_children() if iid not in active])
+
+    # The table is virtual: `store` holds typed records for every file, and
+    # the table only formats the rows that are on screen.
+    store = RecordStore()
+    search_index = SearchIndex()
+    corrupt = {}  # name -> error of files that failed their last integrity check
+    sort_state = SORT_CRITERIA["Name (A-Z)"]  # (column, descending)
+
+    def render_row(name):
+        record = store.records[name]
+        size = humanize.naturalsize(record.size)
+        mtime = datetime.fromtimestamp(record.mtime).strftime("%d-%m-%Y %H:%M")
+        ftype = record.type.upper() + " File"
+        if name in corrupt:
+            ftype = "\u26A0\uFE0F Damaged"
+        return name, (ftype, mtime, size), get_file_icon(record.type)
 
     def view_files():
-        search = search_var.get().lower()
-        file_table.delete(*file_table.get_children())
-        for file in sorted(os.listdir(VAULT_FOLDER)):
-            if search in file.lower():
-                path = os.path.join(VAULT_FOLDER, file)
-                size = humanize.naturalsize(os.path.getsize(path))
-                mtime = datetime.fromtimestamp(os.path.getmtime(path)).strftime("%d-%m-%Y %H:%M")
-                ext = os.path.splitext(file)[1][1:].lower()
-                ftype = ext.upper() + " File"
-                icon = get_file_icon(ext)
-                file_table.insert("", "end", text=file, values=(ftype, mtime, size), image=icon)
+        # Reloads the records from the metadata index; nothing is read from disk here
+        with metrics.timer("table.view_files"):
+            store.load(index.entries())
+            # Postings are built on a worker thread; searches scan the names until then
+            search_index.rebuild(((name, name) for name in store.records), background=True)
+            store.order(*sort_state)  # Rank table the first narrow search sorts by
+            apply_search()
+
+    def show_names(names):
+        # Re-reads just these rows from the index (added, changed or gone) and redraws
+        entries, removed = [], []
+        for name in names:
+            entry = index.get(name)
+            if entry:
+                entries.append(entry)
+            else:
+                removed.append(name)
+        apply_changes(entries, removed)
+
+    def apply_changes(entries, removed):
+        # Patches the records and search index instead of reloading everything
+        for entry in entries:
+            store.put(record_from_entry(entry))
+            search_index.add(entry.name, entry.name)
+            corrupt.pop(entry.name, None)  # Rewritten: the old check no longer applies
+        for name in removed:
+            store.remove(name)
+            search_index.remove(name)
+            corrupt.pop(name, None)
+        if entries or removed:
+            apply_search()
+
+    def poll_watcher():
+        # Applies batched changes from the folder watcher
+        if closed:
+            return
+        names = watcher.changes()
+        if names is None:
+            refresh_files()  # Events were lost: compare the whole folder
+        elif names:
+            apply_changes(*index.update(names))
+        later("watcher", WATCH_POLL_MS, poll_watcher)
+
+    def schedule_search():
+        # Restart the debounce timer on every keystroke
+        later("search", SEARCH_DEBOUNCE_MS, apply_search)
+
+    def apply_search():
+        # Filters with the search index and shows the matches in the current sort order
+        query = search_var.get()
+        with search_index.foreground():  # A background index build waits meanwhile
+            matches = search_index.search(query) if query else None
+            file_table.set_items(store.arrange(*sort_state, subset=matches))
+
+    def refresh_files():
+        # Picks up changes made outside the app, then redraws the rows that changed
+        added, changed, removed = index.reconcile()
+        show_names(added + changed + removed)
+
+    # ===== Diagnostics =====
+    def show_diagnostics():
+        # Live view of metrics.py: per-operation counts, latency and throughput
+        window = tk.Toplevel(dashboard)
+        window.title("Diagnostics")
+        window.geometry("900x400")
+
+        controls = tk.Frame(window)
+        controls.pack(fill=tk.X, padx=5, pady=5)
+        enabled_var = tk.BooleanVar(value=metrics.enabled())
+        tk.Checkbutton(controls, text="Record timings", variable=enabled_var,
+                       command=lambda: metrics.enable(enabled_var.get())).pack(side=tk.LEFT)
+        tk.Button(controls, text="Reset", command=lambda: (metrics.reset(), fill())).pack(side=tk.LEFT, padx=5)
+        tk.Button(controls, text="Save Dump", command=lambda: save_dump()).pack(side=tk.LEFT, padx=5)
+        summary_var = tk.StringVar()
+        tk.Label(controls, textvariable=summary_var, anchor="e").pack(side=tk.RIGHT)
+
+        columns = ("Count", "Errors", "Avg", "p95", "Max", "Bytes", "Throughput")
+        table = ttk.Treeview(window, columns=columns)
+        table.heading("#0", text="Operation", anchor="w")
+        table.column("#0", anchor="w", width=200)
+        for column in columns:
+            table.heading(column, text=column)
+            table.column(column, anchor="center", width=95)
+        table.pack(fill=tk.BOTH, expand=True, padx=5, pady=(0, 5))
+
+        def ms(seconds):
+            return "-" if seconds is None else f"{seconds * 1000:.1f} ms"
+
+        def fill():
+            data = metrics.snapshot()
+            rows = {name: (s["count"], s["errors"], ms(s["avg_seconds"]), ms(s["p95_seconds"]),
+                           ms(s["max_seconds"]), humanize.naturalsize(s["bytes"]) if s["bytes"] else "-",
+                           humanize.naturalsize(s["bytes_per_second"]) + "/s" if s["bytes"] else "-")
+                    for name, s in data["operations"].items()}
+            rows.update({name: (n, "", "", "", "", "", "") for name, n in data["events"].items()})
+            for name, seconds in data["milestones"].items():  # Latest startup / window-switch times
+                rows.setdefault(name, ("", "", ms(seconds), "", "", "", ""))
+            for iid in table.get_children():
+                if iid not in rows:
+                    table.delete(iid)
+            for name, values in rows.items():
+                if table.exists(name):
+                    table.item(name, values=values)
+                else:
+                    table.insert("", "end", iid=name, text=name, values=values)
+            state = "recording" if data["enabled"] else "off"
+            summary_var.set(f"Timings {state} \u00B7 watcher: {watcher.backend} \u00B7 {len(store)} files")
+
+        def save_dump():
+            path = filedialog.asksaveasfilename(parent=window, initialfile="securevault-metrics.json",
+                                                filetypes=[("JSON", "*.json"), ("Prometheus text", "*.prom")])
+            if path:
+                metrics.dump(path)
+
+        def tick():
+            if not closed and window.winfo_exists():
+                fill()
+                later(f"diagnostics {window}", DIAGNOSTICS_REFRESH_MS, tick)
+
+        tick()
 
     dark_mode = False
     def toggle_theme():
@@ -217,41 +591,39 @@ def open_dashboard_window(username):
         style.theme_use("clam")
         style.configure("Treeview", background=bg, fieldbackground=bg, foreground=fg, rowheight=25)
         style.configure("Treeview.Heading", background="#333" if dark_mode else "#ccc", foreground=fg)
-        view_files()
+        file_table.refresh()
+
+    def close_window(logout=False):
+        nonlocal closed
+        closed = True
+        for timer in timers.values():
+            dashboard.after_cancel(timer)
+        timers.clear()
+        scheduler.shutdown()  # Cancel pending jobs before the window goes away
+        remove_temp_copies()  # Decrypted copies handed to viewers
+        watcher.close()
+        engine.close()
+        if logout and on_logout:
+            dashboard.destroy()  # Keep the root for the login form
+        else:
+            root.destroy()
 
     def logout():
+        started = time.perf_counter()
         try:
             os.remove(".logged_in_user")  # Delete session file
         except: pass
-        dashboard.destroy()
-        subprocess.Popen(["python", "login_window.py"])  # Relaunch login window
+        close_window(logout=True)
+        if on_logout:
+            on_logout(started)  # Back to the login form in this window
+        else:
+            subprocess.Popen([sys.executable, "login_window.py"])  # Started on its own: relaunch login window
 
     def sort_files(criteria):
-        data = []
-        for row in file_table.get_children():
-            name = file_table.item(row)["text"]
-            values = file_table.item(row)["values"]
-            img = file_table.item(row)["image"]
-            data.append((name, values, img))
-
-        reverse = False
-        key = lambda x: x[0].lower()
-
-        if criteria == "Name (Z-A)": reverse = True
-        elif "Date Modified" in criteria:
-            key = lambda x: datetime.strptime(x[1][1], "%d-%m-%Y %H:%M")
-            reverse = "Newest" in criteria
-        elif "Size" in criteria:
-            key = lambda x: float(x[1][2].split()[0])
-            reverse = "Largest" in criteria
-        elif "Type" in criteria:
-            key = lambda x: x[1][0].lower()
-            reverse = "Z-A" in criteria
-
-        data.sort(key=key, reverse=reverse)
-        file_table.delete(*file_table.get_children())
-        for name, val, img in data:
-            file_table.insert("", "end", text=name, values=val, image=img)
+        # Sorts by raw values using the store's presorted column indexes
+        nonlocal sort_state
+        sort_state = SORT_CRITERIA[criteria]
+        apply_search()
 
     # ===== Treeview Styling =====
     style = ttk.Style()
@@ -259,5 +631,11 @@ def open_dashboard_window(username):
     style.configure("Treeview", rowheight=25)
     style.configure("Treeview.Heading", font=("Segoe UI", 10, "bold"), background="#cccccc", foreground="black")
 
+    root.protocol("WM_DELETE_WINDOW", close_window)
+    index.reconcile()
     view_files()
-    dashboard.mainloop()
+    show_damaged()
+    poll_jobs()
+    poll_watcher()
+    if own_root:
+        root.mainloop()
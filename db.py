@@ -0,0 +1,217 @@
+# === db.py - Shared access layer for users.db ===
+
+import json  # KDF parameters are stored as JSON in the settings table
+import os  # CPU count for bulk hashing
+import sqlite3  # SQLite database driver
+import threading  # One persistent connection per thread
+from concurrent.futures import ThreadPoolExecutor  # scrypt releases the GIL, so bulk hashing runs in threads
+
+import kdf  # Salted scrypt password hashing
+import metrics  # Optional timing of database calls
+from utils import DB_PATH  # Location of users.db (handles the PyInstaller case)
+
+BUSY_TIMEOUT_MS = 5000  # How long to wait for another instance's write lock
+STATEMENT_CACHE = 64  # Prepared statements kept per connection
+HASH_MEMORY_BUDGET = 256 * 1024 * 1024  # scrypt working memory allowed at once during bulk registration
+
+# All SQL lives here as constants so every call reuses the same prepared statement
+_SQL_CREATE_USERS = '''CREATE TABLE IF NOT EXISTS users (
+                           id INTEGER PRIMARY KEY AUTOINCREMENT,
+                           username TEXT UNIQUE NOT NULL,
+                           password TEXT NOT NULL
+                       )'''
+# Schema migrations; entry i brings user_version from i to i + 1
+_MIGRATIONS = [
+    [_SQL_CREATE_USERS],
+    [  # Per-user salt and scrypt cost; old rows keep their SHA-256 hash until next login
+        "ALTER TABLE users ADD COLUMN salt BLOB",
+        "ALTER TABLE users ADD COLUMN kdf TEXT NOT NULL DEFAULT 'sha256'",
+        "ALTER TABLE users ADD COLUMN kdf_n INTEGER",
+        "ALTER TABLE users ADD COLUMN kdf_r INTEGER",
+        "ALTER TABLE users ADD COLUMN kdf_p INTEGER",
+        "CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL)",
+    ],
+]
+SCHEMA_VERSION = len(_MIGRATIONS)  # Stored in PRAGMA user_version so the DDL only runs once
+
+_SQL_INSERT_USER = ("INSERT INTO users (username, password, salt, kdf, kdf_n, kdf_r, kdf_p) "
+                    "VALUES (?, ?, ?, 'scrypt', ?, ?, ?)")
+_SQL_INSERT_USER_IF_NEW = _SQL_INSERT_USER.replace("INSERT INTO", "INSERT OR IGNORE INTO")
+_SQL_SELECT_PASSWORD = "SELECT password, salt, kdf, kdf_n, kdf_r, kdf_p FROM users WHERE username=?"
+_SQL_UPDATE_PASSWORD = ("UPDATE users SET password=?, salt=?, kdf='scrypt', kdf_n=?, kdf_r=?, kdf_p=? "
+                        "WHERE username=?")
+_SQL_USER_EXISTS = "SELECT 1 FROM users WHERE username=?"
+_SQL_GET_SETTING = "SELECT value FROM settings WHERE key=?"
+_SQL_SET_SETTING = "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)"
+
+_local = threading.local()  # Holds each thread's open connection
+_connections = []  # Every connection opened, so close_all() can close them
+_connections_lock = threading.Lock()
+_schema_ready = False
+_kdf_params = None  # Calibrated scrypt parameters, loaded once per process
+_kdf_lock = threading.RLock()  # One load or calibration at a time
+
+
+# ======== CONNECTIONS ========
+def get_connection():
+    # Returns this thread's persistent connection, opening it on first use
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH, timeout=BUSY_TIMEOUT_MS / 1000,
+                               cached_statements=STATEMENT_CACHE, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")  # Readers no longer block the writer
+        conn.execute("PRAGMA synchronous=NORMAL")  # Safe with WAL, far fewer fsyncs
+        _local.conn = conn
+        metrics.count("db.connections_opened")
+        with _connections_lock:
+            _connections.append(conn)
+    return conn
+
+
+def close_all():
+    # Closes every connection opened by this process (call on exit)
+    with _connections_lock:
+        for conn in _connections:
+            conn.close()
+        _connections.clear()
+    _local.__dict__.clear()
+
+
+# ======== DATABASE SETUP ========
+@metrics.timed("db.init")
+def init_db():
+    # Creates the users table on the first run; later launches only read user_version
+    global _schema_ready
+    if _schema_ready:
+        return
+    conn = get_connection()
+    if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+        # DDL is not wrapped in an implicit transaction, so take the write lock
+        # explicitly and re-read the version under it: another instance may
+        # have migrated meanwhile, and a crash rolls back every step
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            for step in _MIGRATIONS[version:]:
+                for statement in step:
+                    conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {max(version, SCHEMA_VERSION)}")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    _schema_ready = True
+
+
+# ======== PASSWORD HASHING ========
+def get_setting(key, default=None):
+    row = get_connection().execute(_SQL_GET_SETTING, (key,)).fetchone()
+    return row[0] if row else default
+
+
+def set_setting(key, value):
+    conn = get_connection()
+    with conn:
+        conn.execute(_SQL_SET_SETTING, (key, value))
+
+
+def kdf_params():
+    # scrypt cost for new hashes. Calibrated for this machine on first use and
+    # stored in the settings table so later launches skip the benchmark.
+    global _kdf_params
+    with _kdf_lock:  # A caller arriving mid-calibration waits for its result
+        if _kdf_params is None:
+            stored = get_setting("kdf_params")
+            _kdf_params = json.loads(stored) if stored else recalibrate_kdf()
+        return _kdf_params
+
+
+def prepare_kdf_params():
+    # Loads (or on the first run, calibrates) kdf_params() on a background
+    # thread, so the first login or registration doesn't sit through the
+    # calibration sweep on the GUI thread
+    threading.Thread(target=kdf_params, name="kdf-calibrate", daemon=True).start()
+
+
+@metrics.timed("db.kdf_calibrate")
+def recalibrate_kdf(target_ms=kdf.TARGET_LOGIN_MS):
+    # Re-measures this machine and stores new parameters; existing hashes are
+    # upgraded on each user's next successful login
+    global _kdf_params
+    with _kdf_lock:
+        _kdf_params = kdf.calibrate(target_ms)
+        set_setting("kdf_params", json.dumps(_kdf_params))
+        return _kdf_params
+
+
+def _password_fields(password, params):
+    # Column values (password, salt, n, r, p) for a fresh scrypt hash
+    salt, digest = kdf.new_hash(password, params)
+    return digest.hex(), salt, params["n"], params["r"], params["p"]
+
+
+# ======== USERS ========
+@metrics.timed("db.register_user")
+def register_user(username, password):
+    # Tries to add a new user with hashed password
+    conn = get_connection()
+    fields = _password_fields(password, kdf_params())
+    try:
+        with conn:
+            conn.execute(_SQL_INSERT_USER, (username, *fields))
+        return True  # Registration successful
+    except sqlite3.IntegrityError:
+        return False  # Username already exists
+
+
+@metrics.timed("db.register_users")
+def register_users(accounts):
+    # Bulk registration: one transaction for any number of (username, password)
+    # pairs. Existing usernames are skipped. Returns how many users were added.
+    # Hashing dominates, so it is spread over a thread pool first, with only
+    # as many hashes at once as HASH_MEMORY_BUDGET allows.
+    params = kdf_params()
+    accounts = list(accounts)
+    workers = max(1, min(os.cpu_count() or 1, HASH_MEMORY_BUDGET // kdf.memory_cost(params)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        rows = list(pool.map(lambda a: (a[0], *_password_fields(a[1], params)), accounts))
+    conn = get_connection()
+    with conn:
+        before = conn.total_changes
+        conn.executemany(_SQL_INSERT_USER_IF_NEW, rows)
+        return conn.total_changes - before
+
+
+@metrics.timed("db.validate_user")
+def validate_user(username, password):
+    # Checks if username and password match. Legacy SHA-256 rows and rows
+    # hashed with weaker parameters are re-hashed after a successful check.
+    row = get_connection().execute(_SQL_SELECT_PASSWORD, (username,)).fetchone()
+    if not row:
+        # Same scrypt work as a real check, so the response time does not reveal unknown usernames
+        params = kdf_params()
+        kdf.hash_password(password, bytes(kdf.SALT_SIZE), params["n"], params["r"], params["p"])
+        return False
+    stored, salt, scheme, n, r, p = row
+    if scheme == "scrypt":
+        valid = kdf.verify_password(password, salt, bytes.fromhex(stored), n, r, p)
+        upgrade = valid and kdf.is_weaker({"n": n, "r": r, "p": p}, kdf_params())
+    else:
+        valid = upgrade = kdf.verify_legacy(password, stored)
+    if upgrade:
+        reset_password(username, password)
+    return valid
+
+
+@metrics.timed("db.reset_password")
+def reset_password(username, new_password):
+    # Updates password for a user (after forgot password)
+    conn = get_connection()
+    with conn:
+        conn.execute(_SQL_UPDATE_PASSWORD, (*_password_fields(new_password, kdf_params()), username))
+
+
+@metrics.timed("db.user_exists")
+def user_exists(username):
+    # Returns True if username is found in database
+    return get_connection().execute(_SQL_USER_EXISTS, (username,)).fetchone() is not None
@@ -0,0 +1,274 @@
+# === export.py - Decrypted export of vault files to a folder or an archive ===
+
+# Plaintext goes straight from the encrypted file to its destination: into
+# a chosen folder (several files at once, each written atomically), or into
+# one .zip / .tar / .tar.gz built on the fly. Nothing is decrypted into the
+# vault folder and no file is ever held in memory whole.
+#
+# An archive has to be written one member at a time, so the next few files
+# are decrypted ahead on their own threads (their chunks spread over the
+# vault's crypto pool) into small bounded queues. Memory stays at a few
+# chunks per file in flight (PIPE_DEPTH queued plus those being decrypted),
+# however large the files are.
+
+import io  # Base class for the pipe reader
+import os  # Paths
+import queue  # Bounded hand-off between a decrypting thread and the archive writer
+import shutil  # Streams plain files and pipes into the output
+import tarfile  # .tar / .tar.gz output
+import threading  # One decrypting thread per prefetched file
+import time  # Member timestamps
+import zipfile  # .zip output
+from collections import deque  # Files in flight, in output order
+from concurrent.futures import ThreadPoolExecutor  # Parallel folder export
+
+from cryptography.fernet import InvalidToken  # A damaged legacy (Fernet) file
+
+from crypto_util import INCOMPRESSIBLE_EXTENSIONS, atomic_output, decrypt_to, plaintext_size
+from file_index import file_type
+import metrics  # Optional timing of whole exports
+
+ARCHIVE_FORMATS = {".zip": "zip", ".tar": "tar", ".tar.gz": "tar.gz", ".tgz": "tar.gz"}
+PREFETCH_FILES = 2  # Files decrypted ahead of the one being added to an archive
+PIPE_DEPTH = 4  # Decrypted chunks buffered per prefetched file
+COPY_BLOCK = 1024 * 1024
+EXPORT_JOBS = 4  # Files decrypted at once into a folder
+ZIP_LEVEL = 1  # Deflate level for compressible members; fast, since the CPU also decrypts
+
+
+def archive_format(path):
+    # "zip", "tar" or "tar.gz" if `path` names an archive, else None (a folder)
+    lower = path.lower()
+    for suffix, fmt in ARCHIVE_FORMATS.items():
+        if lower.endswith(suffix):
+            return fmt
+    return None
+
+
+def member_names(vault, names):
+    # Output file name for every vault file: its original name (without
+    # ".enc"), made unique with " (2)", " (3)", ... where names collide
+    used, result = set(), []
+    for name in names:
+        entry = vault.index.get(name)
+        base = (entry and entry.original_name) or (name[:-4] if name.endswith(".enc") else name)
+        stem, ext = os.path.splitext(base)
+        candidate, n = base, 1
+        while candidate.lower() in used:
+            n += 1
+            candidate = f"{stem} ({n}){ext}"
+        used.add(candidate.lower())
+        result.append(candidate)
+    return result
+
+
+def _write_plain(vault, name, dst, progress=None):
+    # Writes the plaintext of vault file `name` to `dst`; files that were
+    # never encrypted (e.g. earlier decrypt results) are copied as they are
+    path = vault.path(name)
+    if name.endswith(".enc"):
+        decrypt_to(path, dst, pool=vault.pool, progress=progress)
+        return
+    with open(path, "rb") as src:
+        while True:
+            block = src.read(COPY_BLOCK)
+            if not block:
+                break
+            dst.write(block)
+            if progress:
+                progress(len(block))
+
+
+# ================= Folder Export =================
+@metrics.timed("export.file")
+def _export_one(vault, name, dest, progress):
+    with atomic_output(dest) as out:  # No half-written files in the target folder
+        _write_plain(vault, name, out, progress)
+
+
+def export_folder(vault, names, folder, jobs=EXPORT_JOBS, progress=None):
+    # Decrypts `names` into `folder`, `jobs` files at a time. Existing files
+    # there are not overwritten (the new copy gets a " (2)" suffix instead).
+    # Yields (name, output path, None or the error message) in input order.
+    os.makedirs(folder, exist_ok=True)
+    taken = set(os.listdir(folder))
+    targets = []
+    for member in member_names(vault, names):
+        stem, ext = os.path.splitext(member)
+        candidate, n = member, 1
+        while candidate in taken:
+            n += 1
+            candidate = f"{stem} ({n}){ext}"
+        taken.add(candidate)
+        targets.append(os.path.join(folder, candidate))
+
+    def export_one(name, dest):
+        try:
+            _export_one(vault, name, dest, progress)
+        except (ValueError, OSError, InvalidToken) as e:
+            return str(e) or type(e).__name__
+        return None
+
+    jobs = max(1, jobs)
+    with ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="vault-export") as files:
+        pending = deque()
+        try:
+            for name, dest in zip(names, targets):
+                pending.append((name, dest, files.submit(export_one, name, dest)))
+                if len(pending) >= 2 * jobs:
+                    name, dest, future = pending.popleft()
+                    yield name, dest, future.result()
+            while pending:
+                name, dest, future = pending.popleft()
+                yield name, dest, future.result()
+        finally:
+            for _name, _dest, future in pending:
+                future.cancel()
+
+
+# ================= Archive Export =================
+class _Stopped(Exception):
+    # Ends a decrypting thread whose pipe was closed early
+    pass
+
+
+class _QueueWriter:
+    # Write side handed to decrypt_to(); blocks while the pipe is full
+    def __init__(self, pipe):
+        self._pipe = pipe
+
+    def write(self, data):
+        self._pipe._put(bytes(data))
+        return len(data)
+
+
+class _DecryptPipe(io.RawIOBase):
+    # Readable plaintext of one vault file, decrypted ahead on its own thread.
+    # Errors from the decrypting side (damage, cancellation) surface in read().
+
+    def __init__(self, vault, name, progress=None, depth=PIPE_DEPTH):
+        super().__init__()
+        self._queue = queue.Queue(maxsize=depth)
+        self._stop = threading.Event()
+        self._view = memoryview(b"")
+        self._done = False
+        self._thread = threading.Thread(target=self._run, args=(vault, name, progress),
+                                        name="vault-export-pipe", daemon=True)
+        self._thread.start()
+
+    def _run(self, vault, name, progress):
+        try:
+            _write_plain(vault, name, _QueueWriter(self), progress)
+            item = None  # End of file
+        except _Stopped:
+            return
+        except BaseException as e:
+            item = e
+        try:
+            self._put(item)
+        except _Stopped:
+            pass
+
+    def _put(self, item):
+        while True:
+            if self._stop.is_set():
+                raise _Stopped()
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._view:
+            if self._done:
+                return 0
+            item = self._queue.get()
+            if item is None:
+                self._done = True
+                return 0
+            if isinstance(item, BaseException):
+                self._done = True
+                raise item
+            self._view = memoryview(item)
+        n = min(len(buffer), len(self._view))
+        buffer[:n] = self._view[:n]
+        self._view = self._view[n:]
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._stop.set()
+            while self._thread.is_alive():
+                try:
+                    self._queue.get(timeout=0.1)  # Unblock a writer waiting for room
+                except queue.Empty:
+                    pass
+        super().close()
+
+
+def _add_member(archive, fmt, vault, name, member, pipe):
+    entry = vault.index.get(name)
+    mtime = entry.mtime if entry else time.time()
+    if fmt == "zip":
+        info = zipfile.ZipInfo(member, date_time=time.localtime(max(mtime, 315532800))[:6])  # Zip dates start in 1980
+        stored = file_type(member) in INCOMPRESSIBLE_EXTENSIONS
+        info.compress_type = zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED
+        info.external_attr = 0o600 << 16
+        with archive.open(info, "w", force_zip64=True) as dst:
+            shutil.copyfileobj(pipe, dst, COPY_BLOCK)
+        return
+
+    # tar headers carry the size up front
+    size = entry.plain_size if entry and entry.plain_size is not None else None
+    if size is None and name.endswith(".enc"):
+        size = plaintext_size(vault.path(name))
+    elif size is None:
+        size = os.path.getsize(vault.path(name))
+    source = pipe
+    if size is None:  # Legacy file: no size without decrypting (it is decrypted in memory anyway)
+        source = io.BytesIO(pipe.read())
+        size = len(source.getvalue())
+    info = tarfile.TarInfo(member)
+    info.size, info.mtime, info.mode = size, int(mtime), 0o600
+    archive.addfile(info, source)
+    if source.read(1):
+        raise ValueError(f"{name} is larger than its recorded size")
+
+
+def export_archive(vault, names, archive_path, progress=None, prefetch=PREFETCH_FILES):
+    # Writes the plaintext of `names` into one archive (format from the file
+    # extension, see ARCHIVE_FORMATS). The archive only appears once every
+    # member was written; any damaged file fails the whole export. Yields
+    # (name, member name) after each member.
+    fmt = archive_format(archive_path)
+    if fmt is None:
+        raise ValueError(f"Unsupported archive type: {archive_path}")
+    pipes = deque()
+    with metrics.timer("export.archive"), atomic_output(archive_path) as out:
+        if fmt == "zip":
+            archive = zipfile.ZipFile(out, "w", compresslevel=ZIP_LEVEL)
+        else:
+            archive = tarfile.open(fileobj=out, mode="w:gz" if fmt == "tar.gz" else "w",
+                                   format=tarfile.PAX_FORMAT)
+        try:
+            with archive:
+                for name, member in zip(names, member_names(vault, names)):
+                    pipe = io.BufferedReader(_DecryptPipe(vault, name, progress), COPY_BLOCK)  # Full-size reads for tarfile
+                    pipes.append((name, member, pipe))
+                    if len(pipes) > prefetch:
+                        name, member, pipe = pipes.popleft()
+                        with pipe:
+                            _add_member(archive, fmt, vault, name, member, pipe)
+                        yield name, member
+                while pipes:
+                    name, member, pipe = pipes.popleft()
+                    with pipe:
+                        _add_member(archive, fmt, vault, name, member, pipe)
+                    yield name, member
+        finally:
+            for _name, _member, pipe in pipes:
+                pipe.close()
@@ -0,0 +1,206 @@
+# === file_index.py - Persistent metadata index for one user's vault folder ===
+
+import os  # Directory scans and stat calls
+import sqlite3  # The index is a small SQLite database inside the vault folder
+import stat  # Tells regular files from folders in update()
+import threading  # Jobs update the index from worker threads
+import time  # When a file was last checked by the scrubber
+from collections import namedtuple  # Row type handed to the dashboard
+
+from crypto_util import plaintext_size  # Plaintext size of .enc files found on disk
+import metrics  # Optional timing of folder scans
+
+INDEX_NAME = ".vault_index.db"  # Hidden, so it never shows up as a vault file
+
+# One row of the index. plain_size and checksum may be None when a file was
+# added outside the app and its contents were never read.
+FileEntry = namedtuple("FileEntry", "name original_name plain_size stored_size mtime type checksum")
+
+# Outcome of the latest integrity check of a file (see Vault.scrub). size and
+# mtime are the file's at check time; error is None when the file passed.
+CheckState = namedtuple("CheckState", "name stored_size mtime checked_at error")
+
+
+def is_vault_file(name):
+    # Dotfiles are internal: the index itself and temp files from atomic writes
+    return not name.startswith(".")
+
+
+def file_type(name):
+    # Lower-case extension without the dot ("" when there is none)
+    return os.path.splitext(name)[1][1:].lower()
+
+
+class FileIndex:
+    # Keeps name, sizes, mtime, type and checksum of every file in `folder`
+    # so listings are one SELECT instead of a stat() per file.
+
+    def __init__(self, folder):
+        self.folder = folder
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(folder, INDEX_NAME), check_same_thread=False)
+        self._conn.execute('''CREATE TABLE IF NOT EXISTS files (
+                                name TEXT PRIMARY KEY,
+                                original_name TEXT,
+                                plain_size INTEGER,
+                                stored_size INTEGER NOT NULL,
+                                mtime REAL NOT NULL,
+                                type TEXT NOT NULL,
+                                checksum TEXT
+                            )''')
+        self._conn.execute('''CREATE TABLE IF NOT EXISTS checks (
+                                name TEXT PRIMARY KEY,
+                                stored_size INTEGER NOT NULL,
+                                mtime REAL NOT NULL,
+                                checked_at REAL NOT NULL,
+                                error TEXT
+                            )''')
+        self._conn.commit()
+
+    # ===== Reading =====
+    @metrics.timed("index.entries")
+    def entries(self):
+        # All indexed files, sorted by name
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM files ORDER BY name").fetchall()
+        return [FileEntry(*row) for row in rows]
+
+    def get(self, name):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM files WHERE name=?", (name,)).fetchone()
+        return FileEntry(*row) if row else None
+
+    # ===== Writing =====
+    def record(self, name, original_name=None, plain_size=None, checksum=None):
+        # Adds or refreshes one file after the app wrote it (stats only that file)
+        st = os.stat(os.path.join(self.folder, name))
+        entry = FileEntry(name, original_name, plain_size, st.st_size, st.st_mtime, file_type(name), checksum)
+        with self._lock, self._conn:
+            self._upsert(entry)
+        return entry
+
+    def record_stats(self, name, original_name, stats):
+        # Convenience wrapper for the StreamStats returned by the crypto functions
+        return self.record(name, original_name, stats.plain_size, stats.checksum)
+
+    def remove(self, *names):
+        with self._lock, self._conn:
+            self._delete(names)
+
+    def _upsert(self, entry):
+        self._conn.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)", entry)
+
+    def _delete(self, names):
+        rows = [(n,) for n in names]
+        self._conn.executemany("DELETE FROM files WHERE name=?", rows)
+        self._conn.executemany("DELETE FROM checks WHERE name=?", rows)
+
+    # ===== Integrity Checks =====
+    # A check only counts while the file still has the size and mtime it had
+    # when it was checked; any change makes the file due again.
+    def due_checks(self, checked_before):
+        # .enc files that were never checked, changed since their last check, or
+        # were last checked before `checked_before` (a time.time() value).
+        # Never-checked and changed files come first, then the oldest checks.
+        with self._lock:
+            rows = self._conn.execute('''SELECT f.* FROM files f LEFT JOIN checks c ON c.name = f.name
+                                         WHERE f.type = 'enc' AND (c.name IS NULL OR c.stored_size != f.stored_size
+                                               OR c.mtime != f.mtime OR c.checked_at < ?)
+                                         ORDER BY CASE WHEN c.stored_size = f.stored_size AND c.mtime = f.mtime
+                                                       THEN c.checked_at ELSE 0 END, f.name''',
+                                      (checked_before,)).fetchall()
+        return [FileEntry(*row) for row in rows]
+
+    def record_check(self, name, stored_size, mtime, error=None):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO checks VALUES (?, ?, ?, ?, ?)",
+                               (name, stored_size, mtime, time.time(), error))
+
+    def failed_checks(self):
+        # CheckState of every file whose latest check failed and that has not changed since
+        with self._lock:
+            rows = self._conn.execute('''SELECT c.* FROM checks c JOIN files f ON f.name = c.name
+                                         WHERE c.error IS NOT NULL AND c.stored_size = f.stored_size
+                                               AND c.mtime = f.mtime ORDER BY c.name''').fetchall()
+        return [CheckState(*row) for row in rows]
+
+    # ===== Reconciling With The Disk =====
+    @metrics.timed("index.reconcile")
+    def reconcile(self):
+        # Brings the index in line with the folder using one os.scandir pass.
+        # Only files that are new or whose size/mtime changed are re-read.
+        # Returns (added, changed, removed) name lists.
+        with self._lock:
+            known = {row[0]: (row[1], row[2]) for row in
+                     self._conn.execute("SELECT name, stored_size, mtime FROM files")}
+
+        added, changed, fresh = [], [], []
+        with os.scandir(self.folder) as it:
+            for entry in it:
+                if not is_vault_file(entry.name) or not entry.is_file():
+                    continue
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue  # Vanished mid-scan; treated as removed below
+                previous = known.pop(entry.name, None)
+                if previous == (st.st_size, st.st_mtime):
+                    continue  # Unchanged: no further work
+                (changed if previous else added).append(entry.name)
+                fresh.append(self._scan_entry(entry.name, st))
+
+        removed = list(known)
+        with self._lock, self._conn:
+            for entry in fresh:
+                self._upsert(entry)
+            self._delete(removed)
+        return added, changed, removed
+
+    @metrics.timed("index.update")
+    def update(self, names):
+        # Re-checks only `names` against the disk (fed by the folder watcher).
+        # Returns (new or changed FileEntry rows, removed names); files whose
+        # size and mtime already match the index are skipped.
+        names = [name for name in set(names) if is_vault_file(name)]
+        with self._lock:
+            known = {}
+            for name in names:
+                row = self._conn.execute("SELECT stored_size, mtime FROM files WHERE name=?", (name,)).fetchone()
+                if row:
+                    known[name] = row
+
+        fresh, removed = [], []
+        for name in names:
+            try:
+                st = os.stat(os.path.join(self.folder, name))
+                exists = stat.S_ISREG(st.st_mode)
+            except FileNotFoundError:
+                exists = False
+            if not exists:
+                if name in known:
+                    removed.append(name)
+            elif known.get(name) != (st.st_size, st.st_mtime):
+                fresh.append(self._scan_entry(name, st))
+
+        with self._lock, self._conn:
+            for entry in fresh:
+                self._upsert(entry)
+            self._delete(removed)
+        return fresh, removed
+
+    def _scan_entry(self, name, st):
+        # Builds a row for a file that appeared on disk without going through the app
+        ftype = file_type(name)
+        if ftype == "enc":
+            try:
+                plain = plaintext_size(os.path.join(self.folder, name))
+            except (OSError, ValueError):
+                plain = None  # Damaged file: still listed, size unknown
+            original = name[:-4]
+        else:
+            plain, original = st.st_size, name
+        return FileEntry(name, original, plain, st.st_size, st.st_mtime, ftype, None)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,145 @@
+# === file_records.py - Typed in-memory records behind the file table ===
+
+# The dashboard used to sort by parsing its own display strings back out of
+# the Treeview ("2 kB" sorted below "900 Bytes"). Rows are now backed by raw
+# values, and each sortable column keeps a presorted list of names that is
+# built once and then patched as records are added or removed.
+
+import bisect  # Keeps cached sort orders up to date on single changes
+
+
+class FileRecord:
+    # Raw, typed values for one vault file (slots keep 200k of these small)
+    __slots__ = ("name", "type", "size", "mtime")
+
+    def __init__(self, name, type, size, mtime):
+        self.name = name  # File name as stored in the vault folder
+        self.type = type  # Lower-case extension, e.g. "enc"
+        self.size = size  # Bytes on disk
+        self.mtime = mtime  # Epoch seconds
+
+
+def record_from_entry(entry):
+    # FileRecord for a file_index.FileEntry row
+    return FileRecord(entry.name, entry.type, entry.stored_size, entry.mtime)
+
+
+# Columns the table can be sorted by
+SORT_COLUMNS = ("name", "type", "size", "mtime")
+
+# Sort dropdown labels -> (column, descending)
+SORT_CRITERIA = {
+    "Name (A-Z)": ("name", False),
+    "Name (Z-A)": ("name", True),
+    "Date Modified (Newest)": ("mtime", True),
+    "Date Modified (Oldest)": ("mtime", False),
+    "Size (Largest)": ("size", True),
+    "Size (Smallest)": ("size", False),
+    "Type (A-Z)": ("type", False),
+    "Type (Z-A)": ("type", True),
+}
+
+
+def _high_to_low(value):
+    # Ascending key that orders column values high to low: negated numbers,
+    # or negated code points for strings (the trailing 1 puts "ab" before "a")
+    if isinstance(value, str):
+        return tuple(-ord(c) for c in value) + (1,)
+    return -value
+
+
+class RecordStore:
+    # All FileRecords of one vault plus lazily built per-column sort orders.
+    # put() and remove() patch the cached orders in place (a bisect per
+    # column), so a handful of changes never triggers a full re-sort.
+    # Descending orders are cached separately: equal values still list
+    # their names A-Z, which the reversed ascending list would not.
+
+    def __init__(self, entries=()):
+        self.records = {}
+        self._orders = {}  # (column, descending) -> names in that order
+        self._ranks = {}  # (column, descending) -> {name: rank}, rebuilt on demand after changes
+        self.load(entries)
+
+    def __len__(self):
+        return len(self.records)
+
+    def load(self, entries):
+        # Replaces everything with file_index.FileEntry rows
+        self.records = {e.name: record_from_entry(e) for e in entries}
+        self._orders.clear()
+        self._ranks.clear()
+
+    def put(self, record):
+        # Adds or replaces one record
+        if record.name in self.records:
+            self._unlink(record.name)
+        self.records[record.name] = record
+        for (column, descending), names in self._orders.items():
+            key = self._sort_key(column, descending)
+            names.insert(bisect.bisect_right(names, key(record.name), key=key), record.name)
+        self._ranks.clear()
+
+    def remove(self, name):
+        if name in self.records:
+            self._unlink(name)
+            del self.records[name]
+            self._ranks.clear()
+
+    def _unlink(self, name):
+        # Drops `name` from every cached order (while its record still exists)
+        for (column, descending), names in self._orders.items():
+            key = self._sort_key(column, descending)
+            i = bisect.bisect_left(names, key(name), key=key)
+            del names[i]
+
+    def _sort_key(self, column, descending=False):
+        # Key of a cached order: the column value, ties broken alphabetically by name
+        if column == "name":
+            return lambda n: (n.lower(), n)
+        records = self.records
+        if descending:
+            return lambda n: (_high_to_low(getattr(records[n], column)), n.lower(), n)
+        return lambda n: (getattr(records[n], column), n.lower(), n)
+
+    def _sorted(self, column, descending=False):
+        # Cached name list for `column`; "name" is only cached ascending (see arrange)
+        if column not in SORT_COLUMNS:
+            raise ValueError(f"Unknown sort column: {column}")
+        names = self._orders.get((column, descending))
+        if names is None:
+            if column == "name":
+                names = sorted(self.records, key=self._sort_key("name"))
+            else:
+                # Stable sort of the name order (reverse=True keeps ties in
+                # input order too), so equal values stay alphabetical
+                records = self.records
+                names = sorted(self._sorted("name"), key=lambda n: getattr(records[n], column),
+                               reverse=descending)
+            self._orders[(column, descending)] = names
+        return names
+
+    def order(self, column, descending=False):
+        # Names sorted by `column`, plus each name's rank in that list. The
+        # descending name order is the ascending one, read back to front.
+        descending = descending and column != "name"
+        names = self._sorted(column, descending)
+        rank = self._ranks.get((column, descending))
+        if rank is None:
+            rank = self._ranks[(column, descending)] = {name: i for i, name in enumerate(names)}
+        return names, rank
+
+    def arrange(self, column, descending=False, subset=None):
+        # Names in display order; `subset` (a set) limits the result to those names
+        backwards = descending and column == "name"  # Names are unique: Z-A is A-Z reversed
+        cached = descending and not backwards
+        if subset is None:
+            result = list(self._sorted(column, cached))
+        elif len(subset) * 8 < len(self.records):
+            rank = self.order(column, cached)[1]
+            result = sorted(subset, key=rank.__getitem__)  # Few matches: sort just them
+        else:
+            result = [name for name in self._sorted(column, cached) if name in subset]
+        if backwards:
+            result.reverse()
+        return result
@@ -0,0 +1,200 @@
+# === folder_watch.py - Change feed for a vault folder ===
+
+# Reports which file names in a folder were created, modified, renamed or
+# deleted, so the dashboard only refreshes those rows. On Linux the kernel's
+# inotify interface is used (through ctypes, no extra packages). Elsewhere,
+# or if inotify is unavailable, a background thread polls instead: it checks
+# the folder's own mtime every POLL_INTERVAL_S and only scans the folder when
+# that changed (or every FULL_SCAN_S, to catch files edited in place).
+#
+# Events are coalesced: changes() hands out the accumulated names only once
+# the folder has been quiet for SETTLE_S (or MAX_DELAY_S has passed), so a
+# bulk import of thousands of files becomes a few batches, not thousands.
+
+import ctypes  # inotify system calls
+import ctypes.util  # Locates libc
+import errno  # Distinguishes "no events" from real errors
+import os  # scandir / stat for the polling fallback
+import select  # Waits on the inotify descriptor with a timeout
+import struct  # Parses inotify event records
+import sys  # Platform check
+import threading  # Watching happens off the GUI thread
+import time  # Settle timing and poll intervals
+
+from file_index import is_vault_file  # Same notion of "internal file" as the index
+import metrics  # Optional timing of polling scans
+
+POLL_INTERVAL_S = 1.0  # Polling fallback: how often the folder mtime is checked
+FULL_SCAN_S = 30.0  # Polling fallback: rescan even if the folder mtime is unchanged
+SETTLE_S = 0.3  # Report once no new event arrived for this long...
+MAX_DELAY_S = 1.0  # ...but never hold changes back longer than this
+
+# inotify constants from <sys/inotify.h>
+_IN_ATTRIB = 0x00000004
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_MOVE_SELF = 0x00000800
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_WATCH_MASK = (_IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE
+               | _IN_DELETE | _IN_DELETE_SELF | _IN_MOVE_SELF)
+_EVENT = struct.Struct("iIII")  # wd, mask, cookie, name length
+
+
+@metrics.timed("watch.scan")
+def _snapshot(folder):
+    # {name: (size, mtime_ns)} for the vault files in `folder`
+    result = {}
+    with os.scandir(folder) as it:
+        for entry in it:
+            if not is_vault_file(entry.name):
+                continue
+            try:
+                if entry.is_file():
+                    st = entry.stat()
+                    result[entry.name] = (st.st_size, st.st_mtime_ns)
+            except FileNotFoundError:
+                pass
+    return result
+
+
+class _Inotify:
+    # Minimal inotify wrapper: one watch on one folder
+
+    def __init__(self, folder):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(self.fd, os.fsencode(folder), _WATCH_MASK) < 0:
+            err = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(err, "inotify_add_watch failed")
+
+    def read(self, timeout):
+        # Returns (names, lost) after waiting up to `timeout` seconds; `lost`
+        # means the kernel dropped events or the folder itself went away
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        names, lost = set(), False
+        if not ready:
+            return names, lost
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except OSError as e:
+            if e.errno == errno.EAGAIN:
+                return names, lost
+            raise
+        offset = 0
+        while offset < len(data):
+            _wd, mask, _cookie, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            if mask & (_IN_Q_OVERFLOW | _IN_IGNORED | _IN_DELETE_SELF | _IN_MOVE_SELF):
+                lost = True
+            elif name:
+                names.add(os.fsdecode(name))
+        return names, lost
+
+    def close(self):
+        os.close(self.fd)
+
+
+class FolderWatcher:
+    # Watches one folder on a daemon thread; the GUI thread collects batches
+    # with changes(). `backend` is "inotify" or "poll" (read-only, for display).
+
+    def __init__(self, folder, use_inotify=True):
+        self.folder = folder
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._rescan = False  # Events were lost: the caller must reconcile everything
+        self._first_event = None  # When the oldest unreported change arrived
+        self._last_event = None
+        self._stop = threading.Event()
+
+        self._inotify = None
+        if use_inotify and sys.platform.startswith("linux"):
+            try:
+                self._inotify = _Inotify(folder)
+            except (OSError, AttributeError):
+                self._inotify = None  # e.g. watch limit reached: poll instead
+        self.backend = "inotify" if self._inotify else "poll"
+        self._thread = threading.Thread(target=self._run, name="vault-watch", daemon=True)
+        self._thread.start()
+
+    # ===== GUI Side =====
+    def changes(self):
+        # Names changed since the last call once the folder has settled, [] if
+        # nothing is ready yet, or None if events were lost and a full
+        # reconcile is needed
+        now = time.monotonic()
+        with self._lock:
+            if self._first_event is None:
+                return []
+            if now - self._last_event < SETTLE_S and now - self._first_event < MAX_DELAY_S:
+                return []
+            names, rescan = self._pending, self._rescan
+            self._pending, self._rescan = set(), False
+            self._first_event = self._last_event = None
+        return None if rescan else [name for name in names if is_vault_file(name)]
+
+    def close(self):
+        self._stop.set()
+        self._thread.join(timeout=2)
+        if self._inotify:
+            self._inotify.close()
+
+    # ===== Watcher Thread =====
+    def _report(self, names, lost=False):
+        if not names and not lost:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._pending |= names
+            self._rescan = self._rescan or lost
+            if self._first_event is None:
+                self._first_event = now
+            self._last_event = now
+
+    def _run(self):
+        if self._inotify:
+            while not self._stop.is_set():
+                try:
+                    names, lost = self._inotify.read(POLL_INTERVAL_S)
+                except OSError:
+                    self._report(set(), lost=True)  # Watch broke: rescan, then keep polling
+                    break
+                self._report(names, lost)
+                if lost and not os.path.isdir(self.folder):
+                    return
+            if self._stop.is_set():
+                return
+        self._poll()
+
+    def _poll(self):
+        try:
+            known = _snapshot(self.folder)
+            folder_mtime = os.stat(self.folder).st_mtime_ns
+        except OSError:
+            return
+        last_scan = time.monotonic()
+        while not self._stop.wait(POLL_INTERVAL_S):
+            try:
+                mtime = os.stat(self.folder).st_mtime_ns
+                if mtime == folder_mtime and time.monotonic() - last_scan < FULL_SCAN_S:
+                    continue
+                current = _snapshot(self.folder)
+            except OSError:
+                continue
+            folder_mtime, last_scan = mtime, time.monotonic()
+            changed = {name for name, sig in current.items() if known.get(name) != sig}
+            changed |= known.keys() - current.keys()
+            known = current
+            self._report(changed)
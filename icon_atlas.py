@@ -0,0 +1,111 @@
+# === icon_atlas.py - File-type icons, pre-resized into one cached image ===
+
+# The table used to open and LANCZOS-resize a PNG with PIL the first time
+# each extension was shown. Now every icon is resized once into a single
+# strip ("atlas") saved in the user's cache folder. Later launches load that
+# strip with Tk's built-in PNG reader (no PIL import at all) and cut the
+# per-extension images out of it. The cache name includes the icon size and
+# the source files' sizes and mtimes, so changed icons rebuild automatically.
+
+import hashlib  # Cache key
+import os  # Paths and the atomic cache write
+import tkinter as tk  # PhotoImage
+
+import metrics  # Counts icon load failures
+from utils import resource_path  # Icons live next to the app (or inside the .exe)
+
+ICON_SIZE = (18, 18)  # Icon size for files
+
+# Extension -> source icon; anything else gets DEFAULT_ICON
+ICON_FILES = {
+    "pdf": "icons/pdf.png",
+    "doc": "icons/doc.png",
+    "docx": "icons/doc.png",
+    "xlsx": "icons/excel.png",
+    "mp4": "icons/video.png",
+    "mp3": "icons/audio.png",
+    "zip": "icons/zip.png",
+    "enc": "icons/lock.png",
+}
+DEFAULT_ICON = "icons/file.png"
+
+
+def _cache_dir():
+    base = os.environ.get("LOCALAPPDATA") if os.name == "nt" else os.environ.get("XDG_CACHE_HOME")
+    return os.path.join(base or os.path.expanduser(os.path.join("~", ".cache")), "securevault")
+
+
+def _sources():
+    # Distinct source files in atlas order (slot i holds _sources()[i])
+    return sorted(set(ICON_FILES.values()) | {DEFAULT_ICON})
+
+
+def atlas_path():
+    # Where the atlas for the current icon files and size is cached
+    digest = hashlib.sha1(repr(ICON_SIZE).encode())
+    for rel in _sources():
+        digest.update(rel.encode())
+        try:
+            st = os.stat(resource_path(rel))
+            digest.update(f"{st.st_size}:{st.st_mtime_ns}".encode())
+        except OSError:
+            digest.update(b"missing")
+    width, height = ICON_SIZE
+    return os.path.join(_cache_dir(), f"icons-{width}x{height}-{digest.hexdigest()[:12]}.png")
+
+
+def build_atlas(path):
+    # Resizes every source icon into one transparent strip and saves it as PNG
+    from PIL import Image  # Only needed when the cache is cold
+    width, height = ICON_SIZE
+    sources = _sources()
+    strip = Image.new("RGBA", (width * len(sources), height), (0, 0, 0, 0))
+    for slot, rel in enumerate(sources):
+        try:
+            with Image.open(resource_path(rel)) as image:
+                icon = image.convert("RGBA").resize(ICON_SIZE, Image.Resampling.LANCZOS)
+            strip.paste(icon, (slot * width, 0))
+        except Exception as e:
+            print(f"[Icon Load Error] {rel}: {e}")
+            metrics.count("icons.load_errors")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    strip.save(tmp, "PNG")
+    os.replace(tmp, path)  # Another instance may be building the same file
+
+
+class IconAtlas:
+    # Per-extension PhotoImages cut from the cached atlas; loaded on first use
+
+    def __init__(self, master):
+        self.master = master
+        self._atlas = None
+        self._failed = False
+        self._by_extension = {}
+
+    @metrics.timed("icons.load_atlas")
+    def _load(self):
+        path = atlas_path()
+        if not os.path.exists(path):
+            build_atlas(path)
+        self._atlas = tk.PhotoImage(master=self.master, file=path)
+
+    def get(self, extension):
+        # PhotoImage for a file extension, or None if the icons can't be loaded
+        icon = self._by_extension.get(extension)
+        if icon is not None or self._failed:
+            return icon
+        if self._atlas is None:
+            try:
+                self._load()
+            except Exception as e:
+                print(f"[Icon Load Error] atlas: {e}")
+                metrics.count("icons.load_errors")
+                self._failed = True
+                return None
+        width, height = ICON_SIZE
+        slot = _sources().index(ICON_FILES.get(extension, DEFAULT_ICON))
+        icon = tk.PhotoImage(master=self.master, width=width, height=height)
+        icon.tk.call(icon, "copy", self._atlas, "-from", slot * width, 0, (slot + 1) * width, height)
+        self._by_extension[extension] = icon
+        return icon
@@ -0,0 +1,134 @@
+# === jobs.py - Background job scheduler for long vault operations ===
+
+import itertools  # Used to hand out job ids
+import queue  # Thread-safe hand-off of finished jobs back to the GUI thread
+import threading  # Cancel flags shared between the GUI and worker threads
+import time  # Used to measure throughput
+from concurrent.futures import ThreadPoolExecutor  # Pool that runs the jobs
+
+from crypto_util import make_pool, DEFAULT_WORKERS  # Shared pool for chunk-level crypto work
+
+# Job states shown in the dashboard
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "Queued", "Running", "Done", "Failed", "Cancelled"
+
+# How many files are processed at the same time. Each file also spreads its
+# chunks over the shared crypto pool, so this mostly hides per-file I/O latency.
+DEFAULT_FILE_WORKERS = 4
+
+
+class JobCancelled(Exception):
+    # Raised inside a job (from its progress callback) once it has been cancelled
+    pass
+
+
+class Job:
+    # One unit of background work (usually one file) plus its progress counters
+
+    _ids = itertools.count(1)
+
+    def __init__(self, label, total=0, on_done=None):
+        self.id = next(Job._ids)
+        self.label = label  # Text shown in the job list
+        self.total = total  # Expected number of bytes (0 if unknown)
+        self.done = 0  # Bytes processed so far
+        self.status = QUEUED
+        self.error = None  # Exception message when the job failed
+        self.result = None  # Whatever the job function returned
+        self.on_done = on_done  # Called on the GUI thread when the job finishes
+        self.started = None
+        self.finished = None
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        # Ask the job to stop; it notices on its next progress report
+        self._cancel.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def progress(self, nbytes):
+        # Progress callback handed to the crypto routines (runs on a worker thread)
+        self.done += nbytes
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    @property
+    def fraction(self):
+        # Completed share between 0.0 and 1.0
+        if self.status == DONE:
+            return 1.0
+        return min(self.done / self.total, 1.0) if self.total else 0.0
+
+    @property
+    def throughput(self):
+        # Average bytes per second since the job started
+        if not self.started:
+            return 0.0
+        elapsed = (self.finished or time.monotonic()) - self.started
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+
+class JobScheduler:
+    # Runs jobs on a small thread pool and reports finished jobs back to Tk.
+    #
+    # Worker threads never touch widgets: finished jobs are put on a queue and
+    # `poll()` (called from the Tk main loop via after()) runs their callbacks.
+
+    def __init__(self, file_workers=DEFAULT_FILE_WORKERS, crypto_workers=DEFAULT_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=file_workers, thread_name_prefix="vault-job")
+        self.crypto_pool = make_pool(crypto_workers)  # Shared by all jobs for chunk encryption
+        self._finished = queue.Queue()
+        self.jobs = []  # Every job submitted in this session, oldest first
+
+    def submit(self, label, fn, total=0, on_done=None):
+        # Schedules fn(job) in the background and returns the Job right away
+        job = Job(label, total, on_done)
+        self.jobs.append(job)
+        self._executor.submit(self._run, job, fn)
+        return job
+
+    def _run(self, job, fn):
+        if job.cancelled:  # Cancelled while still waiting in the queue
+            job.status = CANCELLED
+        else:
+            job.status = RUNNING
+            job.started = time.monotonic()
+            try:
+                job.result = fn(job)
+                job.status = DONE
+            except JobCancelled:
+                job.status = CANCELLED
+            except Exception as e:
+                job.status = FAILED
+                job.error = str(e)
+            job.finished = time.monotonic()
+        self._finished.put(job)
+
+    def poll(self):
+        # Runs callbacks of jobs that finished since the last call (GUI thread only)
+        finished = []
+        while True:
+            try:
+                job = self._finished.get_nowait()
+            except queue.Empty:
+                break
+            finished.append(job)
+            if job.on_done:
+                job.on_done(job)
+        return finished
+
+    def active(self):
+        # Jobs that are still queued or running
+        return [job for job in self.jobs if job.status in (QUEUED, RUNNING)]
+
+    def clear_finished(self):
+        # Forget jobs that are no longer active
+        self.jobs = self.active()
+
+    def shutdown(self):
+        # Cancel everything that is left and stop the worker threads
+        for job in self.active():
+            job.cancel()
+        self._executor.shutdown(wait=True)
+        self.crypto_pool.shutdown(wait=True)
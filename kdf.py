@@ -0,0 +1,82 @@
+# === kdf.py - Salted, memory-hard password hashing (scrypt) ===
+
+import hashlib  # scrypt and the legacy SHA-256 hash
+import hmac  # Constant-time comparison of hashes
+import os  # Random salts
+import time  # Used by the calibration benchmark
+
+TARGET_LOGIN_MS = 250  # How long one password check should take on this machine
+SALT_SIZE = 16
+HASH_SIZE = 32
+
+# Bounds for the calibration search (N must be a power of two)
+MIN_N = 2 ** 12
+MAX_N = 2 ** 20
+DEFAULT_PARAMS = {"n": 2 ** 14, "r": 8, "p": 1}  # Used until calibration has run
+
+
+def memory_cost(params):
+    # Bytes one scrypt call with these parameters works in (128 * r * N)
+    return 128 * params["r"] * params["n"]
+
+
+def _maxmem(n, r):
+    # scrypt needs about 128 * r * N bytes; leave head room above that
+    return memory_cost({"n": n, "r": r}) * 2 + 1024 * 1024
+
+
+def hash_password(password, salt, n, r, p):
+    # Derives the stored hash for `password` with the given salt and cost parameters
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                          maxmem=_maxmem(n, r), dklen=HASH_SIZE)
+
+
+def new_hash(password, params):
+    # Hashes a password with a fresh random salt; returns (salt, hash)
+    salt = os.urandom(SALT_SIZE)
+    return salt, hash_password(password, salt, params["n"], params["r"], params["p"])
+
+
+def verify_password(password, salt, stored, n, r, p):
+    # True when `password` produces `stored` (constant-time compare)
+    return hmac.compare_digest(hash_password(password, salt, n, r, p), stored)
+
+
+def legacy_hash(password):
+    # Unsalted SHA-256 hex digest used by accounts created before scrypt
+    return hashlib.sha256(password.encode()).hexdigest()
+
+
+def verify_legacy(password, stored):
+    return hmac.compare_digest(legacy_hash(password), stored)
+
+
+def is_weaker(params, target):
+    # True if hashes made with `params` are cheaper than `target` and should be upgraded
+    return params["n"] * params["r"] * params["p"] < target["n"] * target["r"] * target["p"]
+
+
+# ======== CALIBRATION ========
+def time_params(n, r=8, p=1, rounds=2):
+    # Best-of-`rounds` time in milliseconds for one scrypt call with these parameters
+    salt = os.urandom(SALT_SIZE)
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        hash_password("calibration", salt, n, r, p)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def calibrate(target_ms=TARGET_LOGIN_MS, r=8, p=1):
+    # Picks the largest N (doubling from MIN_N) whose scrypt time stays within
+    # `target_ms` on this machine. Returns params plus the measured time.
+    n = MIN_N
+    elapsed = time_params(n, r, p)
+    while n < MAX_N:
+        # scrypt time grows linearly with N, so doubling roughly doubles the time
+        if elapsed * 2 > target_ms:
+            break
+        n *= 2
+        elapsed = time_params(n, r, p)
+    return {"n": n, "r": r, "p": p, "measured_ms": round(elapsed, 1), "target_ms": target_ms}
@@ -1,86 +1,20 @@
 # 🔐 Secure Vault - Final Working login_window.py (fixed to open dashboard)
 
 # ======== IMPORTS ========
+import time  # Startup and window-switch timings
+_STARTED = time.perf_counter()  # Taken before anything heavy is imported
+
 import tkinter as tk  # Used to build the GUI (buttons, labels, input fields)
 from tkinter import messagebox, simpledialog  # For popup alerts and input boxes
-import sqlite3  # To connect and manage SQLite database
-import hashlib  # For password hashing (security)
-import os  # To handle file paths
-import sys  # Used for correct file access (important for .exe)
-import dashboard  # Import the dashboard to open after login
-
-# ======== UTILITY FUNCTION ========
-def resource_path(relative_path):
-    # Finds correct path of files (helps when app is converted to .exe)
-    try:
-        base_path = sys._MEIPASS  # Used when running from .exe
-    except Exception:
-        base_path = os.path.abspath(".")  # Used during normal development
-    return os.path.join(base_path, relative_path)  # Combines folder path with filename
-
-# ======== PASSWORD HASHING ========
-def hash_password(password):
-    # Converts normal password into a secure hashed string
-    return hashlib.sha256(password.encode()).hexdigest()
-
-# ======== DATABASE SETUP ========
-def init_db():
-    # Initializes or creates the users database
-    db_path = resource_path("users.db")  # Get the correct file path
-    print("Looking for users.db at:", db_path)  # Helps debug location issue
-
-    conn = sqlite3.connect(db_path)  # Connect to database
-    c = conn.cursor()  # Create cursor to run SQL commands
-    c.execute('''CREATE TABLE IF NOT EXISTS users (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    username TEXT UNIQUE NOT NULL,
-                    password TEXT NOT NULL
-                )''')  # Create table if not already there
-    conn.commit()  # Save changes
-    conn.close()  # Close connection
-
-# ======== REGISTER A NEW USER ========
-def register_user(username, password):
-    # Tries to add a new user with hashed password
-    conn = sqlite3.connect(resource_path("users.db"))
-    c = conn.cursor()
-    try:
-        c.execute("INSERT INTO users (username, password) VALUES (?, ?)", (username, hash_password(password)))
-        conn.commit()
-        return True  # Registration successful
-    except sqlite3.IntegrityError:
-        return False  # Username already exists
-    finally:
-        conn.close()
-
-# ======== VALIDATE LOGIN CREDENTIALS ========
-def validate_user(username, password):
-    # Checks if username and password match
-    conn = sqlite3.connect(resource_path("users.db"))
-    c = conn.cursor()
-    c.execute("SELECT password FROM users WHERE username=?", (username,))
-    row = c.fetchone()  # Get one matching row
-    conn.close()
-    return row and row[0] == hash_password(password)  # Return True if password matches
-
-# ======== RESET USER PASSWORD ========
-def reset_password(username, new_password):
-    # Updates password for a user (after forgot password)
-    conn = sqlite3.connect(resource_path("users.db"))
-    c = conn.cursor()
-    c.execute("UPDATE users SET password=? WHERE username=?", (hash_password(new_password), username))
-    conn.commit()
-    conn.close()
-
-# ======== CHECK IF USER EXISTS ========
-def user_exists(username):
-    # Returns True if username is found in database
-    conn = sqlite3.connect(resource_path("users.db"))
-    c = conn.cursor()
-    c.execute("SELECT 1 FROM users WHERE username=?", (username,))
-    exists = c.fetchone() is not None
-    conn.close()
-    return exists
+from db import (init_db, prepare_kdf_params, register_user, validate_user, reset_password, user_exists,
+                close_all)  # users.db access
+import metrics  # Records how long startup and logout take
+# The dashboard (PIL, crypto, humanize, ...) is imported only after a successful login
+
+# The whole app runs under one Tk root: the login form and the dashboard are
+# swapped inside it, so logging out never starts a new interpreter.
+login_win = None  # The single Tk root
+login_frame = None  # Container of the login form while it is shown
 
 # ======== OPEN DASHBOARD AFTER LOGIN ========
 def open_dashboard(username):
@@ -88,10 +22,12 @@ def open_dashboard(username):
     with open(".logged_in_user", "w") as f:
         f.write(username)
 
-    login_win.destroy()  # Close the login window
+    started = time.perf_counter()
+    login_frame.destroy()  # Remove the login form; the root window stays
 
     import dashboard
-    dashboard.open_dashboard_window(username)  # Open dashboard with username
+    dashboard.open_dashboard_window(username, login_win, on_logout=show_login)  # Open dashboard with username
+    login_win.after_idle(lambda: metrics.milestone("ui.login_to_dashboard", time.perf_counter() - started))
 
 # ======== GUI FUNCTION - LOGIN BUTTON ========
 def attempt_login():
@@ -122,31 +58,52 @@ def forgot_password():
     else:
         messagebox.showerror("Error", "User not found")  # If user doesn't exist
 
-# ======== CREATE LOGIN WINDOW ========
-login_win = tk.Tk()  # Create the main login window
-login_win.title("\U0001F510 Secure Vault Login")  # Title with lock emoji
-login_win.geometry("300x250")  # Window size
-
-init_db()  # Create users table if not present
-
-# ======== FORM FRAME (USERNAME + PASSWORD FIELDS) ========
-frame = tk.Frame(login_win)  # Create a container box
-frame.pack(pady=30)  # Add space above and below the frame
-
-# Label and Entry for Username
-tk.Label(frame, text="Username:").grid(row=0, column=0, sticky="w")  # Text label
-username_entry = tk.Entry(frame)  # Input box
-username_entry.grid(row=0, column=1)  # Place in 1st row, 2nd column
-
-# Label and Entry for Password
-tk.Label(frame, text="Password:").grid(row=1, column=0, sticky="w")  # Text label
-password_entry = tk.Entry(frame, show="*")  # Password input (masked with *)
-password_entry.grid(row=1, column=1)
-
-# ======== BUTTONS (LOGIN, REGISTER, FORGOT PASSWORD) ========
-tk.Button(login_win, text="Login", command=attempt_login).pack(pady=5)  # Login button
-tk.Button(login_win, text="Register", command=attempt_register).pack(pady=5)  # Register button
-tk.Button(login_win, text="Forgot Password", command=forgot_password).pack(pady=5)  # Forgot Password button
+# ======== LOGIN FORM ========
+def show_login(started=None):
+    # Builds the login form in the root window (at startup and after logout).
+    # `started` is when the switch began, for the logout-to-login timing.
+    global login_frame, username_entry, password_entry
+    login_win.title("\U0001F510 Secure Vault Login")  # Title with lock emoji
+    login_win.geometry("300x250")  # Window size
+    login_win.protocol("WM_DELETE_WINDOW", login_win.destroy)
+
+    login_frame = tk.Frame(login_win)
+    login_frame.pack(fill=tk.BOTH, expand=True)
+
+    # ======== FORM FRAME (USERNAME + PASSWORD FIELDS) ========
+    frame = tk.Frame(login_frame)  # Create a container box
+    frame.pack(pady=30)  # Add space above and below the frame
+
+    # Label and Entry for Username
+    tk.Label(frame, text="Username:").grid(row=0, column=0, sticky="w")  # Text label
+    username_entry = tk.Entry(frame)  # Input box
+    username_entry.grid(row=0, column=1)  # Place in 1st row, 2nd column
+
+    # Label and Entry for Password
+    tk.Label(frame, text="Password:").grid(row=1, column=0, sticky="w")  # Text label
+    password_entry = tk.Entry(frame, show="*")  # Password input (masked with *)
+    password_entry.grid(row=1, column=1)
+
+    # ======== BUTTONS (LOGIN, REGISTER, FORGOT PASSWORD) ========
+    tk.Button(login_frame, text="Login", command=attempt_login).pack(pady=5)  # Login button
+    tk.Button(login_frame, text="Register", command=attempt_register).pack(pady=5)  # Register button
+    tk.Button(login_frame, text="Forgot Password", command=forgot_password).pack(pady=5)  # Forgot Password button
+
+    username_entry.focus_set()
+    if started is not None:
+        login_win.after_idle(lambda: metrics.milestone("ui.logout_to_login", time.perf_counter() - started))
 
 # ======== RUN THE APP ========
-login_win.mainloop()  # Keep the window open and wait for user actions
+def main():
+    global login_win
+    login_win = tk.Tk()  # Create the main window (reused by the dashboard)
+    init_db()  # Create users table if not present
+    prepare_kdf_params()  # First run: calibrate scrypt while the form is shown, not on the first click
+    show_login()
+    # Measured once the form has actually been drawn
+    login_win.after_idle(lambda: metrics.milestone("startup.login_form", time.perf_counter() - _STARTED))
+    login_win.mainloop()  # Keep the window open and wait for user actions
+    close_all()  # Close database connections once the window is gone
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+# === metrics.py - Lightweight timing and counters for diagnostics ===
+
+# Instrumented operations (crypto streams, users.db calls, folder scans,
+# table rebuilds) report here. For every operation name the registry keeps a
+# call count, total and per-call latency histogram, bytes processed and
+# failures; plain events (e.g. icon load errors) are simple counters, and
+# milestones (startup, logout-to-login) keep their latest duration.
+#
+# Off by default. While disabled, an instrumented call costs one flag check,
+# so it is safe to leave the decorators on hot paths. Turn it on with
+# enable(), the dashboard's Diagnostics window, or SECUREVAULT_METRICS=1.
+# With SECUREVAULT_METRICS_FILE=path the registry is also written there every
+# few seconds (Prometheus text if the path ends in .prom, JSON otherwise) for
+# a local scraper to pick up.
+
+import atexit  # Final dump when the process exits
+import functools  # Keeps the wrapped function's name and docs
+import json  # JSON dump format
+import os  # Environment switches and atomic dump writes
+import threading  # Registry lock and the dump thread
+import time  # perf_counter for latencies
+
+# Histogram bucket upper bounds in seconds (a final +Inf bucket is implied)
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+DUMP_INTERVAL_S = 5.0
+PREFIX = "securevault"  # Prometheus metric name prefix
+
+_enabled = os.environ.get("SECUREVAULT_METRICS", "") not in ("", "0")
+_lock = threading.Lock()
+_ops = {}  # name -> _Op
+_events = {}  # name -> count
+_milestones = {}  # name -> seconds, latest occurrence (kept even while disabled)
+_started = time.time()
+
+
+class _Op:
+    # Statistics for one operation name
+    __slots__ = ("count", "errors", "seconds", "bytes", "max", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.bytes = 0
+        self.max = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+
+    def add(self, seconds, nbytes, failed):
+        self.count += 1
+        self.errors += failed
+        self.seconds += seconds
+        self.bytes += nbytes
+        self.max = max(self.max, seconds)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                return
+        self.buckets[-1] += 1
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-th call (None for +Inf/empty)
+        if not self.count:
+            return None
+        rank, seen = q * self.count, 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank and n:
+                return BUCKETS[i] if i < len(BUCKETS) else None
+        return None
+
+
+# ================= Switches =================
+def enable(on=True):
+    global _enabled
+    _enabled = bool(on)
+
+
+def enabled():
+    return _enabled
+
+
+def reset():
+    with _lock:
+        _ops.clear()
+        _events.clear()
+
+
+# ================= Recording =================
+def observe(name, seconds, nbytes=0, failed=False):
+    # Records one finished operation
+    if not _enabled:
+        return
+    with _lock:
+        op = _ops.get(name)
+        if op is None:
+            op = _ops[name] = _Op()
+        op.add(seconds, nbytes, failed)
+
+
+def milestone(name, seconds):
+    # Records a rare, user-visible duration such as startup or logout-to-login.
+    # These cost nothing worth saving, so they are kept even while disabled.
+    with _lock:
+        _milestones[name] = seconds
+    observe(name, seconds)
+
+
+def count(name, n=1):
+    # Bumps an event counter
+    if not _enabled:
+        return
+    with _lock:
+        _events[name] = _events.get(name, 0) + n
+
+
+def timed(name, size=None):
+    # Decorator recording each call of the function under `name`.
+    # `size(result)` returns the bytes the call processed, if meaningful.
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException:
+                observe(name, time.perf_counter() - start, 0, True)
+                raise
+            observe(name, time.perf_counter() - start, size(result) if size and result is not None else 0)
+            return result
+        return wrapper
+    return decorate
+
+
+class timer:
+    # Context manager form of timed(): `with metrics.timer("scan") as t: ...`;
+    # set t.bytes inside the block to record a size
+    __slots__ = ("name", "bytes", "_start")
+
+    def __init__(self, name):
+        self.name = name
+        self.bytes = 0
+        self._start = None
+
+    def __enter__(self):
+        if _enabled:
+            self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._start is not None:
+            observe(self.name, time.perf_counter() - self._start, self.bytes, exc_type is not None)
+        return False
+
+
+# ================= Reporting =================
+def snapshot():
+    # Plain dict of everything recorded so far
+    with _lock:
+        ops = {name: {"count": op.count, "errors": op.errors, "seconds": op.seconds, "bytes": op.bytes,
+                      "max_seconds": op.max, "p50_seconds": op.quantile(0.5), "p95_seconds": op.quantile(0.95),
+                      "buckets": list(op.buckets)}
+               for name, op in sorted(_ops.items())}
+        events = dict(sorted(_events.items()))
+        milestones = dict(sorted(_milestones.items()))
+    for stats in ops.values():
+        stats["avg_seconds"] = stats["seconds"] / stats["count"] if stats["count"] else 0.0
+        stats["bytes_per_second"] = stats["bytes"] / stats["seconds"] if stats["seconds"] else 0.0
+    return {"enabled": _enabled, "uptime_seconds": time.time() - _started,
+            "bucket_bounds": list(BUCKETS), "operations": ops, "events": events, "milestones": milestones}
+
+
+def to_json():
+    return json.dumps(snapshot(), indent=2)
+
+
+def to_prometheus():
+    # Prometheus text exposition format (version 0.0.4)
+    data = snapshot()
+    lines = [f"# HELP {PREFIX}_op_seconds Latency of instrumented vault operations",
+             f"# TYPE {PREFIX}_op_seconds histogram"]
+    for name, stats in data["operations"].items():
+        cumulative = 0
+        for bound, n in zip(list(BUCKETS) + ["+Inf"], stats["buckets"]):
+            cumulative += n
+            lines.append(f'{PREFIX}_op_seconds_bucket{{op="{name}",le="{bound}"}} {cumulative}')
+        lines.append(f'{PREFIX}_op_seconds_sum{{op="{name}"}} {stats["seconds"]}')
+        lines.append(f'{PREFIX}_op_seconds_count{{op="{name}"}} {stats["count"]}')
+    for metric, key, help_text in (("op_bytes_total", "bytes", "Bytes processed by instrumented operations"),
+                                   ("op_errors_total", "errors", "Instrumented operations that raised")):
+        lines.append(f"# HELP {PREFIX}_{metric} {help_text}")
+        lines.append(f"# TYPE {PREFIX}_{metric} counter")
+        for name, stats in data["operations"].items():
+            lines.append(f'{PREFIX}_{metric}{{op="{name}"}} {stats[key]}')
+    lines.append(f"# HELP {PREFIX}_milestone_seconds Latest startup and window-switch durations")
+    lines.append(f"# TYPE {PREFIX}_milestone_seconds gauge")
+    for name, seconds in data["milestones"].items():
+        lines.append(f'{PREFIX}_milestone_seconds{{name="{name}"}} {seconds}')
+    lines.append(f"# HELP {PREFIX}_events_total Counted events")
+    lines.append(f"# TYPE {PREFIX}_events_total counter")
+    for name, n in data["events"].items():
+        lines.append(f'{PREFIX}_events_total{{event="{name}"}} {n}')
+    return "\n".join(lines) + "\n"
+
+
+def dump(path):
+    # Writes the registry to `path` atomically (.prom -> Prometheus text, else JSON)
+    text = to_prometheus() if path.endswith(".prom") else to_json()
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        f.write(text)
+    os.replace(tmp, path)  # A scraper never sees a half-written file
+
+
+def start_dump_thread(path, interval=DUMP_INTERVAL_S):
+    # Rewrites `path` every `interval` seconds and once more at exit
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                dump(path)
+            except OSError:
+                pass
+
+    threading.Thread(target=loop, name="metrics-dump", daemon=True).start()
+    atexit.register(lambda: dump(path))
+
+
+if os.environ.get("SECUREVAULT_METRICS_FILE"):
+    _enabled = True
+    start_dump_thread(os.environ["SECUREVAULT_METRICS_FILE"])
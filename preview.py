@@ -0,0 +1,224 @@
+# === preview.py - Previews and viewer streams straight from encrypted files ===
+
+# Nothing here writes a decrypted copy into the vault folder. Text previews
+# read only the first chunks through crypto_util.open_encrypted(), and image
+# previews at most IMAGE_PREVIEW_BYTES; larger images open like other files.
+# The dashboard runs all of these as background jobs.
+# Audio and video a browser can play are served to the system's default
+# handler over http://127.0.0.1 with byte ranges, so playback starts after the
+# first chunk and seeking only decrypts the chunks it lands on. Everything
+# else (PDFs need random access, and the system opener won't hand a named pipe
+# to a viewer) is decrypted to a private temp copy outside the vault, removed
+# again by remove_temp_copies() when the dashboard closes or at exit.
+
+import atexit  # Temp copies are removed when the app exits
+import http.server  # Local byte-range server for media
+import io  # Buffered wrapper around the encrypted reader
+import mimetypes  # Content-Type of served media
+import os  # Paths
+import re  # Range header parsing
+import secrets  # Unguessable URL for the served file
+import shutil  # Removes temp copies
+import tempfile  # Private folder for a temp copy
+import threading  # Stops the request threads of a served file
+import time  # Idle timeout of a served file
+import urllib.parse  # Quoting the file name into the URL
+
+from crypto_util import open_encrypted, decrypt_file
+
+PREVIEW_BYTES = 64 * 1024  # How much of a text file the preview shows
+IMAGE_PREVIEW_SIZE = (800, 600)
+IMAGE_PREVIEW_BYTES = 32 * 1024 * 1024  # Larger images open in the system viewer instead
+STREAM_BLOCK = 1024 * 1024  # Bytes sent to the viewer at a time
+VIEWER_WAIT_S = 30  # Give up if the viewer has not asked for the file by then
+VIEWER_IDLE_S = 600  # Stop serving a file after this long without requests
+SEND_TIMEOUT_S = 10  # Drop a connection whose viewer stopped reading for this long
+
+TEXT_TYPES = {"txt", "md", "csv", "log", "json", "xml", "html", "css", "js", "py", "ini", "cfg", "yaml", "yml"}
+IMAGE_TYPES = {"png", "jpg", "jpeg", "gif", "bmp", "webp", "tif", "tiff", "ico"}
+MEDIA_TYPES = {"mp4", "m4v", "webm", "ogv", "mp3", "m4a", "aac", "ogg", "oga", "opus", "wav", "flac"}  # Browser-playable
+
+
+def preview_kind(name, size=None):
+    # "text", "image", "media" (serve_to_viewer) or "copy" (open_temp_copy)
+    # for an original file name and, if known, its plaintext size
+    ext = os.path.splitext(name)[1][1:].lower()
+    if ext in TEXT_TYPES:
+        return "text"
+    if ext in IMAGE_TYPES:
+        return "image" if size is None or size <= IMAGE_PREVIEW_BYTES else "copy"
+    if ext in MEDIA_TYPES:
+        return "media"
+    return "copy"
+
+
+def read_text_head(enc_path, limit=PREVIEW_BYTES):
+    # Returns (decoded text, True if the file is longer than `limit`)
+    with open_encrypted(enc_path) as reader:
+        head = reader.read(limit + 1)
+    return head[:limit].decode("utf-8", errors="replace"), len(head) > limit
+
+
+def load_image(enc_path, max_size=IMAGE_PREVIEW_SIZE, max_bytes=IMAGE_PREVIEW_BYTES):
+    # Decodes an encrypted image scaled down to fit `max_size`; refuses
+    # images over `max_bytes` rather than decrypting all of them
+    from PIL import Image  # Imported on first preview, not at startup
+    with io.BufferedReader(open_encrypted(enc_path)) as reader:
+        if reader.seek(0, io.SEEK_END) > max_bytes:
+            raise ValueError("Image is too large to preview; open it in a viewer instead")
+        reader.seek(0)
+        image = Image.open(reader)
+        image.draft("RGB", max_size)  # JPEGs decode directly at reduced size
+        image.thumbnail(max_size)
+        image.load()
+    return image
+
+
+# ================= Temp Copies =================
+_temp_folders = []  # Private folders holding decrypted copies for viewers
+
+
+def open_temp_copy(enc_path, name, launch, progress=None):
+    # Decrypts to a private temp folder (mode 0700, file 0600, outside the
+    # vault) and hands the copy to `launch(path)`. The copy stays until
+    # remove_temp_copies(), since the viewer may read it at any time.
+    folder = tempfile.mkdtemp(prefix="securevault-")
+    _temp_folders.append(folder)
+    path = os.path.join(folder, os.path.basename(name))
+    decrypt_file(enc_path, path, progress=progress)
+    launch(path)
+
+
+def remove_temp_copies():
+    # Deletes every temp copy made in this session
+    while _temp_folders:
+        shutil.rmtree(_temp_folders.pop(), ignore_errors=True)
+
+
+atexit.register(remove_temp_copies)
+
+
+# ================= Media Server =================
+class _ViewerServer(http.server.ThreadingHTTPServer):
+    # Serves one encrypted file's plaintext, with byte ranges, on 127.0.0.1
+    daemon_threads = True
+    block_on_close = False  # Closing never waits for a viewer's connection
+
+    def __init__(self, enc_path, name):
+        super().__init__(("127.0.0.1", 0), _RangeHandler)
+        self.enc_path = enc_path
+        with open_encrypted(enc_path) as reader:
+            self.size = reader.size
+        self.content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        self.url_path = f"/{secrets.token_urlsafe(16)}/{urllib.parse.quote(os.path.basename(name))}"
+        self.url = f"http://127.0.0.1:{self.server_address[1]}{self.url_path}"
+        self.stopped = threading.Event()
+        self.lock = threading.Lock()
+        self.requests = 0  # Requests seen so far
+        self.busy = 0  # Requests being answered right now
+        self.served = 0  # Bytes sent
+        self.last_active = time.monotonic()
+
+
+_RANGE = re.compile(r"bytes=(\d*)-(\d*)$")
+
+
+class _RangeHandler(http.server.BaseHTTPRequestHandler):
+    timeout = SEND_TIMEOUT_S
+
+    def log_message(self, format, *args):
+        pass  # Nothing on stderr for every request
+
+    def do_HEAD(self):
+        self._serve(body=False)
+
+    def do_GET(self):
+        self._serve(body=True)
+
+    def _range(self, size):
+        # (start, end inclusive) asked for, None for the whole file, False if unsatisfiable
+        header = self.headers.get("Range")
+        match = _RANGE.match(header.strip()) if header else None
+        if not match or match.groups() == ("", ""):
+            return None
+        first, last = match.groups()
+        if first:
+            start, end = int(first), min(int(last), size - 1) if last else size - 1
+        else:
+            start, end = max(size - int(last), 0), size - 1
+        return (start, end) if start <= end else False
+
+    def _serve(self, body):
+        server = self.server
+        if self.path != server.url_path:
+            self.send_error(404)
+            return
+        with server.lock:
+            server.requests += 1
+            server.busy += 1
+        try:
+            span = self._range(server.size)
+            if span is False:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{server.size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            start, end = span or (0, server.size - 1)
+            self.send_response(206 if span else 200)
+            self.send_header("Content-Type", server.content_type)
+            self.send_header("Content-Length", str(max(end - start + 1, 0)))
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("Content-Disposition", "inline")
+            if span:
+                self.send_header("Content-Range", f"bytes {start}-{end}/{server.size}")
+            self.end_headers()
+            if body:
+                self._send(start, end - start + 1)
+        except (OSError, ValueError):
+            pass  # The viewer closed the connection or stopped reading, or the file is damaged
+        finally:
+            with server.lock:
+                server.busy -= 1
+                server.last_active = time.monotonic()
+
+    def _send(self, start, remaining):
+        server = self.server
+        with open_encrypted(server.enc_path) as reader:
+            reader.seek(start)
+            while remaining > 0 and not server.stopped.is_set():
+                block = reader.read(min(STREAM_BLOCK, remaining))
+                if not block:
+                    break
+                self.wfile.write(block)
+                remaining -= len(block)
+                with server.lock:
+                    server.served += len(block)
+
+
+def serve_to_viewer(enc_path, name, launch, progress=None, idle=VIEWER_IDLE_S):
+    # Plays an encrypted file in the default viewer without a plaintext copy:
+    # `launch(url)` gets a private http://127.0.0.1 URL, and only the chunks
+    # the viewer asks for are decrypted. Runs until the viewer has made no
+    # request for `idle` seconds, or until `progress` raises (a cancelled
+    # job); open connections are dropped then instead of being waited for.
+    server = _ViewerServer(enc_path, name)
+    server.timeout = 0.5  # How often cancellation and idleness are checked
+    reported = 0
+    try:
+        launch(server.url)
+        while True:
+            server.handle_request()
+            with server.lock:
+                served, busy, requests = server.served, server.busy, server.requests
+                quiet = time.monotonic() - server.last_active
+            if progress:
+                progress(served - reported)  # Raises once the job is cancelled
+            reported = served
+            if not requests and quiet > VIEWER_WAIT_S:
+                raise TimeoutError("The viewer did not open the file")
+            if requests and not busy and quiet > idle:
+                return
+    finally:
+        server.stopped.set()
+        server.server_close()
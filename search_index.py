@@ -0,0 +1,210 @@
+# === search_index.py - In-memory substring search over vault file names ===
+
+import threading  # Background rebuilds
+import time  # Yields the GIL between batches of a background rebuild
+from collections import defaultdict  # Trigram -> keys posting sets
+from contextlib import contextmanager  # foreground()
+
+import metrics  # Optional timing of searches
+
+NARROW_ENOUGH = 1000  # Below this many candidates, skip the trigram lookup
+BUILD_BATCH = 20  # Names a background rebuild indexes before yielding to other threads
+
+
+def trigrams(text):
+    # Every 3-character slice of `text` (empty for shorter strings)
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+@metrics.timed("search.rebuild")
+def _index(names, between=None):
+    # Trigram postings for a {key: lower-cased text} mapping. `between()` is
+    # called every BUILD_BATCH names; if it returns False the build is
+    # abandoned and None returned.
+    grams = defaultdict(set)
+    for i, (key, text) in enumerate(names.items()):
+        if between is not None and not i % BUILD_BATCH and not between():
+            return None
+        for gram in trigrams(text):
+            grams[gram].add(key)
+    return grams
+
+
+def _unindex(grams, key, text):
+    for gram in trigrams(text):
+        keys = grams.get(gram)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del grams[gram]
+
+
+class SearchIndex:
+    # Case-insensitive substring search backed by a trigram index.
+    #
+    # A 3-character query is a single posting set; longer ones only look at
+    # names sharing all of the query's trigrams. 1-2 character queries scan
+    # the names, which at that length costs about as much as copying a
+    # posting set of the matches would, without a posting per distinct
+    # character and pair of every name. A query that
+    # extends the previous one (e.g. "repo" -> "repor") is answered from the
+    # previous result set, so typing narrows instead of starting over.
+    #
+    # rebuild(..., background=True) makes the names searchable at once (by
+    # scanning them) and builds the postings on a worker thread; changes made
+    # meanwhile are replayed onto the new postings before they are swapped in.
+    # The worker pauses inside foreground() (and search()), so it does not
+    # compete with the Tk thread for the GIL while a keystroke is handled.
+    # The index is otherwise used from one thread (the Tk thread).
+
+    def __init__(self):
+        self._names = {}  # key -> lower-cased searchable text
+        self._grams = defaultdict(set)  # trigram -> keys containing it
+        self._last_query = ""
+        self._last_result = None
+        self._lock = threading.Lock()  # Guards the swap of a background rebuild
+        self._generation = 0  # Bumped by every rebuild; stale background builds are dropped
+        self._journal = None  # Keys changed during a background rebuild (None: postings are current)
+        self._built = threading.Event()
+        self._built.set()
+        self._resume = threading.Event()  # Cleared while the caller's thread is busy
+        self._resume.set()
+        self._busy = 0  # Nesting depth of foreground()
+
+    def __len__(self):
+        return len(self._names)
+
+    @property
+    def ready(self):
+        # False while a background rebuild is running (searches scan meanwhile)
+        return self._built.is_set()
+
+    def wait(self, timeout=None):
+        # Blocks until a background rebuild has been swapped in
+        return self._built.wait(timeout)
+
+    @contextmanager
+    def foreground(self):
+        # Pauses a background rebuild for the duration of the block
+        self._busy += 1
+        self._resume.clear()
+        try:
+            yield
+        finally:
+            self._busy -= 1
+            if not self._busy:
+                self._resume.set()
+
+    # ===== Maintaining The Index =====
+    def add(self, key, name):
+        with self._lock:
+            self._remove(key)
+            text = name.lower()
+            self._names[key] = text
+            if self._journal is None:
+                for gram in trigrams(text):
+                    self._grams[gram].add(key)
+            else:
+                self._journal.add(key)
+            self._last_result = None  # Cached result may now be incomplete
+
+    def remove(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def _remove(self, key):
+        text = self._names.pop(key, None)
+        if text is None:
+            return
+        if self._journal is None:
+            _unindex(self._grams, key, text)
+        else:
+            self._journal.add(key)
+        self._last_result = None
+
+    def rebuild(self, items, background=False):
+        # Replaces the whole index with (key, name) pairs
+        names = {key: name.lower() for key, name in items}
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+            self._names = names
+            self._last_result = None
+            if not background:
+                self._grams, self._journal = _index(names), None
+                self._built.set()
+                return
+            self._grams, self._journal = defaultdict(set), set()
+            self._built.clear()
+        threading.Thread(target=self._build, args=(dict(names), generation),
+                         name="search-index", daemon=True).start()
+
+    def _build(self, snapshot, generation):
+        # Worker: postings for `snapshot`, swapped in unless a newer rebuild started
+        def between():
+            time.sleep(0)  # Lets a waiting Tk thread take the GIL now, not at the next switch interval
+            self._resume.wait()
+            return generation == self._generation  # False once a newer rebuild started
+
+        grams = _index(snapshot, between)
+        with self._lock:
+            if grams is None or generation != self._generation:
+                return
+            for key in self._journal:  # Changed since the snapshot was taken
+                old, new = snapshot.get(key), self._names.get(key)
+                if old is not None:
+                    _unindex(grams, key, old)
+                if new is not None:
+                    for gram in trigrams(new):
+                        grams[gram].add(key)
+            self._grams, self._journal = grams, None
+            self._built.set()
+
+    # ===== Querying =====
+    @metrics.timed("search.query")
+    def search(self, query):
+        # Returns the set of keys whose name contains `query`
+        query = query.lower()
+        with self.foreground(), self._lock:
+            names = self._names
+            if not query:
+                result = set(names)
+            elif self._journal is not None or len(query) < 3:  # No postings (yet) for this query: scan
+                candidates = self._narrowed(query)
+                if candidates is None:
+                    result = {key for key, text in names.items() if query in text}
+                else:
+                    result = {key for key in candidates if query in names[key]}
+            elif len(query) == 3:
+                result = set(self._grams.get(query, ()))  # The posting set is the exact answer
+            else:
+                candidates = self._candidates(query)
+                if candidates is None:  # Scanning items() beats per-key lookups on big sets
+                    result = {key for key, text in names.items() if query in text}
+                else:
+                    result = {key for key in candidates if query in names[key]}
+            self._last_query, self._last_result = query, result
+        return result
+
+    def _narrowed(self, query):
+        # The previous result if `query` extends the previous query, else None
+        if self._last_result is not None and self._last_query and self._last_query in query:
+            return self._last_result
+        return None
+
+    def _candidates(self, query):
+        # Smallest known superset of the matches, or None to scan everything
+        best = self._narrowed(query)  # Extension of the previous query: narrow it
+        if best is None or len(best) > NARROW_ENOUGH:
+            postings = []
+            for gram in trigrams(query):
+                keys = self._grams.get(gram)
+                if not keys:
+                    return ()  # Some trigram appears nowhere: no match possible
+                postings.append(keys)
+            postings.sort(key=len)
+            if best is None or len(postings[0]) < len(best):
+                best = postings[0].intersection(*postings[1:])
+        if best is not None and len(best) > len(self._names) // 4:
+            return None
+        return best
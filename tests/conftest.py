@@ -0,0 +1,9 @@
+# === conftest.py - Test setup: import the app modules from the repo root ===
+
+import os  # Paths and the key ring override
+import sys  # Module search path
+import tempfile  # Throwaway key ring location
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Never read or write a real vault_keys.json from the working directory
+os.environ.setdefault("SECUREVAULT_KEYRING", os.path.join(tempfile.mkdtemp(prefix="securevault-test-"), "keys.json"))
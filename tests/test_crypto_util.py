@@ -0,0 +1,224 @@
+# === test_crypto_util.py - v2 chunked format: round trips, legacy files and tampering ===
+
+import hashlib  # Expected checksums
+import io  # In-memory streams
+import os  # Random test data
+
+import pytest
+from cryptography.fernet import InvalidToken  # A damaged legacy (Fernet) file
+
+import crypto_util
+from crypto_util import (FILE_HEADER, HEADER_SIZE, CODEC_NONE, CODEC_ZLIB, decrypt_file, decrypt_stream,
+                         encrypt_file, encrypt_stream, open_encrypted, plaintext_size, rekey_file, verify_file)
+
+CHUNK = 4096  # Small chunks so multi-chunk files stay small
+SIZES = [0, 1, CHUNK - 1, CHUNK, CHUNK + 1, 3 * CHUNK]
+DAMAGED = (ValueError, InvalidToken)
+
+
+def sample(size):
+    # Half random, half repetitive: exercises both stored and compressed chunks
+    return (os.urandom(size // 2) + b"abc" * size)[:size]
+
+
+def encrypted(tmp_path, data, codec=CODEC_NONE, name="data.bin"):
+    path = tmp_path / (name + ".enc")
+    with open(path, "wb") as dst:
+        encrypt_stream(io.BytesIO(data), dst, chunk_size=CHUNK, codec=codec)
+    return path
+
+
+def records(path):
+    # (offset, length) of every length-prefixed record after the header
+    raw = path.read_bytes()
+    found, offset = [], HEADER_SIZE
+    while offset < len(raw):
+        length = int.from_bytes(raw[offset:offset + 4], "big")
+        found.append((offset, 4 + length))
+        offset += 4 + length
+    return found
+
+
+def assert_damaged(path):
+    # Every reader refuses the file instead of returning wrong plaintext
+    with pytest.raises(DAMAGED):
+        decrypt_file(str(path), str(path) + ".out")
+    assert not os.path.exists(str(path) + ".out")
+    with pytest.raises(DAMAGED):
+        with open_encrypted(str(path)) as reader:
+            reader.read()
+
+
+# ===== Round Trips =====
+@pytest.mark.parametrize("size", SIZES)
+@pytest.mark.parametrize("workers", [1, 4])
+@pytest.mark.parametrize("codec", [CODEC_NONE, CODEC_ZLIB])
+def test_round_trip(tmp_path, size, workers, codec):
+    data = sample(size)
+    dst = io.BytesIO()
+    stats = encrypt_stream(io.BytesIO(data), dst, chunk_size=CHUNK, workers=workers, codec=codec)
+    assert stats.plain_size == size
+    assert stats.cipher_size == len(dst.getvalue())
+    assert stats.checksum == hashlib.sha256(data).hexdigest()
+    assert dst.getvalue().startswith(FILE_HEADER + bytes([crypto_util.FORMAT_VERSION, codec]))
+
+    out = io.BytesIO()
+    back = decrypt_stream(io.BytesIO(dst.getvalue()), out, workers=workers)
+    assert out.getvalue() == data
+    assert back == stats
+
+    path = tmp_path / "f.enc"
+    path.write_bytes(dst.getvalue())
+    assert plaintext_size(str(path)) == size
+    assert verify_file(str(path), workers=workers) == len(dst.getvalue())
+    with open_encrypted(str(path)) as reader:
+        assert reader.size == size
+        assert reader.read() == data
+        if size > CHUNK:
+            reader.seek(CHUNK - 1)
+            assert reader.read(3) == data[CHUNK - 1:CHUNK + 2]  # Read across a chunk boundary
+
+
+def test_file_api_round_trip(tmp_path):
+    data = sample(2 * CHUNK + 5)
+    plain = tmp_path / "notes.txt"
+    plain.write_bytes(data)
+    encrypt_file(str(plain), str(tmp_path / "notes.txt.enc"), chunk_size=CHUNK, workers=4)
+    decrypt_file(str(tmp_path / "notes.txt.enc"), str(tmp_path / "out.txt"), workers=4)
+    assert (tmp_path / "out.txt").read_bytes() == data
+
+
+def test_every_file_gets_its_own_key(tmp_path):
+    data = sample(CHUNK)
+    first, second = encrypted(tmp_path, data, name="a"), encrypted(tmp_path, data, name="b")
+    assert first.read_bytes()[HEADER_SIZE:] != second.read_bytes()[HEADER_SIZE:]  # Different salts
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_decrypt_progress_counts_plaintext(tmp_path, workers):
+    data = b"x" * (3 * CHUNK + 7)  # Compresses well: ciphertext is far smaller than plaintext
+    seen = []
+    crypto_util.decrypt_to(str(encrypted(tmp_path, data, CODEC_ZLIB)), io.BytesIO(), workers=workers,
+                           progress=seen.append)
+    assert sum(seen) == len(data)
+
+    legacy = tmp_path / "old.enc"
+    legacy.write_bytes(FILE_HEADER + crypto_util.fernet.encrypt(data))
+    seen.clear()
+    crypto_util.decrypt_to(str(legacy), io.BytesIO(), progress=seen.append)
+    assert sum(seen) == len(data)
+
+
+def test_rekey_keeps_plaintext(tmp_path):
+    data = sample(2 * CHUNK + 1)
+    path = encrypted(tmp_path, data, codec=CODEC_ZLIB)
+    assert not rekey_file(str(path), key_id=0)  # Already on that key
+    try:
+        key_id = crypto_util.new_master_key(str(tmp_path / "keys.json"))
+        assert rekey_file(str(path), workers=4)
+        assert crypto_util.file_key_id(str(path)) == key_id
+        with open_encrypted(str(path)) as reader:
+            assert reader.read() == data
+    finally:
+        crypto_util.load_keyring(crypto_util.KEYRING_PATH)
+
+
+# ===== Legacy Files =====
+def test_legacy_fernet_file(tmp_path):
+    data = sample(CHUNK + 3)
+    path = tmp_path / "old.enc"
+    path.write_bytes(FILE_HEADER + crypto_util.fernet.encrypt(data))
+    decrypt_file(str(path), str(tmp_path / "old.out"))
+    assert (tmp_path / "old.out").read_bytes() == data
+    with open_encrypted(str(path)) as reader:
+        assert reader.read() == data
+    assert plaintext_size(str(path)) is None
+    assert verify_file(str(path)) is None
+
+
+def test_damaged_legacy_file(tmp_path):
+    raw = bytearray(FILE_HEADER + crypto_util.fernet.encrypt(b"secret"))
+    raw[-5] ^= 1
+    path = tmp_path / "old.enc"
+    path.write_bytes(bytes(raw))
+    assert_damaged(path)
+
+
+def test_not_encrypted(tmp_path):
+    path = tmp_path / "plain.enc"
+    path.write_bytes(b"just some text")
+    assert_damaged(path)
+    assert plaintext_size(str(path)) is None
+
+
+# ===== Tampering =====
+@pytest.mark.parametrize("codec", [CODEC_NONE, CODEC_ZLIB])
+@pytest.mark.parametrize("where", ["header", "first", "last"])
+def test_flipped_byte(tmp_path, codec, where):
+    path = encrypted(tmp_path, sample(3 * CHUNK + 10), codec)
+    offset, length = {"header": (len(FILE_HEADER) + 8, 1), "first": records(path)[0],
+                      "last": records(path)[-1]}[where]
+    raw = bytearray(path.read_bytes())
+    raw[offset + length - 1] ^= 0x01  # Inside the ciphertext / tag (or the salt for "header")
+    path.write_bytes(bytes(raw))
+    assert_damaged(path)
+    with pytest.raises(ValueError):
+        verify_file(str(path))
+    if where != "first":  # plaintext_size authenticates the header and the last chunk only
+        with pytest.raises(ValueError):
+            plaintext_size(str(path))
+
+
+@pytest.mark.parametrize("codec", [CODEC_NONE, CODEC_ZLIB])
+def test_truncated_at_record_boundary(tmp_path, codec):
+    path = encrypted(tmp_path, sample(3 * CHUNK), codec)
+    offset, _length = records(path)[-1]
+    path.write_bytes(path.read_bytes()[:offset])  # Drop the last chunk entirely
+    assert_damaged(path)
+    with pytest.raises(ValueError):
+        verify_file(str(path))
+    with pytest.raises(ValueError):
+        plaintext_size(str(path))
+
+
+@pytest.mark.parametrize("cut", [1, 4, 20])
+def test_truncated_mid_record(tmp_path, cut):
+    path = encrypted(tmp_path, sample(2 * CHUNK + 100))
+    path.write_bytes(path.read_bytes()[:-cut])
+    assert_damaged(path)
+    with pytest.raises(ValueError):
+        plaintext_size(str(path))
+
+
+def test_header_only(tmp_path):
+    path = encrypted(tmp_path, sample(CHUNK))
+    path.write_bytes(path.read_bytes()[:HEADER_SIZE])
+    assert_damaged(path)
+    with pytest.raises(ValueError):
+        plaintext_size(str(path))
+
+
+@pytest.mark.parametrize("codec", [CODEC_NONE, CODEC_ZLIB])
+def test_swapped_chunks(tmp_path, codec):
+    data = b"".join(bytes([65 + i]) * CHUNK for i in range(3))  # Equal-size records with distinct contents
+    path = encrypted(tmp_path, data, codec)
+    raw = path.read_bytes()
+    (a, a_len), (b, b_len), (c, c_len) = records(path)
+    assert a_len == b_len == c_len
+    swapped = raw[:a] + raw[c:c + c_len] + raw[b:b + b_len] + raw[a:a + a_len]  # Last and first swapped
+    path.write_bytes(swapped)
+    assert_damaged(path)
+    with pytest.raises(ValueError):
+        verify_file(str(path))
+    with pytest.raises(ValueError):
+        plaintext_size(str(path))
+
+
+def test_chunk_from_another_file(tmp_path):
+    data = sample(2 * CHUNK)
+    first, second = encrypted(tmp_path, data, name="a"), encrypted(tmp_path, data, name="b")
+    offset, length = records(first)[0]
+    raw = bytearray(first.read_bytes())
+    raw[offset:offset + length] = second.read_bytes()[offset:offset + length]
+    first.write_bytes(bytes(raw))
+    assert_damaged(first)
@@ -0,0 +1,45 @@
+# === test_file_records.py - Sort orders of the file table ===
+
+import pytest
+
+from file_records import FileRecord, RecordStore, SORT_CRITERIA
+
+
+def make_store():
+    store = RecordStore()
+    for name, type, size, mtime in [("b.txt", "txt", 10, 2), ("A.png", "png", 10, 1),
+                                    ("c.enc", "enc", 5, 2), ("a.txt", "txt", 20, 2)]:
+        store.put(FileRecord(name, type, size, mtime))
+    return store
+
+
+def rebuilt(store):
+    # Same records in a store with no cached orders yet (full sorts only)
+    fresh = RecordStore()
+    for record in store.records.values():
+        fresh.put(record)
+    return fresh
+
+
+@pytest.mark.parametrize("column,descending,expected", [
+    ("size", True, ["a.txt", "A.png", "b.txt", "c.enc"]),
+    ("size", False, ["c.enc", "A.png", "b.txt", "a.txt"]),
+    ("mtime", True, ["a.txt", "b.txt", "c.enc", "A.png"]),
+    ("type", True, ["a.txt", "b.txt", "A.png", "c.enc"]),
+    ("name", True, ["c.enc", "b.txt", "a.txt", "A.png"]),
+])
+def test_ties_stay_alphabetical(column, descending, expected):
+    store = make_store()
+    assert store.arrange(column, descending) == expected
+    assert store.arrange(column, descending, subset=set(expected[:2])) == expected[:2]
+
+
+def test_cached_orders_follow_changes():
+    store = make_store()
+    for column, descending in SORT_CRITERIA.values():
+        store.arrange(column, descending)  # Build every cached order first
+    store.put(FileRecord("B.png", "png", 10, 2))
+    store.put(FileRecord("c.enc", "enc", 10, 3))
+    store.remove("a.txt")
+    for column, descending in SORT_CRITERIA.values():
+        assert store.arrange(column, descending) == rebuilt(store).arrange(column, descending)
@@ -1,7 +1,5 @@
 # === utils.py ===
 
-import sqlite3         # Used for database operations (SQLite)
-import hashlib         # Used to hash passwords securely
 import os              # Used to work with file paths
 import sys             # Used to check if the app is running as .exe
 import random          # Used to generate random passwords
@@ -19,17 +17,14 @@ def resource_path(relative_path):  # This function helps locate file paths
 DB_PATH = resource_path("users.db")  # Set the full path to the SQLite database
 
 
-def hash_password(password):  # Converts plain password into a secure hashed format
-    return hashlib.sha256(password.encode()).hexdigest()  # Encode, hash using SHA256, return hex format
+def hash_password(password):  # Old unsalted SHA-256 format; new hashes come from kdf.py
+    import kdf
+    return kdf.legacy_hash(password)
 
 
-def user_exists(username):  # Checks whether a user already exists in the database
-    conn = sqlite3.connect(DB_PATH)              # Connect to the database
-    cursor = conn.cursor()                       # Create a cursor to execute SQL commands
-    cursor.execute("SELECT * FROM users WHERE username = ?", (username,))  # Check for user
-    exists = cursor.fetchone() is not None       # If data is found, user exists
-    conn.close()                                 # Close database connection
-    return exists                                # Return True or False
+def user_exists(username):  # Kept for older imports; uses db.py's shared connection
+    import db
+    return db.user_exists(username)
 
 
 def generate_random_password(length=10):  # Generates a secure random password
@@ -0,0 +1,599 @@
+# === vault.py - Headless vault engine and command-line interface ===
+
+# Everything the dashboard does to a vault folder, without Tk: encrypt,
+# decrypt, delete, list, verify and reclaim space. The dashboard is a client
+# of the Vault class below, and the same engine runs from a shell or cron:
+#
+#   python -m vault --user alice encrypt ~/Documents --jobs 4
+#   python -m vault --user alice list
+#   python -m vault --user alice verify
+#   python -m vault --user alice scrub --hours 8      # nightly, from cron
+#   python -m vault --user alice rotate --new-key     # re-encrypt under a fresh key
+#   python -m vault --user alice export -o photos.zip a.jpg.enc b.jpg.enc
+#   tar c /srv | python -m vault encrypt - -o backup.tar.enc
+#   python -m vault decrypt backup.tar.enc -o - | tar x
+#
+# --user NAME opens vault/NAME after checking the password (prompted, or
+# taken from $SECUREVAULT_PASSWORD for unattended runs); --vault DIR opens a
+# folder directly. Encrypting with -o writes a standalone .enc file (or
+# stdout) instead of adding to a vault; "-" means stdin or stdout.
+
+import argparse  # Command-line parsing
+import getpass  # Password prompt for --user
+import json  # Key rotation checkpoint
+import os  # Paths and directory walks
+import sys  # stdin/stdout streams and exit codes
+import time  # Scrub deadlines and check ages
+from collections import deque  # Bounded window of in-flight files
+from contextlib import nullcontext  # stdin as a context manager that is left open
+from concurrent.futures import ThreadPoolExecutor  # Files processed in parallel
+
+import humanize  # Readable sizes in listings and summaries
+from cryptography.fernet import InvalidToken  # A damaged legacy (Fernet) file
+
+from chunk_store import ChunkStore, is_manifest  # Deduplicated storage mode
+from crypto_util import (DEFAULT_WORKERS, atomic_output, current_key_id, decrypt_stream, decrypt_to,
+                         encrypt_file, encrypt_stream, make_pool, new_master_key, rekey_file, verify_file)
+from file_index import FileIndex  # Cached listing metadata
+
+VAULT_ROOT = "vault"  # Parent of every user's vault folder (relative to the working directory)
+PASSWORD_ENV = "SECUREVAULT_PASSWORD"  # Lets scheduled jobs log in without a prompt
+DEFAULT_FILE_JOBS = 4  # Files encrypted at once by --jobs
+RECHECK_AFTER_S = 30 * 24 * 3600  # Unchanged files are scrubbed again after this long
+_DAMAGE = (ValueError, InvalidToken, OSError)  # What a failed integrity check raises
+ROTATION_CHECKPOINT = ".rotation.json"  # Progress of an unfinished key rotation (hidden from listings)
+CHECKPOINT_EVERY_S = 5.0
+
+
+def user_folder(username):
+    # A user's personal vault folder
+    return os.path.join(VAULT_ROOT, username)
+
+
+def vault_name(filename):
+    # Name an uploaded file gets inside the vault
+    return filename.replace(" ", "_") + ".enc"
+
+
+def unique_name(base, used):
+    # vault_name(base), made unique among `used` (lower-case names, updated)
+    # with " (2)", " (3)", ... the way exported files are
+    stem, ext = os.path.splitext(base)
+    name, n = vault_name(base), 1
+    while name.lower() in used:
+        n += 1
+        name = vault_name(f"{stem} ({n}){ext}")
+    used.add(name.lower())
+    return name
+
+
+def tree_files(root, used=None):
+    # (path, vault name, taken) for every file below `root`, in a stable
+    # order. Subfolders are flattened into the name ("a/b.txt" ->
+    # "a_b.txt.enc"); where two paths flatten to the same name ("a/b_c.txt"
+    # and "a_b/c.txt") the later one gets a " (2)" suffix and `taken` is the
+    # name it would have had (else None). `used` carries names already given
+    # out, e.g. by earlier sources of the same run.
+    used = set() if used is None else used
+    for folder, dirs, files in os.walk(root):
+        dirs.sort()  # Same tree, same names: re-running a backup replaces the same files
+        for name in sorted(files):
+            path = os.path.join(folder, name)
+            base = os.path.relpath(path, root).replace(os.sep, "_")
+            unique = unique_name(base, used)
+            yield path, unique, (vault_name(base) if unique != vault_name(base) else None)
+
+
+class _NullSink:
+    # Write target that discards plaintext (verification only needs the checksum)
+    def write(self, data):
+        return len(data)
+
+
+class Vault:
+    # GUI-free operations on one vault folder. Safe to call from worker
+    # threads; `pool` is the chunk-level crypto pool (created if not given).
+
+    def __init__(self, folder, pool=None, workers=DEFAULT_WORKERS):
+        os.makedirs(folder, exist_ok=True)
+        self.folder = folder
+        self.index = FileIndex(folder)
+        self.chunks = ChunkStore(folder)
+        self._own_pool = pool is None
+        self.pool = make_pool(workers) if pool is None else pool
+
+    def path(self, name):
+        return os.path.join(self.folder, name)
+
+    # ===== Files =====
+    def encrypt(self, src_path, name=None, dedup=False, progress=None):
+        # Adds one file to the vault; returns (vault name, StreamStats)
+        name = name or vault_name(os.path.basename(src_path))
+        dest = self.path(name)
+        if dedup:
+            stats = self.chunks.store_file(src_path, dest, progress=progress, pool=self.pool)
+        else:
+            with self.chunks.replacing(dest):  # Releases the chunks of a manifest it overwrites
+                stats = encrypt_file(src_path, dest, pool=self.pool, progress=progress)
+        self.index.record_stats(name, os.path.basename(src_path), stats)
+        return name, stats
+
+    def encrypt_tree(self, root, jobs=DEFAULT_FILE_JOBS, dedup=False, used=None):
+        # Encrypts every file below `root`, `jobs` files at a time, under the
+        # collision-free names of tree_files(). Yields (path, vault name,
+        # taken, StreamStats or the exception that stopped it) in walk order;
+        # at most 2 * jobs files are in flight, so huge trees don't pile up
+        # results in memory.
+        def encrypt_one(path, name):
+            try:
+                return self.encrypt(path, name, dedup)[1]
+            except Exception as e:
+                return e
+
+        with ThreadPoolExecutor(max_workers=max(1, jobs), thread_name_prefix="vault-file") as files:
+            pending = deque()
+            for path, name, taken in tree_files(root, used):
+                pending.append((path, name, taken, files.submit(encrypt_one, path, name)))
+                if len(pending) >= 2 * max(1, jobs):
+                    path, name, taken, future = pending.popleft()
+                    yield path, name, taken, future.result()
+            while pending:
+                path, name, taken, future = pending.popleft()
+                yield path, name, taken, future.result()
+
+    def decrypt(self, name, dest=None, progress=None):
+        # Decrypts a vault file to `dest` (default: next to it, without ".enc").
+        # Results written into the vault folder are indexed. Returns StreamStats.
+        dest = dest or self.path(name[:-4] if name.endswith(".enc") else name + ".dec")
+        with atomic_output(dest) as out:
+            stats = decrypt_to(self.path(name), out, pool=self.pool, progress=progress)
+        if os.path.dirname(os.path.abspath(dest)) == os.path.abspath(self.folder):
+            self.index.record_stats(os.path.basename(dest), os.path.basename(dest), stats)
+        return stats
+
+    def decrypt_to(self, name, dst, progress=None):
+        # Decrypts a vault file into an open binary stream (e.g. stdout)
+        return decrypt_to(self.path(name), dst, pool=self.pool, progress=progress)
+
+    def verify(self, name, progress=None):
+        # Authenticates every chunk of a vault file and compares the plaintext
+        # checksum with the index (when known). Raises ValueError on damage.
+        stats = decrypt_to(self.path(name), _NullSink(), pool=self.pool, progress=progress)
+        entry = self.index.get(name)
+        if entry and entry.checksum and entry.checksum != stats.checksum:
+            raise ValueError(f"{name} does not match its recorded checksum")
+        return stats
+
+    def check(self, name, progress=None):
+        # Integrity check used by scrub(): authenticates every chunk without
+        # decompressing or hashing it. Deduplicated and legacy files fall back
+        # to a full verify(). Raises on damage; returns the bytes checked.
+        # `progress` counts bytes of the vault file itself, like stored_size.
+        checked = verify_file(self.path(name), pool=self.pool, progress=progress)
+        if checked is None:
+            checked = self.verify(name, progress and (lambda n: progress(0))).cipher_size  # Still cancellable
+            if progress:
+                progress(os.path.getsize(self.path(name)))
+        return checked
+
+    def delete(self, name):
+        # Removes a vault file (releasing any deduplicated chunks it used)
+        self.chunks.delete(self.path(name))
+        self.index.remove(name)
+
+    # ===== Listing And Maintenance =====
+    def entries(self, reconcile=True):
+        # Every file in the vault; by default first picks up outside changes
+        if reconcile:
+            self.index.reconcile()
+        return self.index.entries()
+
+    def due_checks(self, max_age=RECHECK_AFTER_S):
+        # FileEntry rows scrub() should look at, most overdue first
+        self.index.reconcile()
+        return self.index.due_checks(time.time() - max_age)
+
+    def scrub(self, entries, jobs=DEFAULT_FILE_JOBS, deadline=None, progress=None):
+        # Checks `entries` (from due_checks()) `jobs` files at a time, chunks
+        # spread over the crypto pool. Each outcome is saved in the index as
+        # soon as it is known, so a run that is stopped or hits `deadline` (a
+        # time.time() value after which no new file is started) carries on
+        # from there next time. Yields (name, None or the error message).
+        def check_one(name):
+            try:
+                st = os.stat(self.path(name))
+            except FileNotFoundError:
+                return None  # Deleted since the listing: nothing to record
+            try:
+                self.check(name, progress)
+                error = None
+            except FileNotFoundError:
+                return None
+            except _DAMAGE as e:
+                error = str(e) or type(e).__name__
+            self.index.record_check(name, st.st_size, st.st_mtime, error)
+            return error
+
+        jobs = max(1, jobs)
+        with ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="vault-scrub") as files:
+            pending = deque()
+            try:
+                for entry in entries:
+                    if deadline and time.time() >= deadline:
+                        break
+                    pending.append((entry.name, files.submit(check_one, entry.name)))
+                    if len(pending) >= 2 * jobs:
+                        name, future = pending.popleft()
+                        yield name, future.result()
+                while pending:
+                    name, future = pending.popleft()
+                    yield name, future.result()
+            finally:
+                for _name, future in pending:
+                    future.cancel()  # e.g. the job was cancelled: don't start the queued files
+
+    def failed_checks(self):
+        # CheckState of every file whose last check found damage
+        return self.index.failed_checks()
+
+    # ===== Key Rotation =====
+    def rotation_checkpoint(self):
+        # (target key id, last file finished in name order) of an unfinished
+        # rotation, or None
+        try:
+            with open(self.path(ROTATION_CHECKPOINT)) as f:
+                state = json.load(f)
+            return state["key_id"], state["after"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _save_checkpoint(self, key_id, after):
+        with atomic_output(self.path(ROTATION_CHECKPOINT)) as f:
+            f.write(json.dumps({"key_id": key_id, "after": after}).encode())
+
+    def rotation_size(self):
+        # Bytes a full rotation reports progress for: the stored size of
+        # chunked files, the plaintext of deduplicated ones (they are re-stored)
+        total = 0
+        for entry in self.entries():
+            if entry.type != "enc":
+                continue
+            dedup = entry.plain_size is not None and is_manifest(self.path(entry.name))
+            total += entry.plain_size if dedup else entry.stored_size
+        return total
+
+    def rotate_keys(self, jobs=DEFAULT_FILE_JOBS, progress=None):
+        # Moves every vault file to the key ring's current key (see
+        # crypto_util.rekey_file; deduplicated files are stored again under
+        # new chunk ids, see ChunkStore.rekey_manifest), `jobs` files at a
+        # time with their chunks spread over the crypto pool. Files stay
+        # readable throughout since each names its own key. Files are done in
+        # name order and the last one finished before any failure is
+        # checkpointed, so an interrupted rotation resumes after it and
+        # retries every failed file; files that already carry the key are
+        # skipped quickly. Yields (name, rewritten, None or the error).
+        key_id = current_key_id()
+        state = self.rotation_checkpoint()
+        after = state[1] if state and state[0] == key_id else ""
+        self._save_checkpoint(key_id, after)  # From here on the rotation counts as unfinished
+        names = [e.name for e in self.entries() if e.type == "enc" and e.name > after]
+
+        def rotate_one(name):
+            path = self.path(name)
+            try:
+                if is_manifest(path):  # A damaged chunk only fails the files that use it
+                    rewritten = self.chunks.rekey_manifest(path, key_id, self.pool, progress)
+                else:
+                    rewritten = rekey_file(path, key_id, pool=self.pool, progress=progress)
+            except FileNotFoundError:
+                return False, None  # Deleted since the listing
+            except _DAMAGE as e:
+                return False, str(e) or type(e).__name__
+            entry = self.index.get(name)
+            if rewritten and entry:  # Same contents: keep the metadata, and the file was just fully checked
+                fresh = self.index.record(name, entry.original_name, entry.plain_size, entry.checksum)
+                self.index.record_check(name, fresh.stored_size, fresh.mtime)
+            return rewritten, None
+
+        jobs = max(1, jobs)
+        failed, finished = False, False
+        saved = time.monotonic()
+        with ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="vault-rotate") as files:
+            pending = deque()
+
+            def finish_oldest():
+                nonlocal after, failed, saved
+                name, future = pending.popleft()
+                rewritten, error = future.result()
+                if error is not None:
+                    failed = True
+                elif not failed:
+                    after = name  # Never past a failed file, or a resumed run would skip it
+                if time.monotonic() - saved >= CHECKPOINT_EVERY_S:
+                    self._save_checkpoint(key_id, after)
+                    saved = time.monotonic()
+                return name, rewritten, error
+
+            try:
+                for name in names:
+                    pending.append((name, files.submit(rotate_one, name)))
+                    if len(pending) >= 2 * jobs:
+                        yield finish_oldest()
+                while pending:
+                    yield finish_oldest()
+                finished = True
+            finally:
+                for _name, future in pending:
+                    future.cancel()
+                if finished and not failed:
+                    os.remove(self.path(ROTATION_CHECKPOINT))
+                else:
+                    self._save_checkpoint(key_id, after)
+
+    def collect_garbage(self):
+        # Deletes deduplicated chunks no file refers to; returns (count, bytes)
+        return self.chunks.collect_garbage()
+
+    def close(self):
+        if self._own_pool:
+            self.pool.shutdown(wait=True)
+        self.chunks.close()
+        self.index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# ================= Command Line =================
+def _open_vault(args):
+    # Opens the vault chosen by --vault or --user (after a password check)
+    if args.vault:
+        return Vault(args.vault, workers=args.workers)
+    if not args.user:
+        raise SystemExit("Choose a vault with --user NAME or --vault DIR")
+    from db import init_db, validate_user, close_all  # Only needed for --user
+    password = os.environ.get(PASSWORD_ENV) or getpass.getpass(f"Password for {args.user}: ")
+    init_db()
+    valid = validate_user(args.user, password)
+    close_all()
+    if not valid:
+        raise SystemExit("Invalid username or password")
+    return Vault(user_folder(args.user), workers=args.workers)
+
+
+def _output(target):
+    # Context manager for an output path, or stdout for "-"
+    if target == "-":
+        return _StdoutTarget()
+    return atomic_output(target)
+
+
+class _StdoutTarget:
+    def __enter__(self):
+        return sys.stdout.buffer
+
+    def __exit__(self, *exc):
+        sys.stdout.buffer.flush()
+
+
+def _report(path, result):
+    # One line per file on stderr; returns True when the file succeeded
+    if isinstance(result, Exception):
+        print(f"FAILED {path}: {result}", file=sys.stderr)
+        return False
+    print(f"{path}: {humanize.naturalsize(result.plain_size)} -> "
+          f"{humanize.naturalsize(result.cipher_size)}", file=sys.stderr)
+    return True
+
+
+def cmd_encrypt(args):
+    if args.output:  # Standalone mode: one input, one encrypted output
+        if len(args.sources) != 1:
+            raise SystemExit("-o takes exactly one source")
+        source = args.sources[0]
+        if source != "-" and args.output != "-":
+            stats = encrypt_file(source, args.output, workers=args.workers)
+        else:
+            src = nullcontext(sys.stdin.buffer) if source == "-" else open(source, "rb")
+            name = None if source == "-" else os.path.basename(source)
+            with src as stream, _output(args.output) as out:
+                stats = encrypt_stream(stream, out, workers=args.workers, name=name)
+        return 0 if _report(source, stats) else 1
+
+    ok = True
+    used = set()  # Vault names given out so far; no two sources may land on the same file
+    with _open_vault(args) as vault:
+        for source in args.sources:
+            if source == "-":
+                raise SystemExit("Reading stdin into a vault needs -o; encrypt to a file instead")
+            if os.path.isdir(source):
+                for path, name, taken, result in vault.encrypt_tree(source, args.jobs, args.dedup, used):
+                    if taken:
+                        print(f"{path}: stored as {name} ({taken} is another file of this run)", file=sys.stderr)
+                    ok = _report(path, result) and ok
+            else:
+                name = unique_name(os.path.basename(source), used)
+                if name != vault_name(os.path.basename(source)):
+                    print(f"{source}: stored as {name} (another file of this run has its name)", file=sys.stderr)
+                try:
+                    result = vault.encrypt(source, name, dedup=args.dedup)[1]
+                except Exception as e:
+                    result = e
+                ok = _report(source, result) and ok
+    return 0 if ok else 1
+
+
+def cmd_decrypt(args):
+    target = args.output
+    if args.source == "-":  # Only chunked (v2) streams can be decrypted from a pipe
+        with _output(target or "-") as out:
+            stats = decrypt_stream(sys.stdin.buffer, out, workers=args.workers)
+        return 0 if _report("-", stats) else 1
+    if args.vault or args.user:
+        with _open_vault(args) as vault:
+            if target == "-":
+                with _output("-") as out:
+                    stats = vault.decrypt_to(args.source, out)
+            else:
+                stats = vault.decrypt(args.source, target)
+        return 0 if _report(args.source, stats) else 1
+    target = target or os.path.basename(args.source[:-4] if args.source.endswith(".enc") else args.source + ".dec")
+    with _output(target) as out:
+        stats = decrypt_to(args.source, out, workers=args.workers)
+    return 0 if _report(args.source, stats) else 1
+
+
+def cmd_list(args):
+    with _open_vault(args) as vault:
+        for entry in vault.entries():
+            plain = humanize.naturalsize(entry.plain_size) if entry.plain_size is not None else "?"
+            print(f"{entry.name}\t{plain}\t{humanize.naturalsize(entry.stored_size)}\t{entry.original_name or ''}")
+    return 0
+
+
+def cmd_verify(args):
+    ok = True
+    with _open_vault(args) as vault:
+        names = args.names or [e.name for e in vault.entries() if e.type == "enc"]
+
+        def check(name):
+            try:
+                return vault.verify(name)
+            except Exception as e:
+                return e
+
+        with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as files:
+            for name, result in zip(names, files.map(check, names)):
+                if isinstance(result, Exception):
+                    print(f"FAILED {name}: {result}", file=sys.stderr)
+                    ok = False
+                else:
+                    print(f"ok {name}", file=sys.stderr)
+    return 0 if ok else 1
+
+
+def cmd_scrub(args):
+    deadline = time.time() + args.hours * 3600 if args.hours else None
+    with _open_vault(args) as vault:
+        due = vault.due_checks(args.max_age_days * 24 * 3600)
+        total = sum(entry.stored_size for entry in due)
+        print(f"{len(due)} files due ({humanize.naturalsize(total)})", file=sys.stderr)
+        checked = 0
+        for name, error in vault.scrub(due, args.jobs, deadline):
+            checked += 1
+            if error:
+                print(f"CORRUPT {name}: {error}", file=sys.stderr)
+        failed = vault.failed_checks()
+    if checked < len(due):
+        print(f"Stopped at the deadline; {len(due) - checked} files left for the next run", file=sys.stderr)
+    for state in failed:
+        print(f"{state.name}\t{state.error}")
+    return 1 if failed else 0
+
+
+def cmd_rotate(args):
+    with _open_vault(args) as vault:
+        if args.new_key:
+            if vault.rotation_checkpoint():
+                raise SystemExit("A rotation is unfinished; run rotate without --new-key to resume it first")
+            print(f"Created key {new_master_key()}", file=sys.stderr)
+        rewritten = failed = 0
+        for name, changed, error in vault.rotate_keys(args.jobs):
+            rewritten += changed
+            if error:
+                failed += 1
+                print(f"FAILED {name}: {error}", file=sys.stderr)
+    print(f"{rewritten} files moved to key {current_key_id()}, {failed} failed", file=sys.stderr)
+    return 1 if failed else 0
+
+
+def cmd_export(args):
+    from export import archive_format, export_archive, export_folder  # Only needed here
+    with _open_vault(args) as vault:
+        names = args.names or [e.name for e in vault.entries()]
+        if archive_format(args.output):
+            for name, member in export_archive(vault, names, args.output):
+                print(f"{name} -> {member}", file=sys.stderr)
+            return 0
+        ok = True
+        for name, dest, error in export_folder(vault, names, args.output, args.jobs):
+            if error:
+                print(f"FAILED {name}: {error}", file=sys.stderr)
+                ok = False
+            else:
+                print(f"{name} -> {dest}", file=sys.stderr)
+    return 0 if ok else 1
+
+
+def cmd_gc(args):
+    with _open_vault(args) as vault:
+        removed, freed = vault.collect_garbage()
+    print(f"Removed {removed} unused chunks ({humanize.naturalsize(freed)})", file=sys.stderr)
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m vault", description="Secure Desktop Vault without the GUI")
+    parser.add_argument("--vault", metavar="DIR", help="vault folder to use")
+    parser.add_argument("--user", metavar="NAME", help=f"use vault/NAME (password from ${PASSWORD_ENV} or a prompt)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="threads encrypting chunks of one file")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    encrypt = commands.add_parser("encrypt", help="encrypt files, folders or stdin")
+    encrypt.add_argument("sources", nargs="+", metavar="SOURCE", help="file, folder, or - for stdin")
+    encrypt.add_argument("-o", "--output", help="write one standalone encrypted file here (- for stdout)")
+    encrypt.add_argument("--jobs", type=int, default=DEFAULT_FILE_JOBS, help="files encrypted in parallel")
+    encrypt.add_argument("--dedup", action="store_true", help="store as deduplicated chunks")
+    encrypt.set_defaults(func=cmd_encrypt)
+
+    decrypt = commands.add_parser("decrypt", help="decrypt a vault file, an .enc path or stdin")
+    decrypt.add_argument("source", metavar="SOURCE", help="vault file name (with --vault/--user), path, or -")
+    decrypt.add_argument("-o", "--output", help="output path (- for stdout)")
+    decrypt.set_defaults(func=cmd_decrypt)
+
+    listing = commands.add_parser("list", help="list the files in a vault")
+    listing.set_defaults(func=cmd_list)
+
+    verify = commands.add_parser("verify", help="check that vault files decrypt and match their checksums")
+    verify.add_argument("names", nargs="*", metavar="NAME", help="files to check (default: all)")
+    verify.add_argument("--jobs", type=int, default=DEFAULT_FILE_JOBS, help="files verified in parallel")
+    verify.set_defaults(func=cmd_verify)
+
+    scrub = commands.add_parser("scrub", help="incrementally check vault files for corruption")
+    scrub.add_argument("--jobs", type=int, default=DEFAULT_FILE_JOBS, help="files checked in parallel")
+    scrub.add_argument("--max-age-days", type=float, default=RECHECK_AFTER_S / 86400,
+                       help="re-check unchanged files last checked longer ago than this")
+    scrub.add_argument("--hours", type=float, help="stop starting new files after this long")
+    scrub.set_defaults(func=cmd_scrub)
+
+    rotate = commands.add_parser("rotate", help="re-encrypt the vault under the current (or a new) key")
+    rotate.add_argument("--new-key", action="store_true", help="add a new key to the key ring first")
+    rotate.add_argument("--jobs", type=int, default=DEFAULT_FILE_JOBS, help="files re-encrypted in parallel")
+    rotate.set_defaults(func=cmd_rotate)
+
+    export = commands.add_parser("export", help="decrypt vault files into a folder or one archive")
+    export.add_argument("names", nargs="*", metavar="NAME", help="files to export (default: all)")
+    export.add_argument("-o", "--output", required=True,
+                        help="target folder, or an archive path ending in .zip, .tar, .tar.gz or .tgz")
+    export.add_argument("--jobs", type=int, default=DEFAULT_FILE_JOBS, help="files decrypted in parallel (folder)")
+    export.set_defaults(func=cmd_export)
+
+    gc = commands.add_parser("gc", help="delete deduplicated chunks no file uses")
+    gc.set_defaults(func=cmd_gc)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        return args.func(args)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+# === virtual_table.py - Treeview that only materializes the visible rows ===
+
+import tkinter as tk  # Frame and event constants
+from tkinter import ttk  # Treeview and Scrollbar
+
+import metrics  # Optional timing of row rebuilds
+
+
+class VirtualTable:
+    # Shows a list of keys (file names) in a ttk.Treeview without creating one
+    # Treeview item per key. Only about one screen of "slot" rows exists; when
+    # the view scrolls, the slots are re-filled through `render_row(key)`,
+    # which returns (text, values, image). Setting a new item list (search,
+    # sort, refresh) therefore costs the same for 200 files or 200k.
+
+    def __init__(self, master, columns, render_row, rowheight=25):
+        self.frame = tk.Frame(master)
+        self.tree = ttk.Treeview(self.frame, columns=columns, height=1, selectmode="extended")
+        self.scrollbar = ttk.Scrollbar(self.frame, orient=tk.VERTICAL, command=self._on_scrollbar)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        self.render_row = render_row
+        self.rowheight = rowheight
+        self.items = []  # Every key in display order
+        self.top = 0  # Index in `items` of the first visible row
+        self.selected = set()  # Selected keys, including ones scrolled out of view
+        self._slots = []  # Treeview iids currently materialized
+        self._window = []  # Keys shown in those slots
+        self._extend = False  # Whether the last click or key press added to the selection
+        self._user = False  # Whether the next selection event comes from a click or key press
+
+        self.tree.bind("<Configure>", lambda e: self.refresh())
+        self.tree.bind("<<TreeviewSelect>>", self._on_select)
+        self.tree.bind("<ButtonPress-1>", self._on_input, add="+")
+        self.tree.bind("<KeyPress>", self._on_input, add="+")
+        self.tree.bind("<MouseWheel>", lambda e: self.scroll(-1 if e.delta > 0 else 1, "units"))
+        self.tree.bind("<Button-4>", lambda e: self.scroll(-1, "units"))  # X11 wheel up
+        self.tree.bind("<Button-5>", lambda e: self.scroll(1, "units"))  # X11 wheel down
+        self.tree.bind("<Prior>", lambda e: self.scroll(-1, "pages"))
+        self.tree.bind("<Next>", lambda e: self.scroll(1, "pages"))
+
+    # ===== Treeview Pass-Throughs =====
+    def pack(self, **options):
+        self.frame.pack(**options)
+
+    def heading(self, column, **options):
+        return self.tree.heading(column, **options)
+
+    def column(self, column, **options):
+        return self.tree.column(column, **options)
+
+    # ===== Content =====
+    @metrics.timed("table.set_items")
+    def set_items(self, items):
+        # Replaces the displayed keys (already filtered and sorted)
+        self.items = items
+        if self.selected:
+            self.selected &= set(items)  # Forget selections that are no longer listed
+        self.top = max(0, min(self.top, len(items) - self.page_size()))
+        self.refresh()
+
+    def selected_keys(self):
+        # Selected keys in display order (what the old code got from selection())
+        if not self.selected:
+            return []
+        return [key for key in self.items if key in self.selected]
+
+    def page_size(self):
+        # Rows that fit on screen (one row height is taken by the heading)
+        height = self.tree.winfo_height()
+        return max(1, height // self.rowheight - 1)
+
+    @metrics.timed("table.refresh")
+    def refresh(self):
+        # Re-fills the slot rows from `items` starting at `top`
+        window = self.items[self.top:self.top + self.page_size()]
+        while len(self._slots) < len(window):
+            self._slots.append(self.tree.insert("", "end", text=""))
+        while len(self._slots) > len(window):
+            self.tree.delete(self._slots.pop())
+
+        for iid, key in zip(self._slots, window):
+            text, values, image = self.render_row(key)
+            self.tree.item(iid, text=text, values=values, image=image or "")
+        self._window = window
+        self._user = False  # The selection event below only mirrors `selected`
+        self.tree.selection_set([iid for iid, key in zip(self._slots, window) if key in self.selected])
+
+        total = len(self.items)
+        if total:
+            self.scrollbar.set(self.top / total, min(1.0, (self.top + len(window)) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    # ===== Scrolling =====
+    def scroll(self, amount, what):
+        step = self.page_size() if what == "pages" else 1
+        self._scroll_to(self.top + int(amount) * step)
+        return "break"
+
+    def _scroll_to(self, top):
+        top = max(0, min(top, len(self.items) - self.page_size()))
+        if top != self.top:
+            self.top = top
+            self.refresh()
+
+    def _on_scrollbar(self, action, *args):
+        if action == "moveto":
+            self._scroll_to(int(float(args[0]) * len(self.items)))
+        elif action == "scroll":
+            self.scroll(args[0], args[1])
+
+    # ===== Selection =====
+    def _on_input(self, event):
+        # Shift/Control clicks and keys extend the selection; plain ones
+        # (arrow keys included) replace it, dropping rows scrolled out of view
+        self._extend = bool(event.state & 0x0005)
+        self._user = True
+
+    def _on_select(self, event):
+        if not self._user:
+            return  # Sent for refresh() restoring the selection on the visible rows
+        self._user = False
+        chosen = set(self.tree.selection())
+        if not self._extend:
+            self.selected = set()
+        for iid, key in zip(self._slots, self._window):
+            if iid in chosen:
+                self.selected.add(key)
+            else:
+                self.selected.discard(key)